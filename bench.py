@@ -0,0 +1,1445 @@
+"""
+Benchmarks for the Buckshot Roulette bot.
+
+    python bench.py state [--games N]
+    python bench.py db [--games N] [--path FILE]
+    python bench.py snapshot [--games N]
+    python bench.py eventlog [--history N] [--games N]
+    python bench.py stats [--players N] [--chats N] [--results N]
+    python bench.py render [--seconds S]
+    python bench.py dealer
+    python bench.py handlers [--games N] [--fast] [--out FILE]
+    python bench.py shards [--workers 1 2 4] [--players N] [--taps N]
+    python bench.py http [--servers flask asyncio] [--requests N]
+    python bench.py pool [--sizes 1 4 16 64] [--calls N] [--latency S]
+    python bench.py check
+
+Run from the repo root; BOT_TOKEN does not need to be set.
+"""
+import argparse
+import asyncio
+import base64
+import gc
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import struct
+import subprocess
+import sys
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+
+import engine
+import eventlog
+import main
+
+
+def legacy_game(key: str, group: bool) -> dict:
+    """A game laid out the way it used to be stored (plain dicts)"""
+    user_id = int(key)
+    shells, live, blank = ''.join(['L', 'B', 'B', 'L', 'L', 'B']), 3, 3
+    game = {
+        'status': 'playing',
+        'p1_hp': 3,
+        'p2_hp': 3,
+        'shells': shells,
+        'shell_idx': 0,
+        'live': live,
+        'blank': blank,
+        'turn': 1,
+        'message_id': 1000 + user_id
+    }
+    if group:
+        players = [
+            {'id': user_id, 'username': f"user{user_id}", 'name': "Player1"},
+            {'id': user_id + 1, 'username': None, 'name': f"Name{user_id}"},
+        ]
+        game.update(players=players, p1=dict(players[0]), p2=dict(players[1]), chat_id=str(-user_id))
+    return game
+
+
+def compact_game(key: str, group: bool) -> main.Game:
+    user_id = int(key)
+    if not group:
+        return main.Game(key, 1000 + user_id)
+    p1 = main.Player(user_id, f"user{user_id}", "Player1")
+    p2 = main.Player(user_id + 1, None, f"Name{user_id}")
+    return main.Game(str(-user_id), 1000 + user_id, game_id=f"g{user_id}", p1=p1, p2=p2)
+
+
+def bytes_per_game(factory, n: int, group: bool) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    games = {}
+    for i in range(n):
+        key = str(i * 2 + 1_000_000_000)
+        games[key] = factory(key, group)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del games
+    return (after - before) / n
+
+
+def renders_per_second(game: main.Game, is_group: bool, seconds: float = 1.0) -> float:
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(1000):
+            main.get_game_display(game, is_group)
+        count += 1000
+    return count / (time.perf_counter() - start)
+
+
+def bench_state(args):
+    n = args.games
+    print(f"games per run: {n}")
+    for group in (False, True):
+        kind = "group" if group else "private"
+        legacy = bytes_per_game(legacy_game, n, group)
+        compact = bytes_per_game(compact_game, n, group)
+        print(f"{kind:8} bytes/game  dict: {legacy:7.0f}  slots: {compact:7.0f}  ({legacy / compact:.1f}x)")
+
+    for group in (False, True):
+        kind = "group" if group else "private"
+        rate = renders_per_second(compact_game("7", group), group)
+        print(f"{kind:8} renders/s   {rate:,.0f}")
+
+
+def calls_per_second(render, states: list, seconds: float) -> float:
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for state in states:
+            render(*state)
+        count += len(states)
+    return count / (time.perf_counter() - start)
+
+
+def bench_render(args):
+    # Every reachable board: both players' HP, shells left, live/blank split, whose turn
+    boards = []
+    for group in (False, True):
+        for p1_hp, p2_hp, live, blank, turn in itertools.product(range(4), range(4), range(5), range(5), (1, 2)):
+            game = compact_game("7", group)
+            game.p1_hp, game.p2_hp, game.live, game.blank, game.turn = p1_hp, p2_hp, live, blank, turn
+            game.mag_len, game.shell_idx = live + blank, 0
+            boards.append((game, group))
+    reloads = [(live, blank) for live in range(1, 5) for blank in range(1, 5)]
+    cached = {name: getattr(main, name) for name in ("board_segments", "get_hp_display", "get_reload_msg")}
+
+    rows = [
+        ("board", main.get_game_display, boards),
+        ("reload", lambda live, blank: main.get_reload_msg(live, blank), reloads),
+    ]
+    print(f"{len(boards)} board states, cache size {main.RENDER_CACHE_SIZE}")
+    for name, render, states in rows:
+        # Before: the cached builders with their caches bypassed
+        for attr, func in cached.items():
+            setattr(main, attr, func.__wrapped__)
+        cold = calls_per_second(render, states, args.seconds)
+        for attr, func in cached.items():
+            setattr(main, attr, func)
+        warm = calls_per_second(render, states, args.seconds)
+        print(f"{name:8} uncached {cold:12,.0f}/s   cached {warm:12,.0f}/s   ({warm / cold:.1f}x)")
+
+
+def bench_dealer(args):
+    solves = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        engine.PolicyTable.solve()
+        solves.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    table = engine.PolicyTable.solve()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"solve    {min(solves) * 1000:7.2f}ms  ({table.size} states, table {table.nbytes} bytes, "
+          f"{memory} bytes allocated)")
+
+    path = os.path.join(tempfile.mkdtemp(), "dealer.table")
+    table.save(path)
+    start = time.perf_counter()
+    engine.PolicyTable.load(path)
+    print(f"load     {(time.perf_counter() - start) * 1000:7.2f}ms  ({os.path.getsize(path)} bytes on disk)")
+
+    main.policy_table = table
+    game = compact_game("7", False)
+    rate = calls_per_second(main.dealer_target, [(game,)], 1.0)
+    print(f"decide   {rate:12,.0f}/s")
+
+
+def bench_db(args):
+    n = args.games
+    path = args.path or os.path.join(tempfile.mkdtemp(), "bench.db")
+    db = main.GameDB(path)
+    print(f"games: {n}  db: {path}")
+
+    # 4 private games for every group game, all mid-match
+    games = [compact_game(str(1_000_000_000 + i), i % 5 == 0) for i in range(n)]
+    for game in games:
+        game.status = 'playing'
+        db.dirty[game.key] = game
+
+    start = time.perf_counter()
+    upserts, deletes = db.collect()
+    collected = time.perf_counter()
+    for i in range(0, len(upserts), args.batch):
+        db.write(upserts[i:i + args.batch], [])
+    written = time.perf_counter()
+    print(f"flush    collect {collected - start:6.2f}s  write {written - collected:6.2f}s  "
+          f"{n / (written - start):,.0f} games/s  (batches of {args.batch})")
+    db.close()
+    del games, upserts
+
+    async def recover():
+        main.private_games.games.clear()
+        main.group_games.clear()
+        main.chat_games.clear()
+        start = time.perf_counter()
+        loader = main.GameDB(path)
+        rows = loader.load()
+        loaded = time.perf_counter()
+        main.restore_games(rows)
+        restored = time.perf_counter()
+        print(f"recover  load {loaded - start:6.2f}s  rebuild {restored - loaded:6.2f}s  "
+              f"total {restored - start:6.2f}s  ({len(rows):,} games)")
+        loader.close()
+
+    asyncio.run(recover())
+    print(f"db size  {os.path.getsize(path) / 1e6:.1f} MB")
+
+
+def bench_snapshot(args):
+    n = args.games
+    path = os.path.join(tempfile.mkdtemp(), "buckshot.snapshot")
+    print(f"games: {n}  snapshot: {path}")
+
+    async def handoff():
+        main.edit_scheduler = main.EditScheduler(FakeBot())
+        games = [compact_game(str(1_000_000_000 + i), i % 5 == 0) for i in range(n)]
+        for game in games:
+            game.status = 'playing'
+            if game.game_id is None:
+                main.private_games[game.chat_id] = game
+            else:
+                main.group_games[game.game_id] = game
+        # One move in a hundred cut off mid-animation
+        cut = {game.key for game in games[::100]}
+
+        start = time.perf_counter()
+        saved = await main.save_snapshot(path, cut)
+        written = time.perf_counter()
+        print(f"save     {(written - start) * 1000:7.0f}ms  ({saved:,} games, {os.path.getsize(path) / 1e6:.1f} MB)")
+
+        main.private_games.games.clear()
+        main.group_games.clear()
+        main.chat_games.clear()
+        del games
+        gc.collect()
+
+        start = time.perf_counter()
+        rows, stale = main.read_snapshot(path)
+        read = time.perf_counter()
+        restored = main.restore_games(rows)
+        rebuilt = time.perf_counter()
+        repainted = main.repaint_games(stale)
+        queued = time.perf_counter()
+        print(f"restore  read {(read - start) * 1000:7.0f}ms  rebuild {(rebuilt - read) * 1000:7.0f}ms  "
+              f"repaint {(queued - rebuilt) * 1000:5.0f}ms  total {(queued - start) * 1000:7.0f}ms  "
+              f"({restored:,} games, {repainted:,} repaints queued)")
+        await main.edit_scheduler.close()
+
+    asyncio.run(handoff())
+
+
+def bench_eventlog(args):
+    folder = tempfile.mkdtemp()
+    log_path = os.path.join(folder, "events.log")
+    db_path = os.path.join(folder, "games.db")
+    main.game_db = None
+    random.seed(args.seed)
+
+    def play_game(user_id: int, shots: int) -> main.Game:
+        game = main.Game(str(user_id), 1)
+        for _ in range(shots):
+            game.shoot(random.random() < 0.5)
+            if game.p1_hp <= 0 or game.p2_hp <= 0:
+                main.finish_game(game)
+                break
+            if game.remaining <= 0:
+                game.reload()
+        return game
+
+    async def play(games: int, shots: int, user_base: int) -> tuple:
+        main.event_log = eventlog.EventLog(log_path)
+        start = time.perf_counter()
+        played = [play_game(user_base + i, random.randint(0, shots)) for i in range(games)]
+        elapsed = time.perf_counter() - start
+        records = main.event_log.stats['records']
+        await main.event_log.close()
+        main.event_log = None
+        return played, records, elapsed
+
+    async def stall(games: list) -> int:
+        # One more shot each, between moves, after their rows were written
+        main.event_log = eventlog.EventLog(log_path)
+        for game in games:
+            if min(game.p1_hp, game.p2_hp) > 1 and game.remaining > 1:
+                game.shoot(random.random() < 0.5)
+        records = main.event_log.stats['records']
+        await main.event_log.close()
+        main.event_log = None
+        return records
+
+    async def checkpoint(games: list) -> tuple:
+        main.event_log = eventlog.EventLog(log_path)
+        start = time.perf_counter()
+        logged = await main.checkpoint_games(games)
+        elapsed = time.perf_counter() - start
+        await main.event_log.close()
+        main.event_log = None
+        return logged, elapsed
+
+    def write_rows(games: list):
+        db = main.GameDB(db_path)
+        for game in games:
+            db.dirty[game.key] = game
+        db.write(*db.collect())
+        db.close()
+
+    # A day of finished games, then an hour of play still running when the bot stopped.
+    # Every live game's row is written, but the last move of one in a hundred of the
+    # first half never reached the database (a failing flush) and they have been quiet
+    # since: the checkpoint round logs those again
+    _, history, elapsed = asyncio.run(play(args.history, 1000, 2_000_000_000))
+    played, recent, _ = asyncio.run(play(args.games // 2, 4, 1_000_000_000))
+    live = [game for game in played if game.status == 'playing']
+    write_rows(live)
+    unflushed = live[::100]
+    recent += asyncio.run(stall(unflushed))
+    played, later, _ = asyncio.run(play(args.games - args.games // 2, 4, 1_000_000_000 + args.games))
+    write_rows(played)
+    live += [game for game in played if game.status == 'playing']
+    recent += later
+    checkpoints, checkpoint_time = asyncio.run(checkpoint(unflushed))
+
+    now = int(time.time())
+    round_start = now - int(main.EVENT_LOG_TAIL / 3)
+    with open(log_path, 'r+b') as f:
+        data = bytearray(f.read())
+        for i in range(history + recent + checkpoints):
+            record = list(eventlog.RECORD.unpack_from(data, i * eventlog.RECORD.size))
+            if i < history:
+                record[2] = now - 86_400 + 82_800 * i // history
+            elif i < history + recent:
+                record[2] = now - 3_600 + (3_600 - int(main.EVENT_LOG_TAIL)) * (i - history) // recent
+            else:
+                record[2] = round_start + (now - round_start) * (i - history - recent) // checkpoints
+            eventlog.RECORD.pack_into(data, i * eventlog.RECORD.size, *record)
+        f.seek(0)
+        f.write(data)
+
+    print(f"events {history + recent:,} ({recent:,} recent)  log {os.path.getsize(log_path) / 1e6:.1f} MB  "
+          f"live games {len(live):,}")
+    print(f"play     {elapsed / history * 1e6:6.2f} µs per event, logging included")
+    print(f"checkpoint {checkpoint_time * 1000:6.1f}ms, {checkpoints:,} records ({checkpoints * eventlog.RECORD.size:,} B) "
+          f"for {len(unflushed):,} unwritten rows")
+
+    for label, tail in (("full log", None), (f"{main.EVENT_LOG_TAIL:.0f}s tail", main.EVENT_LOG_TAIL)):
+        start = time.perf_counter()
+        logged = eventlog.last_states(eventlog.read_tail(log_path, tail))
+        print(f"read     {label:10} {time.perf_counter() - start:6.2f}s  ({len(logged):,} games in range)")
+
+    # Startup: the rows, moved on by the tail as restore_games() does
+    start = time.perf_counter()
+    db = main.GameDB(db_path)
+    gc.disable()
+    games = [main.game_from_row(row) for row in db.load()]
+    gc.enable()
+    loaded = time.perf_counter()
+    for game in games:
+        state = logged.get(game.key)
+        if state is not None:
+            main.catch_up(game, state)
+    print(f"recover  rows {loaded - start:6.2f}s  + tail catch-up {time.perf_counter() - loaded:6.2f}s  "
+          f"({len(games):,} games)")
+    db.close()
+
+    expected = {game.key: main.GameDB.row(game.key, game) for game in live}
+    assert {game.key: main.GameDB.row(game.key, game) for game in games} == expected, \
+        "rows and the tail do not rebuild every live game"
+
+
+def bench_stats(args):
+    rng = random.Random(args.seed)
+    players = [main.Player(user_id, f"user{user_id}", None) for user_id in range(1, args.players + 1)]
+    chats = [str(-1_000_000_000_000 - i) for i in range(args.chats)]
+    matches = [(rng.choice(chats), *rng.sample(players, 2)) for _ in range(args.results)]
+    print(f"players: {args.players:,}  chats: {args.chats:,}  group results: {args.results:,}")
+
+    store = main.player_stats = main.StatsStore(main.LEADERBOARD_SIZE)
+    start = time.perf_counter()
+    for chat_id, winner, loser in matches:
+        store.record_match(chat_id, winner, loser)
+    elapsed = time.perf_counter() - start
+    changed = sum(board.version for board in store.boards.values())
+    print(f"record   {elapsed / len(matches) * 1e6:6.2f}µs per result (4 scores, 4 board checks), "
+          f"boards changed by {changed / (4 * len(matches)):.0%} of updates")
+
+    # /top the way it worked before: rank everyone in the scope on each call
+    scores = store.scopes[main.GLOBAL_SCOPE]
+    start = time.perf_counter()
+    for _ in range(args.tops):
+        ranked = sorted(scores.items(), key=lambda item: (-item[1].wins, item[0]))[:main.LEADERBOARD_SIZE]
+    sorted_cost = (time.perf_counter() - start) / args.tops
+    board = store.board(main.GLOBAL_SCOPE)
+    assert [user_id for user_id, _ in ranked] == [user_id for _, user_id in board.entries]
+
+    main.get_leaderboard_msg.cache_clear()
+    start = time.perf_counter()
+    for version in range(args.tops):
+        main.get_leaderboard_msg(main.GLOBAL_SCOPE, -1 - version)
+    render_cost = (time.perf_counter() - start) / args.tops
+    start = time.perf_counter()
+    for _ in range(args.tops):
+        main.get_leaderboard_msg(main.GLOBAL_SCOPE, board.version)
+    cached_cost = (time.perf_counter() - start) / args.tops
+    print(f"/top     sort all {sorted_cost * 1e6:8.1f}µs  board render {render_cost * 1e6:6.1f}µs  "
+          f"cached {cached_cost * 1e6:5.2f}µs  (global, {len(scores):,} players)")
+
+    rows = [
+        (scope, user_id, stats.name, stats.wins, stats.losses, stats.streak, stats.best_streak)
+        for scope, scores in store.scopes.items() for user_id, stats in scores.items()
+    ]
+    start = time.perf_counter()
+    main.StatsStore(main.LEADERBOARD_SIZE).load(rows)
+    print(f"load     {time.perf_counter() - start:6.2f}s  ({len(rows):,} rows, {len(store.boards):,} boards)")
+
+
+class FakeBot:
+    """Stands in for telegram.Bot: answers every API call instantly and counts what was sent"""
+
+    def __init__(self):
+        self.calls = 0
+        self.edits = 0
+        self.answers = 0
+        self.bytes = 0
+        self.next_id = 1
+        self.defaults = None
+
+    def record(self, text, reply_markup):
+        self.calls += 1
+        if text:
+            self.bytes += len(text.encode())
+        if reply_markup is not None:
+            self.bytes += len(reply_markup.to_json())
+
+    async def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        self.record(text, reply_markup)
+        self.next_id += 1
+        return FakeMessage(self.next_id, FakeChat(int(chat_id)), self)
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, reply_markup=None, **kwargs):
+        self.record(text, reply_markup)
+        self.edits += 1
+        return True
+
+    async def answer_callback_query(self, callback_query_id, text=None, **kwargs):
+        self.record(text, None)
+        self.answers += 1
+        return True
+
+
+# Just enough of telegram's Update, Message and CallbackQuery for the handlers
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.username = f"user{user_id}"
+        self.first_name = f"P{user_id}"
+
+
+class FakeChat:
+    def __init__(self, chat_id: int):
+        self.id = chat_id
+        self.type = "private" if chat_id > 0 else "group"
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, chat: FakeChat, bot: FakeBot):
+        self.message_id = message_id
+        self.chat = chat
+        self.bot = bot
+
+    async def reply_text(self, text, reply_markup=None, **kwargs):
+        return await self.bot.send_message(self.chat.id, text, reply_markup=reply_markup)
+
+
+class FakeCallbackQuery:
+    def __init__(self, data: str, user: FakeUser, message: FakeMessage):
+        self.id = str(id(self))
+        self.data = data
+        self.from_user = user
+        self.message = message
+
+    async def answer(self, text=None, show_alert=False, **kwargs):
+        return await self.message.bot.answer_callback_query(self.id, text=text, show_alert=show_alert)
+
+
+class FakeUpdate:
+    def __init__(self, user: FakeUser, chat: FakeChat, message: FakeMessage = None, query: FakeCallbackQuery = None):
+        self.effective_user = user
+        self.effective_chat = chat
+        self.message = message
+        self.callback_query = query
+
+
+def player_updates(user_id: int, taps: int):
+    """Raw updates for one player: /buckshotpv then a run of shot button taps"""
+    sender = {'id': user_id, 'is_bot': False, 'first_name': f"P{user_id}"}
+    chat = {'id': user_id, 'type': 'private'}
+    yield {
+        'update_id': user_id,
+        'message': {
+            'message_id': 1, 'date': 0, 'chat': chat, 'from': sender, 'text': '/buckshotpv',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 11}],
+        },
+    }
+    for tap in range(taps):
+        op = main.OP_PV_DEALER if tap % 2 else main.OP_PV_SELF
+        yield {
+            'update_id': user_id,
+            'callback_query': {
+                'id': f"{user_id}:{tap}", 'chat_instance': 'bench', 'from': sender,
+                'data': main.encode_callback(op, str(user_id)),
+                'message': {'message_id': 2, 'date': 0, 'chat': chat},
+            },
+        }
+
+
+def shard_worker(index: int, count: int, inbox, start, results):
+    """One worker process: handle its shard's updates and report the time it took"""
+    from telegram import Update
+
+    main.WORKER_INDEX, main.WORKER_COUNT = index, count
+    main.ANIMATION_SPEED = 0
+    main.PRIVATE_EDIT_RATE = main.GROUP_EDIT_RATE = main.CHAT_EDIT_BURST = 1e9
+    bot = FakeBot()
+    updates = inbox.get()
+
+    async def run():
+        main.edit_scheduler = main.EditScheduler(bot, global_rate=1e9)
+        start.wait()
+        began = time.perf_counter()
+        for data in updates:
+            update = Update.de_json(data, bot)
+            if update.callback_query is not None:
+                await main.callback_handler(update, None)
+            else:
+                await main.buckshotpv_cmd(update, None)
+            await asyncio.sleep(0)
+        while any(actor.busy for actor in main.game_actors.values()):
+            await asyncio.sleep(0.001)
+        results.put((index, len(updates), time.perf_counter() - began, bot.calls))
+        await main.edit_scheduler.close()
+
+    asyncio.run(run())
+
+
+def bench_shards(args):
+    context = multiprocessing.get_context("spawn")
+    players = [1_000_000 + i for i in range(args.players)]
+    print(f"players: {args.players}  taps each: {args.taps}  cpus: {os.cpu_count()}")
+
+    base = None
+    for count in args.workers:
+        # Route exactly as the front process does
+        shards = [[] for _ in range(count)]
+        for user_id in players:
+            for data in player_updates(user_id, args.taps):
+                shards[main.shard_of(main.route_key(data), count)].append(data)
+
+        start = context.Event()
+        results = context.Queue()
+        inboxes = [context.Queue() for _ in range(count)]
+        workers = [
+            context.Process(target=shard_worker, args=(i, count, inboxes[i], start, results))
+            for i in range(count)
+        ]
+        for worker, inbox, updates in zip(workers, inboxes, shards):
+            worker.start()
+            inbox.put(updates)
+        time.sleep(1)
+        start.set()
+
+        done = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        handled = sum(n for _, n, _, _ in done)
+        wall = max(elapsed for _, _, elapsed, _ in done)
+        rate = handled / wall
+        base = base or rate / count
+        spread = ' '.join(f"{n}" for _, n, _, _ in sorted(done))
+        print(f"workers {count:2}  {rate:10,.0f} updates/s  ({rate / base / count:.0%} of linear)  "
+              f"per shard: {spread}")
+
+
+class HandlerRun:
+    """Plays whole games through the real handlers, timing each step in CPU time"""
+
+    def __init__(self, bot: FakeBot, fast: bool = False):
+        self.bot = bot
+        self.fast = fast
+        self.handler_ns = []    # callback_handler / command handler
+        self.actor_ns = []      # the game work each tap queues (shot, dealer turn, frames)
+        self.shots = 0
+
+    async def settle(self, key: str):
+        scheduler = main.edit_scheduler
+        while main.actor_busy(key) or scheduler.pending or scheduler.inflight:
+            await asyncio.sleep(0)
+
+    async def step(self, handler, update, key: str):
+        start = time.thread_time_ns()
+        await handler(update, None)
+        handled = time.thread_time_ns()
+        await self.settle(key)
+        self.handler_ns.append(handled - start)
+        self.actor_ns.append(time.thread_time_ns() - handled)
+
+    async def private_game(self, user_id: int, taps: int = None):
+        """Play a private game to the end, or only its first `taps` shots"""
+        user, chat = FakeUser(user_id), FakeChat(user_id)
+        message = FakeMessage(1, chat, self.bot)
+        key = f"pv:{user_id}"
+        if self.fast:
+            main.fast_chats.add(str(user_id))
+        await self.step(main.buckshotpv_cmd, FakeUpdate(user, chat, message), key)
+
+        game = main.private_games[str(user_id)]
+        for _ in itertools.repeat(None) if taps is None else range(taps):
+            if game.status != 'playing':
+                break
+            op = random.choice((main.OP_PV_DEALER, main.OP_PV_SELF))
+            query = FakeCallbackQuery(main.encode_callback(op, str(user_id)), user, message)
+            await self.step(main.callback_handler, FakeUpdate(user, chat, query=query), key)
+            self.shots += 1
+
+    async def group_game(self, chat_id: int):
+        chat = FakeChat(chat_id)
+        host, guest = FakeUser(-chat_id), FakeUser(-chat_id + 1)
+        message = FakeMessage(1, chat, self.bot)
+        if self.fast:
+            main.fast_chats.add(str(chat_id))
+        await self.step(main.buckshot_cmd, FakeUpdate(host, chat, message), "")
+
+        game_id = next(iter(main.chat_games[str(chat_id)]))
+        game, key = main.group_games[game_id], f"gp:{game_id}"
+        query = FakeCallbackQuery(main.encode_callback(main.OP_JOIN, game_id), guest, message)
+        await self.step(main.callback_handler, FakeUpdate(guest, chat, query=query), key)
+
+        while game.status == 'playing':
+            user = host if game.turn == 1 else guest
+            op = random.choice((main.OP_GP_OPP, main.OP_GP_SELF))
+            query = FakeCallbackQuery(main.encode_callback(op, game_id), user, message)
+            await self.step(main.callback_handler, FakeUpdate(user, chat, query=query), key)
+            self.shots += 1
+
+
+def percentile_us(samples: list, fraction: float) -> float:
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] / 1000, 1)
+
+
+def bench_handlers(args):
+    main.ANIMATION_SPEED = 0
+    main.PRIVATE_EDIT_RATE = main.GROUP_EDIT_RATE = main.CHAT_EDIT_BURST = 1e9
+    main.game_db = None
+    random.seed(args.seed)
+
+    # Animation time a player would sit through, at ANIMATION_SPEED=1. A real
+    # pause outlasts the edit before it, so frames aren't merged away here either
+    scripted = [0.0]
+
+    async def pause(seconds: float):
+        scripted[0] += seconds
+        scheduler = main.edit_scheduler
+        while scheduler.pending or scheduler.inflight:
+            await asyncio.sleep(0)
+    main.pause = pause
+
+    async def run():
+        results = {}
+        main.get_policy_table()
+        for kind in ("private", "group"):
+            bot = FakeBot()
+            main.edit_scheduler = main.EditScheduler(bot, global_rate=1e9)
+            games = [1_000_000 + i for i in range(args.games)]
+            play = HandlerRun.private_game if kind == "private" else HandlerRun.group_game
+            run = HandlerRun(bot, args.fast)
+            scripted[0] = 0.0
+            for game in games:
+                await play(run, game if kind == "private" else -game)
+            # Counted before the memory pass below plays more games on the same bot
+            calls, edits, answers, sent, paused = bot.calls, bot.edits, bot.answers, bot.bytes, scripted[0]
+            avoided = main.edit_scheduler.stats['avoided']
+
+            # Memory: a second, smaller pass under tracemalloc
+            peaks, retained = [], []
+            tracemalloc.start()
+            for game in games[:args.alloc_games]:
+                game += 10_000_000
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                await play(HandlerRun(bot, args.fast), game if kind == "private" else -game)
+                current, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak - before)
+                retained.append(current - before)
+            tracemalloc.stop()
+
+            results[kind] = {
+                'games': args.games,
+                'shots': run.shots,
+                'handler_cpu_us': {'p50': percentile_us(run.handler_ns, 0.5), 'p99': percentile_us(run.handler_ns, 0.99)},
+                'actor_cpu_us': {'p50': percentile_us(run.actor_ns, 0.5), 'p99': percentile_us(run.actor_ns, 0.99)},
+                'api_calls_per_shot': round(calls / run.shots, 2),
+                'api_calls_per_game': round(calls / args.games, 1),
+                'edits_per_game': round(edits / args.games, 1),
+                # Every tap is answered, so answers plus one edit per shot is the floor
+                'callback_answers_per_game': round(answers / args.games, 1),
+                'edits_avoided_per_game': round(avoided / args.games, 2),
+                'animation_seconds_per_game': round(paused / args.games, 1),
+                'bytes_per_game': round(sent / args.games),
+                'peak_alloc_bytes_per_game': sorted(peaks)[len(peaks) // 2],
+                'retained_bytes_per_game': sorted(retained)[len(retained) // 2],
+            }
+            await main.edit_scheduler.close()
+
+        # Boards rendered again while they are on screen (repaint_games over live games).
+        # Game flow itself never repeats a board back to back, so the skip shows here
+        bot = FakeBot()
+        main.edit_scheduler = main.EditScheduler(bot, global_rate=1e9)
+        run = HandlerRun(bot)
+        players = range(20_000_000, 20_000_000 + args.alloc_games)
+        for user_id in players:
+            await run.private_game(user_id, taps=2)
+        calls = bot.calls
+        repainted = main.repaint_games([f"pv:{user_id}" for user_id in players])
+        await run.settle("")
+        results['repaint'] = {
+            'boards': repainted,
+            'api_calls': bot.calls - calls,
+            'edits_avoided': main.edit_scheduler.stats['avoided'],
+        }
+        await main.edit_scheduler.close()
+        return results
+
+    results = asyncio.run(run())
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + "\n")
+    print(output)
+
+
+# Child process that runs nothing but the HTTP server
+HTTP_CHILD = """
+import asyncio, main
+
+async def serve():
+    await main.start_http()
+    await asyncio.Event().wait()
+
+asyncio.run(serve())
+"""
+
+
+def http_get(url: str) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=2) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def rss_kb(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def bench_http(args):
+    for i, server in enumerate(args.servers):
+        port = args.port + i
+        env = dict(os.environ, HTTP_SERVER=server, PORT=str(port))
+        start = time.perf_counter()
+        child = subprocess.Popen([sys.executable, "-c", HTTP_CHILD], env=env,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                try:
+                    if http_get(f"http://127.0.0.1:{port}/") == 200:
+                        break
+                except OSError:
+                    if child.poll() is not None:
+                        raise SystemExit(f"{server} server exited with {child.returncode}")
+                    time.sleep(0.005)
+            startup = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                http_get(f"http://127.0.0.1:{port}/metrics")
+            rate = args.requests / (time.perf_counter() - start)
+            ready = http_get(f"http://127.0.0.1:{port}/ready")
+
+            print(f"{server:8} first 200 after {startup * 1000:6.0f} ms  "
+                  f"RSS {rss_kb(child.pid) / 1024:5.1f} MB  "
+                  f"{rate:7,.0f} /metrics req/s  /ready -> {ready}")
+        finally:
+            child.terminate()
+            child.wait()
+
+
+async def serve_api(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, latency: float):
+    """Keep-alive HTTP/1.1 stand-in for the Bot API: every call succeeds after `latency`"""
+    body = b'{"ok":true,"result":true}'
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    await reader.readexactly(int(line.split(b":")[1]))
+            await asyncio.sleep(latency)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: %d\r\n\r\n%s" % (len(body), body))
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def bench_pool(args):
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    async def run():
+        server = await asyncio.start_server(lambda r, w: serve_api(r, w, args.latency), "127.0.0.1", 0)
+        url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/bot1:x/editMessageText"
+        for size in args.sizes:
+            request = main.MeteredRequest(f"bench{size}", connection_pool_size=size, pool_timeout=None,
+                                          read_timeout=None)
+            await request.initialize()
+            start = time.perf_counter()
+            await asyncio.gather(*(request.do_request(url, "POST") for _ in range(args.calls)))
+            elapsed = time.perf_counter() - start
+            await request.shutdown()
+
+            series = main.API_POOL_WAIT.series.get(f"bench{size}") or [0] * (len(main.API_POOL_WAIT.buckets) + 2)
+            waited = sum(series[:-1])
+            print(f"pool {size:4}  {args.calls / elapsed:8,.0f} calls/s  "
+                  f"{waited:6,} of {args.calls:,} calls waited, "
+                  f"mean wait {series[-1] / max(waited, 1) * 1000:7.1f} ms")
+        server.close()
+
+    asyncio.run(run())
+
+
+def check_game_actor():
+    """A game's jobs run one at a time in the order posted, a failing job doesn't
+    stop the next, games don't wait on each other, and an idle actor goes away
+    """
+    idle_timeout, main.ACTOR_IDLE_TIMEOUT = main.ACTOR_IDLE_TIMEOUT, 0.05
+    main.logger.disabled = True
+
+    async def run():
+        log = []
+
+        async def job(key: str, step: int, seconds: float):
+            log.append((key, step, "start"))
+            await asyncio.sleep(seconds)
+            log.append((key, step, "end"))
+
+        async def fail(key: str):
+            log.append((key, "fail", "start"))
+            raise RuntimeError("job failed")
+
+        actor = main.get_actor("pv:1")
+        for step, seconds in enumerate((0.03, 0, 0.01)):
+            actor.post(job, "pv:1", step, seconds)
+        actor.post(fail, "pv:1")
+        actor.post(job, "pv:1", 3, 0)
+        main.get_actor("pv:2").post(job, "pv:2", 0, 0)
+        assert main.actor_busy("pv:1") and main.get_actor("pv:1") is actor
+
+        for _ in range(200):
+            if not (main.actor_busy("pv:1") or main.actor_busy("pv:2")):
+                break
+            await asyncio.sleep(0.005)
+        else:
+            raise AssertionError("jobs still queued after a second")
+        own = [entry for entry in log if entry[0] == "pv:1"]
+        assert own == [("pv:1", 0, "start"), ("pv:1", 0, "end"), ("pv:1", 1, "start"), ("pv:1", 1, "end"),
+                       ("pv:1", 2, "start"), ("pv:1", 2, "end"), ("pv:1", "fail", "start"),
+                       ("pv:1", 3, "start"), ("pv:1", 3, "end")], own
+        # The other game ran while the first job of pv:1 was still sleeping
+        assert log.index(("pv:2", 0, "end")) < log.index(("pv:1", 0, "end")), log
+
+        done, _ = await asyncio.wait([actor.task], timeout=1)
+        assert done, "an idle actor kept running"
+        assert "pv:1" not in main.game_actors and not main.actor_busy("pv:1"), main.game_actors
+
+    try:
+        asyncio.run(run())
+    finally:
+        main.ACTOR_IDLE_TIMEOUT = idle_timeout
+        main.logger.disabled = False
+        main.game_actors.clear()
+
+
+class ScriptedBot:
+    """Edits succeed after a short round trip; a text in `retry` gets one RetryAfter first"""
+
+    def __init__(self, retry_after: float):
+        self.sent = []      # (chat_id, text, monotonic time)
+        self.retry = set()
+        self.retry_after = retry_after
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, reply_markup=None, **kwargs):
+        await asyncio.sleep(0.002)
+        if text in self.retry:
+            self.retry.discard(text)
+            raise main.RetryAfter(self.retry_after)
+        self.sent.append((chat_id, text, time.monotonic()))
+        return True
+
+
+def check_edit_scheduler():
+    """Edits queued behind a chat's budget merge into the newest, keeping the highest
+    priority; cosmetic frames over budget are dropped; RetryAfter pauses only that
+    chat and retries the frame unless a newer one replaced it; idle buckets are pruned
+    """
+    budget = main.PRIVATE_EDIT_RATE, main.CHAT_EDIT_BURST
+    main.PRIVATE_EDIT_RATE, main.CHAT_EDIT_BURST = 20, 1
+    main.logger.disabled = True
+
+    async def run():
+        bot = ScriptedBot(retry_after=0.1)
+        scheduler = main.EditScheduler(bot, global_rate=1e9)
+
+        # f0 takes the chat's only token; f1-f4 wait for the next one, 1/20 s later
+        first = scheduler.edit("1", 1, "f0")
+        await asyncio.sleep(0)
+        queued = [scheduler.edit("1", 1, f"f{i}", priority=main.PRIO_BOARD if i == 2 else main.PRIO_FRAME)
+                  for i in range(1, 5)]
+        assert scheduler.pending["1", 1].priority == main.PRIO_BOARD
+        cosmetic = scheduler.edit("1", 2, "c", priority=main.PRIO_COSMETIC)
+        assert ("1", 2) not in scheduler.pending
+        assert await first and await queued[-1]
+        assert [await done for done in queued[:-1]] == [False] * 3
+        assert not await cosmetic
+        assert [text for _, text, _ in bot.sent] == ["f0", "f4"], bot.sent
+        assert bot.sent[1][2] - bot.sent[0][2] >= 0.04, bot.sent
+        assert scheduler.stats['merged'] == 3 and scheduler.stats['dropped'] == 1, scheduler.stats
+
+        # r1 is answered RetryAfter; chat 4 is not held up, and r2 replaces r1 in the retry
+        bot.sent.clear()
+        bot.retry.add("r1")
+        start = time.monotonic()
+        retried = scheduler.edit("3", 1, "r1")
+        other = scheduler.edit("4", 1, "o1")
+        assert await other
+        await asyncio.sleep(0.02)
+        assert scheduler.bucket("3").blocked_until > time.monotonic() and ("3", 1) in scheduler.pending
+        newer = scheduler.edit("3", 1, "r2")
+        assert await newer and not await retried
+        assert [text for _, text, _ in bot.sent] == ["o1", "r2"], bot.sent
+        assert bot.sent[1][2] - start >= bot.retry_after, bot.sent
+
+        # With nothing newer, the frame itself goes out after the pause
+        bot.retry.add("s1")
+        start = time.monotonic()
+        assert await scheduler.edit("5", 1, "s1")
+        assert bot.sent[-1][1] == "s1" and bot.sent[-1][2] - start >= bot.retry_after, bot.sent
+        assert scheduler.stats['retry_after'] == 2, scheduler.stats
+
+        # Past 10000 buckets a send drops the full (idle) ones
+        for chat_id in range(10_001):
+            scheduler.bucket(str(1_000_000 + chat_id))
+        assert await scheduler.edit("6", 1, "p")
+        assert len(scheduler.buckets) < 10, len(scheduler.buckets)
+        await scheduler.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        main.PRIVATE_EDIT_RATE, main.CHAT_EDIT_BURST = budget
+        main.logger.disabled = False
+
+
+def check_game_store():
+    """The store evicts its least recently active game past capacity, never one
+    mid-move, and a sweep drops finished and idle games by their own deadlines
+    """
+    main.game_db = main.event_log = None
+    store = main.GameStore(3, finished_grace=10, idle_timeout=100)
+    for user_id in "abc":
+        store[user_id] = main.Game(user_id, 1)
+    store.touch("a")
+    store["d"] = main.Game("d", 1)
+    assert list(store.games) == ["c", "a", "d"], list(store.games)
+
+    busy = main.game_actors["pv:c"] = main.GameActor("pv:c")
+    busy.unfinished = 1
+    try:
+        store["e"] = main.Game("e", 1)
+    finally:
+        del main.game_actors["pv:c"]
+    assert list(store.games) == ["c", "d", "e"], list(store.games)
+    assert store.evictions['capacity'] == 2, store.evictions
+
+    # Oldest first: idle past the timeout, the same but mid-move, finished past
+    # its grace, idle within the timeout, finished within its grace
+    store = main.GameStore(10, finished_grace=10, idle_timeout=100)
+    now = time.monotonic()
+    for user_id, age, status in (("idle", 200, 'playing'), ("moving", 150, 'playing'), ("done", 50, 'finished'),
+                                 ("thinking", 50, 'playing'), ("recent", 5, 'finished')):
+        game = store[user_id] = main.Game(user_id, 1)
+        game.status, game.last_active = status, now - age
+    busy = main.game_actors["pv:moving"] = main.GameActor("pv:moving")
+    busy.unfinished = 1
+    try:
+        assert store.sweep() == 2
+    finally:
+        del main.game_actors["pv:moving"]
+    assert list(store.games) == ["moving", "thinking", "recent"], list(store.games)
+    assert store.evictions == {'finished': 1, 'idle': 1, 'capacity': 0}, store.evictions
+    assert store.sweep() == 1 and "moving" not in store
+
+
+def check_game_db():
+    """A flush that fails keeps its batch dirty under anything marked since, so
+    the next one writes it all, and stop() lands the last changes
+    """
+    path = os.path.join(tempfile.mkdtemp(), "games.db")
+    interval, main.FLUSH_INTERVAL = main.FLUSH_INTERVAL, 60
+    main.event_log = None
+
+    async def run():
+        db = main.GameDB(path)
+        games = [main.Game(str(user_id), user_id) for user_id in range(1, 6)]
+        for game in games:
+            db.mark(game.key, game)
+        db.mark_stats(main.GLOBAL_SCOPE, 1, main.PlayerStats("P1", wins=1))
+
+        write, entered, release = db.write, threading.Event(), threading.Event()
+
+        def failing(*batch):
+            entered.set()
+            release.wait(5)
+            raise sqlite3.OperationalError("disk I/O error")
+
+        db.write = failing
+        flush = asyncio.create_task(db.flush())
+        await asyncio.to_thread(entered.wait, 5)
+        # Marked while the failing batch is on the worker thread
+        db.mark(games[0].key, None)
+        games[1].shoot(True)
+        db.mark(games[1].key, games[1])
+        extra = main.Game("6", 6)
+        db.mark(extra.key, extra)
+        db.mark_stats(main.GLOBAL_SCOPE, 1, main.PlayerStats("P1", wins=2))
+        release.set()
+        try:
+            await flush
+        except sqlite3.Error:
+            pass
+        else:
+            raise AssertionError("the failed flush did not raise")
+        assert set(db.dirty) == {game.key for game in games + [extra]}, db.dirty
+        assert db.dirty[games[0].key] is None and db.dirty_stats[main.GLOBAL_SCOPE, 1].wins == 2
+
+        db.write = write
+        await db.stop()
+        conn = sqlite3.connect(path)
+        rows = {row[0]: row for row in conn.execute("SELECT key, chat_id, message_id, status, state, players FROM games")}
+        assert rows == {game.key: main.GameDB.row(game.key, game) for game in games[1:] + [extra]}, rows
+        assert conn.execute("SELECT scope, user_id, wins FROM stats").fetchall() == [(main.GLOBAL_SCOPE, 1, 2)]
+        conn.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        main.FLUSH_INTERVAL = interval
+
+
+def tap_update(data: str, user_id: int, chat_id: int) -> dict:
+    """Raw callback query update, as the front process receives it"""
+    return {
+        'update_id': 1,
+        'callback_query': {
+            'id': "1", 'chat_instance': 'check', 'from': {'id': user_id, 'is_bot': False, 'first_name': "P"},
+            'data': data, 'message': {'message_id': 2, 'date': 0, 'chat': {'id': chat_id, 'type': 'group'}},
+        },
+    }
+
+
+def message_update(text: str, user_id: int, chat_id: int, kind: str = 'message') -> dict:
+    return {'update_id': 1, kind: {'message_id': 1, 'date': 0, 'chat': {'id': chat_id}, 'from': {'id': user_id},
+                                   'text': text}}
+
+
+def check_routing():
+    """Every update of a game reaches the worker that owns it, the mapping is the
+    one existing shard databases were written under, and keys spread evenly
+    """
+    count = 4
+
+    # A private player's command and every button of their game go by user id, old buttons included
+    for user_id in (1, 777000, 2 ** 40 + 3):
+        keys = {
+            main.route_key(message_update("/buckshotpv", user_id, user_id)),
+            main.route_key(tap_update(main.encode_callback(main.OP_PV_DEALER, str(user_id)), user_id, user_id)),
+            main.route_key(tap_update(main.encode_callback(main.OP_PV_SELF, str(user_id)), user_id, user_id)),
+            main.route_key(tap_update(main.encode_callback(main.OP_PLAY_AGAIN_PV, ""), user_id, user_id)),
+            main.route_key(tap_update(f"pv_dealer_{user_id}", user_id, user_id)),
+        }
+        assert keys == {str(user_id)}, (user_id, keys)
+
+    # A group's /buckshot opens the lobby on its chat's worker, whose game id routes back there
+    worker = main.WORKER_INDEX, main.WORKER_COUNT
+    try:
+        for chat_id in range(-1_000_000_000_100, -1_000_000_000_000):
+            index = main.shard_of(main.route_key(message_update("/buckshot", 5, chat_id)), count)
+            main.WORKER_INDEX, main.WORKER_COUNT = index, count
+            game_id = main.new_game_id()
+            for op in (main.OP_JOIN, main.OP_GP_OPP, main.OP_GP_SELF):
+                data = tap_update(main.encode_callback(op, game_id), 6, chat_id)
+                assert main.shard_of(main.route_key(data), count) == index, (chat_id, op, game_id)
+    finally:
+        main.WORKER_INDEX, main.WORKER_COUNT = worker
+
+    assert main.route_key(message_update("hi", 5, -100, kind='edited_message')) == "-100"
+    assert main.route_key({'update_id': 1}) == "0"
+
+    # Changing these moves games away from the shard database that holds them
+    keys = ("1", "777000", "-1001234567890", "a1b2c3")
+    assert [main.shard_of(key, 4) for key in keys] == [3, 3, 1, 2]
+    assert [main.shard_of(key, 3) for key in keys] == [2, 2, 2, 2]
+
+    spread = [0] * count
+    for user_id in range(1_000_000, 1_020_000):
+        spread[main.shard_of(str(user_id), count)] += 1
+    assert max(spread) < 1.1 * 20_000 / count and min(spread) > 0.9 * 20_000 / count, spread
+
+
+def check_timer_wheel():
+    """Re-arming replaces a deadline, cancel removes it, and far deadlines wait out their rounds"""
+    async def run():
+        wheel = main.TimerWheel(tick=0.01, slots=8)
+        fired = []
+        start = time.monotonic()
+
+        def fire(name):
+            fired.append((name, time.monotonic() - start))
+
+        wheel.arm("a", 0.05, fire, "a")
+        wheel.arm("b", 0.05, fire, "b")
+        wheel.arm("a", 0.2, fire, "a2")     # replaces the first deadline of "a"
+        wheel.arm("c", 0.3, fire, "c")      # over three turns of an 8-slot wheel
+        wheel.cancel("b")
+        wheel.cancel("missing")
+        assert len(wheel) == 2, len(wheel)
+
+        await asyncio.sleep(0.1)
+        assert fired == [], fired
+        await wheel.task
+        assert [name for name, _ in fired] == ["a2", "c"], fired
+        assert fired[0][1] >= 0.2 and fired[1][1] >= 0.3, fired
+        assert not wheel.timers and not any(wheel.slots), (wheel.timers, wheel.slots)
+
+        # An idle wheel starts again on the next arm
+        wheel.arm("d", 0.01, fire, "d")
+        await wheel.task
+        assert fired[-1][0] == "d", fired
+
+    asyncio.run(run())
+
+
+def check_callbacks():
+    """Every button round-trips through the codec within Telegram's 64 bytes, and old buttons still decode"""
+    rng = random.Random(1)
+    user_ids = ["1", "777000", str(2 ** 40 + 3), str(2 ** 63 - 1)]
+    game_ids = ["000000", "zzzzzz", "0a0b0c"] + [main.new_game_id() for _ in range(200)]
+    game_ids += [''.join(rng.choices(main.GAME_ID_ALPHABET, k=6)) for _ in range(200)]
+
+    cases = [(op, key) for op in (main.OP_PV_DEALER, main.OP_PV_SELF) for key in user_ids]
+    cases += [(op, key) for op in main.GROUP_OPS for key in game_ids]
+    cases += [(main.OP_PLAY_AGAIN_PV, ""), (main.OP_PLAY_AGAIN_GP, "")]
+    for op, key in cases:
+        data = main.encode_callback(op, key)
+        assert len(data.encode()) <= 64, (op, key, data)
+        assert main.decode_callback(data) == (op, key), (op, key, data, main.decode_callback(data))
+
+    markups = [main.get_private_game_kb(user_ids[-1]), main.get_group_game_kb("zzzzzz"), main.get_lobby_kb("zzzzzz"),
+               main.get_play_again_kb(True), main.get_play_again_kb(False)]
+    for markup in markups:
+        for row in markup.inline_keyboard:
+            for button in row:
+                assert len(button.callback_data.encode()) <= 64, button.callback_data
+
+    legacy = {
+        "join_-1001234567890": (main.OP_JOIN, "-1001234567890"),
+        "pv_dealer_123456": (main.OP_PV_DEALER, "123456"),
+        "pv_self_123456": (main.OP_PV_SELF, "123456"),
+        "gp_opp_-100_1_2_1": (main.OP_GP_OPP, "-100_1_2_1"),
+        "gp_self_-100_1_2_2": (main.OP_GP_SELF, "-100_1_2_2"),
+        "play_again_pv": (main.OP_PLAY_AGAIN_PV, ""),
+        "play_again_gp": (main.OP_PLAY_AGAIN_GP, ""),
+    }
+    for data, expected in legacy.items():
+        assert main.decode_callback(data) == expected, (data, main.decode_callback(data))
+
+    # Another version, garbage and truncated data all decode to opcode 0
+    future = base64.urlsafe_b64encode(main.CALLBACK_FORMAT.pack(main.CALLBACK_VERSION + 1, main.OP_JOIN, 5))
+    for data in ("", "hello", "!!!!", future.rstrip(b'=').decode(), main.encode_callback(main.OP_JOIN, "abc")[:8]):
+        assert main.decode_callback(data) == (0, ""), (data, main.decode_callback(data))
+
+
+def check_leaderboard():
+    """Every board matches a full sort, a cached /top render matches a fresh one, and stats survive a reload"""
+    rng = random.Random(2)
+    main.game_db = None
+    store = main.player_stats = main.StatsStore(5)
+    players = [main.Player(user_id, f"user{user_id}" if user_id % 3 else None, f"Name{user_id}")
+               for user_id in range(1, 40)]
+    chats = [str(-100 - i) for i in range(4)]
+    main.get_leaderboard_msg.cache_clear()
+
+    def ranked(scope: str) -> list:
+        scores = store.scopes.get(scope, {})
+        return sorted(scores, key=lambda user_id: (-scores[user_id].wins, user_id))[:store.size]
+
+    # The same results also go through a shard worker's StatsFeed into a front's store
+    feed = queue.SimpleQueue()
+    sharded = main.StatsStore(5)
+    for step in range(3000):
+        if rng.random() < 0.3:
+            user, won = FakeUser(rng.choice(players).id), rng.random() < 0.4
+            for target in (store, main.StatsFeed(feed)):
+                target.seen(user)
+                target.record_private(user.id, won)
+        else:
+            chat_id, (winner, loser) = rng.choice(chats), rng.sample(players, 2)
+            for target in (store, main.StatsFeed(feed)):
+                target.record_match(chat_id, winner, loser)
+        while not feed.empty():
+            sharded.apply(feed.get())
+
+        scope = rng.choice([main.GLOBAL_SCOPE, *chats])
+        board = store.board(scope)
+        assert [user_id for _, user_id in board.entries] == ranked(scope), (step, scope)
+        # A render cached under this version is the board as it is now
+        assert main.get_leaderboard_msg(scope, board.version) == main.get_leaderboard_msg.__wrapped__(scope, board.version), \
+            (step, scope)
+
+    rows = [
+        (scope, user_id, stats.name, stats.wins, stats.losses, stats.streak, stats.best_streak)
+        for scope, scores in store.scopes.items() for user_id, stats in scores.items()
+    ]
+    reloaded = main.StatsStore(5)
+    reloaded.load(rows)
+    for other in (sharded, reloaded):
+        for scope, scores in store.scopes.items():
+            copy = other.scopes[scope]
+            assert {user_id: stats_tuple(stats) for user_id, stats in scores.items()} == \
+                   {user_id: stats_tuple(stats) for user_id, stats in copy.items()}, scope
+            assert other.board(scope).entries == store.board(scope).entries, scope
+    assert sharded.names == store.names
+
+
+def stats_tuple(stats: main.PlayerStats) -> tuple:
+    return stats.name, stats.wins, stats.losses, stats.streak, stats.best_streak
+
+
+def game_tuple(game: main.Game) -> tuple:
+    """Everything a game holds but its activity stamp, players by value"""
+    players = tuple((p.id, p.username, p.name, p.display, p.label) for p in game.players)
+    return tuple(getattr(game, name) for name in main.Game.__slots__ if name not in ('last_active', 'p1', 'p2')) + players
+
+
+def check_snapshot():
+    """Games come back from a shutdown snapshot unchanged, stale flags included,
+    and a snapshot of another version or a damaged one is refused
+    """
+    rng = random.Random(3)
+    path = os.path.join(tempfile.mkdtemp(), "buckshot.snapshot")
+    main.game_db = main.event_log = None
+
+    async def run():
+        main.edit_scheduler = main.EditScheduler(FakeBot())
+        games = []
+        for i in range(300):
+            game = compact_game(str(1_000_000_000 + i), i % 3 == 0)
+            # Shots that leave the game between moves: nobody out of lives, shells left
+            for _ in range(rng.randrange(6)):
+                if min(game.p1_hp, game.p2_hp) > 1 and game.remaining > 1:
+                    game.shoot(rng.random() < 0.5)
+            if game.game_id is None:
+                game.turn = 1   # the dealer's turn would be played on restore
+                main.private_games[game.chat_id] = game
+            else:
+                if i % 2:
+                    game.status, game.p2 = 'waiting', None     # an open lobby
+                main.group_games[game.game_id] = game
+                main.chat_games.setdefault(game.chat_id, set()).add(game.game_id)
+            games.append(game)
+        games[1].status = 'finished'
+        games[2].message_id = None
+        saved = {game.key: game_tuple(game) for game in games[:1] + games[3:]}
+
+        cut = {games[3].key, games[4].key}
+        main.edit_scheduler.edit(games[5].chat_id, games[5].message_id, "a frame still queued")
+        assert await main.save_snapshot(path, cut) == len(saved)
+        await main.edit_scheduler.close()
+
+        main.private_games.games.clear()
+        main.group_games.clear()
+        main.chat_games.clear()
+        rows, stale = main.read_snapshot(path)
+        assert main.restore_games(rows) == len(saved)
+        for game_id in list(main.group_games):
+            main.deadlines.cancel(f"gp:{game_id}")
+
+        restored = [*main.private_games.values(), *main.group_games.values()]
+        assert {game.key: game_tuple(game) for game in restored} == saved
+        assert set(stale) == cut | {games[5].key}, stale
+
+    asyncio.run(run())
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    damaged = {
+        "another version": b"BRS2" + data[4:],
+        "truncated": data[:-1],
+        "trailing data": data + b"\0",
+        "no header": data[:5],
+    }
+    for name, content in damaged.items():
+        with open(path, 'wb') as f:
+            f.write(content)
+        try:
+            main.read_snapshot(path)
+        except (ValueError, struct.error):
+            continue
+        raise AssertionError(f"{name} snapshot was read")
+
+
+# Run by `bench.py check`, in order
+CHECKS = [check_game_actor, check_edit_scheduler, check_game_store, check_game_db, check_routing, check_timer_wheel, check_callbacks, check_leaderboard, check_snapshot]
+
+
+def bench_check(args) -> int:
+    failed = 0
+    for check in CHECKS:
+        try:
+            check()
+        except AssertionError as e:
+            failed += 1
+            print(f"FAIL {check.__name__}: {e}")
+        else:
+            print(f"ok   {check.__name__}")
+    return 1 if failed else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Buckshot Roulette benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    state = sub.add_parser("state", help="memory per game and board renders per second")
+    state.add_argument("--games", type=int, default=100_000)
+    state.set_defaults(func=bench_state)
+
+    render = sub.add_parser("render", help="frame renders per second with and without the render cache")
+    render.add_argument("--seconds", type=float, default=1.0)
+    render.set_defaults(func=bench_render)
+
+    dealer = sub.add_parser("dealer", help="policy table solve/load time and memory, decisions per second")
+    dealer.add_argument("--repeat", type=int, default=5)
+    dealer.set_defaults(func=bench_dealer)
+
+    db = sub.add_parser("db", help="SQLite flush throughput and recovery time")
+    db.add_argument("--games", type=int, default=1_000_000)
+    db.add_argument("--batch", type=int, default=50_000)
+    db.add_argument("--path", help="database file (default: a temp file)")
+    db.set_defaults(func=bench_db)
+
+    snapshot = sub.add_parser("snapshot", help="shutdown snapshot save time, size and restore time")
+    snapshot.add_argument("--games", type=int, default=100_000)
+    snapshot.set_defaults(func=bench_snapshot)
+
+    events = sub.add_parser("eventlog", help="event logging and checkpoint cost, recovery from rows and the log tail")
+    events.add_argument("--history", type=int, default=200_000, help="finished games logged a day earlier")
+    events.add_argument("--games", type=int, default=50_000, help="games running at shutdown")
+    events.add_argument("--seed", type=int, default=1)
+    events.set_defaults(func=bench_eventlog)
+
+    stats = sub.add_parser("stats", help="player stats update cost and /top with and without the board")
+    stats.add_argument("--players", type=int, default=100_000)
+    stats.add_argument("--chats", type=int, default=1_000)
+    stats.add_argument("--results", type=int, default=200_000)
+    stats.add_argument("--tops", type=int, default=100)
+    stats.add_argument("--seed", type=int, default=1)
+    stats.set_defaults(func=bench_stats)
+
+    handlers = sub.add_parser("handlers", help="handler CPU time, API calls and bytes per game (JSON)")
+    handlers.add_argument("--games", type=int, default=2_000)
+    handlers.add_argument("--alloc-games", type=int, default=200)
+    handlers.add_argument("--seed", type=int, default=1)
+    handlers.add_argument("--fast", action="store_true", help="play every game in fast play")
+    handlers.add_argument("--out", help="also write the JSON here")
+    handlers.set_defaults(func=bench_handlers)
+
+    shards = sub.add_parser("shards", help="callback throughput as the worker count grows")
+    shards.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    shards.add_argument("--players", type=int, default=2_000)
+    shards.add_argument("--taps", type=int, default=20)
+    shards.set_defaults(func=bench_shards)
+
+    http = sub.add_parser("http", help="HTTP server startup time, memory and request rate")
+    http.add_argument("--servers", nargs="+", choices=("flask", "asyncio"), default=["flask", "asyncio"])
+    http.add_argument("--requests", type=int, default=1_000)
+    http.add_argument("--port", type=int, default=18080)
+    http.set_defaults(func=bench_http)
+
+    pool = sub.add_parser("pool", help="Bot API calls per second and pool waits by connection pool size")
+    pool.add_argument("--sizes", type=int, nargs="+", default=[1, 4, 16, 64])
+    pool.add_argument("--calls", type=int, default=500)
+    pool.add_argument("--latency", type=float, default=0.05, help="simulated API round trip (s)")
+    pool.set_defaults(func=bench_pool)
+
+    check = sub.add_parser("check", help="assert invariants the bot and these benchmarks rely on")
+    check.set_defaults(func=bench_check)
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    sys.exit(args.func(args))
@@ -0,0 +1,201 @@
+"""
+Buckshot Roulette rules engine.
+
+Pure Python with no Telegram dependencies, so the bot, the benchmarks
+and offline tools all play by the same rules.
+"""
+import array
+import os
+import random
+import struct
+import time
+from functools import lru_cache
+
+# Starting HP of each side and the magazine sizes generate_shells deals
+MAX_HP = 3
+MAX_LIVE = 4
+MAX_BLANK = 4
+
+# Moves, from the point of view of whoever holds the shotgun
+SHOOT_OPPONENT = 0
+SHOOT_SELF = 1
+
+
+# ═══════════════════════════════════════
+#               RULES
+# ═══════════════════════════════════════
+
+def generate_shells(rng=random) -> tuple:
+    """Generate random shells for the shotgun.
+
+    Returns (magazine, live, blank) where bit i of the magazine is set
+    when shell i is live.
+    """
+    live = rng.randint(1, MAX_LIVE)
+    blank = rng.randint(1, MAX_BLANK)
+    shells = [1] * live + [0] * blank
+    rng.shuffle(shells)
+    magazine = 0
+    for i, shell in enumerate(shells):
+        magazine |= shell << i
+    return magazine, live, blank
+
+
+def magazine_rng(seed: int, reload: int) -> random.Random:
+    """RNG that deals reload number `reload` of the game seeded `seed`.
+
+    Each magazine gets its own generator, so a game can be replayed from
+    its seed alone and a restored game keeps dealing the same shells.
+    """
+    return random.Random(seed << 16 | reload)
+
+
+def resolve_shot(p1_hp: int, p2_hp: int, turn: int, at_self: bool, is_live: bool) -> tuple:
+    """Apply one shot by player `turn` (1 or 2).
+
+    A live shell costs its target one HP, a blank fired at yourself keeps
+    the turn, and every other shot passes it. Returns (p1_hp, p2_hp, turn).
+    """
+    if is_live:
+        if (turn == 1) == at_self:
+            p1_hp -= 1
+        else:
+            p2_hp -= 1
+    if is_live or not at_self:
+        turn = 2 if turn == 1 else 1
+    return p1_hp, p2_hp, turn
+
+
+def winner(p1_hp: int, p2_hp: int) -> int:
+    """1 or 2 once a player is out of HP, 0 while the game goes on"""
+    if p1_hp <= 0:
+        return 2
+    if p2_hp <= 0:
+        return 1
+    return 0
+
+
+# ═══════════════════════════════════════
+#            OPTIMAL POLICY
+# ═══════════════════════════════════════
+
+class PolicyTable:
+    """Exact win chance and best move for every state of the game.
+
+    A state is seen from the shooter's side: (live, blank, hp, opp_hp).
+    The shooter knows how many live and blank shells are left but not
+    their order, a blank fired at yourself keeps the turn, and an empty
+    magazine is reloaded with 1-4 live and 1-4 blank shells uniformly.
+    The (0, 0) slot of each HP pair holds the expected win chance right
+    after a reload.
+    """
+
+    HEADER = struct.Struct('<4sBBB')
+    MAGIC = b'BRPT'
+
+    def __init__(self, max_hp: int = MAX_HP, max_live: int = MAX_LIVE, max_blank: int = MAX_BLANK):
+        self.max_hp = max_hp
+        self.max_live = max_live
+        self.max_blank = max_blank
+        self.size = (max_live + 1) * (max_blank + 1) * (max_hp + 1) * (max_hp + 1)
+        self.win = array.array('d', bytes(8 * self.size))
+        self.move = bytearray(self.size)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.win) * self.win.itemsize + len(self.move)
+
+    def index(self, live: int, blank: int, hp: int, opp_hp: int) -> int:
+        return ((live * (self.max_blank + 1) + blank) * (self.max_hp + 1) + hp) * (self.max_hp + 1) + opp_hp
+
+    def best_move(self, live: int, blank: int, hp: int, opp_hp: int) -> int:
+        """SHOOT_OPPONENT or SHOOT_SELF, whichever wins more often"""
+        return self.move[self.index(live, blank, hp, opp_hp)]
+
+    def win_chance(self, live: int, blank: int, hp: int, opp_hp: int) -> float:
+        """Chance the shooter wins from this state with both sides playing optimally"""
+        return self.win[self.index(live, blank, hp, opp_hp)]
+
+    @classmethod
+    def solve(cls, max_hp: int = MAX_HP, max_live: int = MAX_LIVE, max_blank: int = MAX_BLANK) -> "PolicyTable":
+        """Solve the game by memoized recursion over every state.
+
+        Each magazine holds at least one live shell, so a full magazine
+        always costs somebody HP and the recursion cannot loop.
+        """
+        table = cls(max_hp, max_live, max_blank)
+        reloads = [(live, blank) for live in range(1, max_live + 1) for blank in range(1, max_blank + 1)]
+
+        @lru_cache(maxsize=None)
+        def win(live: int, blank: int, hp: int, opp_hp: int) -> float:
+            if live + blank == 0:
+                return sum(win(l, b, hp, opp_hp) for l, b in reloads) / len(reloads)
+            return max(outcomes(live, blank, hp, opp_hp))
+
+        def outcomes(live: int, blank: int, hp: int, opp_hp: int) -> tuple:
+            """Win chance after each move, indexed by move"""
+            p_live = live / (live + blank)
+            shoot_opponent = shoot_self = 0.0
+            if live:
+                shoot_opponent += p_live * (1.0 if opp_hp == 1 else 1.0 - win(live - 1, blank, opp_hp - 1, hp))
+                shoot_self += p_live * (0.0 if hp == 1 else 1.0 - win(live - 1, blank, opp_hp, hp - 1))
+            if blank:
+                shoot_opponent += (1 - p_live) * (1.0 - win(live, blank - 1, opp_hp, hp))
+                shoot_self += (1 - p_live) * win(live, blank - 1, hp, opp_hp)
+            return shoot_opponent, shoot_self
+
+        for live in range(max_live + 1):
+            for blank in range(max_blank + 1):
+                for hp in range(1, max_hp + 1):
+                    for opp_hp in range(1, max_hp + 1):
+                        i = table.index(live, blank, hp, opp_hp)
+                        table.win[i] = win(live, blank, hp, opp_hp)
+                        if live + blank:
+                            shoot_opponent, shoot_self = outcomes(live, blank, hp, opp_hp)
+                            table.move[i] = SHOOT_SELF if shoot_self > shoot_opponent else SHOOT_OPPONENT
+        return table
+
+    def save(self, path: str):
+        # Written aside and renamed so a concurrent reader never sees half a table
+        partial = f"{path}.{os.getpid()}.tmp"
+        with open(partial, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.max_hp, self.max_live, self.max_blank))
+            f.write(self.move)
+            f.write(self.win.tobytes())
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path: str) -> "PolicyTable":
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, max_hp, max_live, max_blank = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            raise ValueError(f"{path} is not a policy table")
+        table = cls(max_hp, max_live, max_blank)
+        start = cls.HEADER.size
+        table.move[:] = data[start:start + table.size]
+        table.win = array.array('d', data[start + table.size:])
+        if len(table.win) != table.size:
+            raise ValueError(f"{path} is truncated")
+        return table
+
+
+def load_policy(path: str = None) -> tuple:
+    """Policy table from `path` if it holds one for the current rules, solved otherwise.
+
+    A freshly solved table is written to `path` when one is given.
+    Returns (table, seconds taken, whether it was loaded).
+    """
+    start = time.perf_counter()
+    if path and os.path.exists(path):
+        try:
+            table = PolicyTable.load(path)
+            if (table.max_hp, table.max_live, table.max_blank) == (MAX_HP, MAX_LIVE, MAX_BLANK):
+                return table, time.perf_counter() - start, True
+        except (OSError, ValueError, struct.error):
+            pass
+
+    table = PolicyTable.solve()
+    if path:
+        table.save(path)
+    return table, time.perf_counter() - start, False
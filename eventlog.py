@@ -0,0 +1,216 @@
+"""
+Append-only log of game events.
+
+Every event is one fixed-size record carrying the move that happened and
+the full state it left behind, so the last record of a game is enough to
+put it back, and a game's records from its START replay it exactly:
+magazine n comes from engine.magazine_rng(seed, n).
+
+    game u64, seq u32, time u32,
+    kind, flags, actor, target, shell, p1_hp, p2_hp, turn (u8 each),
+    seed u32, magazine u16, mag_len u8, shell_idx u8
+
+A RELOAD's `shell` is the reload number and an END's `target` its reason.
+Several games can share a key (a user's private games); the seed tells
+them apart and seq counts events within one game.
+
+A CHECKPOINT repeats the state of a live game whose database row is still
+unwritten and that had no other record since the previous round of
+checkpoints. With rounds every third of the tail, the rows and the last
+`tail` seconds of the log hold every live game.
+
+Pure Python with no Telegram dependencies, like engine.py.
+"""
+import asyncio
+import gc
+import logging
+import os
+import re
+import struct
+from collections import namedtuple
+
+RECORD = struct.Struct('<QIIBBBBBBBBIHBB')
+
+Event = namedtuple('Event', (
+    'game', 'seq', 'time', 'kind', 'flags', 'actor', 'target', 'shell',
+    'p1_hp', 'p2_hp', 'turn', 'seed', 'magazine', 'mag_len', 'shell_idx'
+))
+
+# Record kinds
+EV_START = 1    # new game; the magazine it was dealt follows as a RELOAD
+EV_RELOAD = 2   # fresh magazine
+EV_SHOT = 3     # actor fired at target (SHOOT_OPPONENT / SHOOT_SELF); shell 1 = live
+EV_END = 4      # game over or dropped
+EV_CHECKPOINT = 5   # state of a quiet game, repeated; shell = reload number as in a RELOAD
+
+KIND_NAMES = {EV_START: "start", EV_RELOAD: "reload", EV_SHOT: "shot", EV_END: "end", EV_CHECKPOINT: "checkpoint"}
+
+# END reasons
+END_FINISHED = 0
+END_FORFEIT = 1
+END_DROPPED = 2
+
+END_NAMES = {END_FINISHED: "finished", END_FORFEIT: "forfeit", END_DROPPED: "dropped"}
+
+# flags
+FLAG_GROUP = 1
+GROUP_BIT = 1 << 63
+
+BASE36_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+# Kind bytes whose `shell` is a reload number
+RELOAD_KINDS = re.compile(b"[" + bytes([EV_RELOAD, EV_CHECKPOINT]) + b"]")
+
+logger = logging.getLogger(__name__)
+
+
+def game_ref(key: str) -> tuple:
+    """(game, flags) for a store key: "pv:<user id>" or "gp:<game id>".
+
+    Group games also get the top bit of `game`, so it alone is unique.
+    """
+    if key.startswith("gp:"):
+        return int(key[3:], 36) | GROUP_BIT, FLAG_GROUP
+    return int(key[3:]), 0
+
+
+def game_key(game: int) -> str:
+    """Store key of a record's `game`"""
+    if not game & GROUP_BIT:
+        return f"pv:{game}"
+    game &= ~GROUP_BIT
+    digits = ""
+    while game:
+        game, digit = divmod(game, 36)
+        digits = BASE36_DIGITS[digit] + digits
+    return "gp:" + digits.rjust(6, '0')
+
+
+class EventLog:
+    """Buffered append-only writer.
+
+    append() only packs the record into a memory buffer; a flusher task
+    writes the buffer out every `interval` seconds on a worker thread, one
+    write at a time so records stay in order. A crash loses at most the
+    last interval, and a torn final record is ignored by read_records().
+    """
+
+    def __init__(self, path: str, interval: float = 0.2):
+        self.path = path
+        self.interval = interval
+        self.file = open(path, 'ab')
+        # Drop a record torn by a crash, or every later one would be misaligned
+        torn = self.file.tell() % RECORD.size
+        if torn:
+            self.file.truncate(self.file.tell() - torn)
+        self.buffer = bytearray()
+        self.recent = set()     # `game` of every record since the last round of checkpoints
+        self.task = None
+        self.lock = asyncio.Lock()
+        self.stats = {'records': 0, 'flushes': 0, 'bytes': 0}
+
+    def append(self, *fields):
+        self.buffer += RECORD.pack(*fields)
+        self.recent.add(fields[0])
+        self.stats['records'] += 1
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    def write(self, data: bytes):
+        """Append one batch to the file (runs on a worker thread)"""
+        self.file.write(data)
+        self.file.flush()
+        self.stats['flushes'] += 1
+        self.stats['bytes'] += len(data)
+
+    async def flush(self):
+        async with self.lock:
+            data, self.buffer = self.buffer, bytearray()
+            if data:
+                await asyncio.to_thread(self.write, bytes(data))
+
+    async def _run(self):
+        while self.buffer:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except OSError:
+                logger.exception("Event log write failed")
+
+    async def close(self):
+        await self.flush()
+        self.file.close()
+
+
+def read_records(path: str):
+    """Every whole record in the log as a plain tuple, oldest first"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    whole = len(data) - len(data) % RECORD.size
+    return RECORD.iter_unpack(memoryview(data)[:whole])
+
+
+def read_tail(path: str, seconds: float = None) -> bytes:
+    """Whole records from `seconds` before the last one to the end (the whole log if None).
+
+    Records are in time order, so the start is found by bisecting the
+    file on the time field and nothing before it is read.
+    """
+    size = RECORD.size
+    with open(path, 'rb') as f:
+        count = f.seek(0, os.SEEK_END) // size
+
+        def time_at(index: int) -> int:
+            f.seek(index * size + 12)
+            return struct.unpack('<I', f.read(4))[0]
+
+        first = 0
+        if seconds is not None and count:
+            oldest = time_at(count - 1) - seconds
+            high = count
+            while first < high:
+                middle = (first + high) // 2
+                if time_at(middle) < oldest:
+                    first = middle + 1
+                else:
+                    high = middle
+        f.seek(first * size)
+        return f.read((count - first) * size)
+
+
+def last_states(data: bytes) -> dict:
+    """Store key -> (last Event, number of its last reload) of the latest game under each key.
+
+    `data` is whole records (read_tail). The reload number is None when
+    neither that game's last reload nor a later checkpoint is in `data`.
+    The scan itself runs in C: dict(zip()) keeps each game's last record
+    index and a regex finds the reloads and checkpoints.
+    """
+    size = RECORD.size
+    count = len(data) // size
+    if not count:
+        return {}
+    games = memoryview(data).cast('Q')[::size // 8].tolist()
+    last = dict(zip(games, range(count)))
+    reload_at = [match.start() for match in RELOAD_KINDS.finditer(data[16::size])]
+    reloads = dict(zip([games[i] for i in reload_at], reload_at))
+
+    unpack, make = RECORD.unpack_from, Event._make
+    states = {}
+    # Bulk allocation would otherwise trigger a full GC pass every few thousand games
+    gc.disable()
+    try:
+        for game, index in last.items():
+            event = make(unpack(data, index * size))
+            reload = None
+            at = reloads.get(game)
+            if at == index:
+                reload = event.shell
+            elif at is not None:
+                reloaded = unpack(data, at * size)
+                if reloaded[11] == event.seed:
+                    reload = reloaded[7]
+            states[game_key(game)] = (event, reload)
+    finally:
+        gc.enable()
+    return states
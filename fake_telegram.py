@@ -0,0 +1,536 @@
+"""
+Local stand-in for the Telegram Bot API, and a swarm of virtual players to
+load-test the bot end to end without touching Telegram.
+
+    python fake_telegram.py [--private N] [--groups N] [--duration S]
+                            [--latency S] [--jitter S] [--rate-limit P]
+                            [--server-errors P] [--restart-every S]
+                            [--bot-env KEY=VALUE ...]
+
+starts the server, runs `python main.py` against it (BOT_API_URL pointing
+here) and plays: private players send /buckshotpv, shoot until game over
+and tap Play Again; group pairs open a lobby with /buckshot, join and take
+turns. Players only read what the bot puts on screen (button labels and
+whose turn it is), like people would. Every --report seconds it prints
+games finished per second, tap-to-edit latency and the bot's RSS.
+--restart-every stops the bot with SIGTERM and starts a new one on the
+same database and snapshot, the way a deploy does; games that don't
+survive it show up as stalls.
+
+    python fake_telegram.py --serve-only --port 8081
+    BOT_API_URL=http://127.0.0.1:8081 BOT_TOKEN=123456:fake python main.py
+
+Speaks getMe, getUpdates (long polling), sendMessage, editMessageText,
+answerCallbackQuery and the webhook calls made at startup. Every call
+but getUpdates waits --latency plus up to --jitter seconds; --rate-limit
+and --server-errors answer that share of sends, edits and answers with
+429 RetryAfter or 502. Edits answer "message is not modified" and
+"message to edit not found" the way Telegram does.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from urllib.parse import parse_qsl
+
+# Calls a bot makes while playing; only these get injected faults
+OUTBOUND = {"sendMessage", "editMessageText", "answerCallbackQuery"}
+
+# Form fields that Telegram reads as numbers or JSON
+INT_FIELDS = {"chat_id", "message_id", "offset", "limit", "timeout", "cache_time"}
+JSON_FIELDS = {"reply_markup", "allowed_updates", "entities"}
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests", 502: "Bad Gateway"}
+
+
+class Frame:
+    """A message as a player sees it once the bot has put a keyboard on it"""
+
+    __slots__ = ('message', 'text', 'buttons', 'at')
+
+    def __init__(self, message: dict, buttons: list):
+        self.message = message
+        self.text = message['text']
+        self.buttons = buttons      # [(label, callback data)]
+        self.at = time.monotonic()
+
+
+class Chat:
+    __slots__ = ('info', 'next_id', 'messages', 'inbox')
+
+    def __init__(self, info: dict):
+        self.info = info
+        self.next_id = 1
+        self.messages = {}          # message_id -> (text, reply_markup)
+        self.inbox = None           # asyncio.Queue of Frames while a player watches the chat
+
+
+class FakeBotAPI:
+    """The Bot API state: pending updates and every chat's messages"""
+
+    def __init__(self, token: str, latency: float = 0.0, jitter: float = 0.0,
+                 rate_limit: float = 0.0, retry_after: int = 1, server_errors: float = 0.0):
+        self.token = token
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.server_errors = server_errors
+        self.bot_user = {
+            "id": int(token.split(":")[0]), "is_bot": True, "first_name": "Buckshot",
+            "username": "buckshot_bot", "can_join_groups": True,
+            "can_read_all_group_messages": False, "supports_inline_queries": False,
+        }
+        self.updates = deque()
+        self.update_id = 0
+        self.new_update = asyncio.Event()
+        self.chats = {}
+        self.calls = {}
+        self.faults = {429: 0, 502: 0}
+
+    def chat(self, chat_id: int) -> Chat:
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            if chat_id > 0:
+                info = {"id": chat_id, "type": "private", "first_name": f"user{chat_id}"}
+            else:
+                info = {"id": chat_id, "type": "supergroup", "title": f"group{-chat_id}"}
+            chat = self.chats[chat_id] = Chat(info)
+        return chat
+
+    def message(self, chat: Chat, message_id: int, sender: dict, text: str, reply_markup=None) -> dict:
+        message = {"message_id": message_id, "date": int(time.time()), "chat": chat.info, "from": sender, "text": text}
+        if reply_markup:
+            message["reply_markup"] = reply_markup
+        return message
+
+    # ── what players do ──
+
+    def push(self, kind: str, payload: dict):
+        self.update_id += 1
+        self.updates.append({"update_id": self.update_id, kind: payload})
+        self.new_update.set()
+
+    def command(self, chat_id: int, user: dict, text: str):
+        chat = self.chat(chat_id)
+        message_id, chat.next_id = chat.next_id, chat.next_id + 1
+        message = self.message(chat, message_id, user, text)
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        self.push("message", message)
+
+    def tap(self, user: dict, frame: Frame, data: str):
+        self.push("callback_query", {
+            "id": str(self.update_id), "from": user, "message": frame.message,
+            "chat_instance": str(frame.message["chat"]["id"]), "data": data,
+        })
+
+    # ── what the bot does ──
+
+    async def call(self, method: str, params: dict) -> tuple:
+        """(HTTP status, response object) for one Bot API call"""
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method == "getUpdates":
+            return 200, {"ok": True, "result": await self.get_updates(params)}
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.random() * self.jitter)
+        if method in OUTBOUND:
+            if random.random() < self.rate_limit:
+                self.faults[429] += 1
+                return 429, {"ok": False, "error_code": 429, "parameters": {"retry_after": self.retry_after},
+                             "description": f"Too Many Requests: retry after {self.retry_after}"}
+            if random.random() < self.server_errors:
+                self.faults[502] += 1
+                return 502, {"ok": False, "error_code": 502, "description": "Bad Gateway"}
+
+        handler = getattr(self, f"api_{method}", None)
+        if handler is None:
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found: method not found"}
+        result = handler(params)
+        if isinstance(result, str):
+            return 400, {"ok": False, "error_code": 400, "description": result}
+        return 200, {"ok": True, "result": result}
+
+    async def get_updates(self, params: dict) -> list:
+        offset = params.get("offset", 0)
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+        if not self.updates and params.get("timeout"):
+            self.new_update.clear()
+            try:
+                await asyncio.wait_for(self.new_update.wait(), params["timeout"])
+            except asyncio.TimeoutError:
+                pass
+        limit = params.get("limit") or 100
+        return [self.updates[i] for i in range(min(limit, len(self.updates)))]
+
+    def api_getMe(self, params: dict):
+        return self.bot_user
+
+    def drop_pending(self, params: dict):
+        if params.get("drop_pending_updates") in (True, "true", "True"):
+            self.updates.clear()
+
+    def api_deleteWebhook(self, params: dict):
+        self.drop_pending(params)
+        return True
+
+    def api_setWebhook(self, params: dict):
+        self.drop_pending(params)
+        return True
+
+    def api_getWebhookInfo(self, params: dict):
+        return {"url": "", "has_custom_certificate": False, "pending_update_count": len(self.updates)}
+
+    def api_answerCallbackQuery(self, params: dict):
+        return True
+
+    def api_sendMessage(self, params: dict):
+        chat = self.chat(params["chat_id"])
+        message_id, chat.next_id = chat.next_id, chat.next_id + 1
+        return self.show(chat, message_id, params["text"], params.get("reply_markup"))
+
+    def api_editMessageText(self, params: dict):
+        chat = self.chat(params["chat_id"])
+        message_id = params["message_id"]
+        current = chat.messages.get(message_id)
+        if current is None:
+            return "Bad Request: message to edit not found"
+        reply_markup = params.get("reply_markup")
+        if current == (params["text"], reply_markup):
+            return ("Bad Request: message is not modified: specified new message content "
+                    "and reply markup are exactly the same as a current content and reply markup of the message")
+        return self.show(chat, message_id, params["text"], reply_markup)
+
+    def show(self, chat: Chat, message_id: int, text: str, reply_markup) -> dict:
+        chat.messages[message_id] = (text, reply_markup)
+        message = self.message(chat, message_id, self.bot_user, text, reply_markup)
+        if chat.inbox is not None and reply_markup:
+            buttons = [(button["text"], button.get("callback_data"))
+                       for row in reply_markup.get("inline_keyboard", ()) for button in row]
+            if buttons:
+                chat.inbox.put_nowait(Frame(message, buttons))
+        return message
+
+
+def parse_params(content_type: str, body: bytes) -> dict:
+    """Bot API parameters from a form (what python-telegram-bot sends) or JSON body"""
+    if content_type.startswith("application/json"):
+        return json.loads(body) if body else {}
+    params = {}
+    for name, value in parse_qsl(body.decode()):
+        if name in INT_FIELDS:
+            value = int(value)
+        elif name in JSON_FIELDS:
+            value = json.loads(value)
+        params[name] = value
+    return params
+
+
+async def serve(api: FakeBotAPI, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Keep-alive HTTP/1.1 connection: POST /bot<token>/<method>"""
+    prefix = f"/bot{api.token}/"
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            request_line, *header_lines = head.decode('latin-1').split("\r\n")
+            _, target, _ = request_line.split(" ", 2)
+            headers = {}
+            for line in header_lines:
+                name, _, value = line.partition(":")
+                if value:
+                    headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+            body = await reader.readexactly(length) if length else b""
+
+            path = target.split("?", 1)[0]
+            if path.startswith(prefix):
+                status, response = await api.call(path[len(prefix):], parse_params(headers.get("content-type", ""), body))
+            else:
+                status, response = 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+
+            payload = json.dumps(response).encode()
+            writer.write(
+                f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    except asyncio.CancelledError:
+        # Shutdown with a long poll still open; nobody is waiting for the answer
+        pass
+    finally:
+        writer.close()
+
+
+# ═══════════════════════════════════════
+#             PLAYER SWARM
+# ═══════════════════════════════════════
+
+class Swarm:
+    """Virtual players and what they measured"""
+
+    def __init__(self, api: FakeBotAPI, think: float, stall: float):
+        self.api = api
+        self.think_time = think
+        self.stall = stall
+        self.running = True
+        self.finished = 0
+        self.playing = 0            # games started and not yet over
+        self.stalls = 0
+        self.latencies = []         # seconds from a tap to the next keyboard in that chat
+
+    def game_over(self):
+        self.finished += 1
+        self.playing -= 1
+
+    async def think(self):
+        await asyncio.sleep(self.think_time * random.uniform(0.5, 1.5))
+
+    async def next_frame(self, chat: Chat, tapped: float, retry) -> Frame:
+        """The next keyboard the bot shows; `retry` is called while none comes"""
+        while True:
+            try:
+                frame = await asyncio.wait_for(chat.inbox.get(), self.stall)
+            except asyncio.TimeoutError:
+                self.stalls += 1
+                retry()
+                tapped = time.monotonic()
+                continue
+            self.latencies.append(frame.at - tapped)
+            return frame
+
+    async def private_player(self, user_id: int):
+        api = self.api
+        user = {"id": user_id, "is_bot": False, "first_name": f"P{user_id}", "username": f"p{user_id}"}
+        chat = api.chat(user_id)
+        chat.inbox = asyncio.Queue()
+        last = None
+
+        def retry():
+            # Tap again, the way a person would; with nothing on screen yet, resend the command
+            if last is None:
+                api.command(user_id, user, "/buckshotpv")
+            else:
+                api.tap(user, last, random.choice(last.buttons)[1])
+
+        api.command(user_id, user, "/buckshotpv")
+        tapped = time.monotonic()
+        self.playing += 1
+        while self.running:
+            last = frame = await self.next_frame(chat, tapped, retry)
+            labels = "".join(label for label, _ in frame.buttons)
+            await self.think()
+            if "𝐒𝐇𝐎𝐎𝐓" in labels:
+                api.tap(user, frame, random.choice(frame.buttons)[1])
+            elif "𝐀𝐆𝐀𝐈𝐍" in labels:
+                self.game_over()
+                api.tap(user, frame, frame.buttons[0][1])
+                self.playing += 1
+            tapped = time.monotonic()
+
+    async def group_pair(self, index: int):
+        api = self.api
+        chat_id = -1_000_000_000_000 - index
+        host = {"id": 2 * index + 1, "is_bot": False, "first_name": "Host", "username": f"h{index}"}
+        guest = {"id": 2 * index + 2, "is_bot": False, "first_name": "Guest", "username": f"g{index}"}
+        chat = api.chat(chat_id)
+        chat.inbox = asyncio.Queue()
+        last = None
+
+        def turn_of(frame: Frame) -> dict:
+            turn_line = frame.text.rsplit("ᴛᴜʀɴ", 1)[0].rsplit("\n", 1)[-1]
+            return host if f"@{host['username']}" in turn_line else guest
+
+        def retry():
+            if last is None or "𝐍𝐄𝐖" in last.buttons[0][0]:
+                api.command(chat_id, host, "/buckshot")
+            elif "𝐉𝐎𝐈𝐍" in last.buttons[0][0]:
+                api.tap(guest, last, last.buttons[0][1])
+            else:
+                api.tap(turn_of(last), last, random.choice(last.buttons)[1])
+
+        api.command(chat_id, host, "/buckshot")
+        tapped = time.monotonic()
+        self.playing += 1
+        while self.running:
+            last = frame = await self.next_frame(chat, tapped, retry)
+            labels = "".join(label for label, _ in frame.buttons)
+            await self.think()
+            if "𝐉𝐎𝐈𝐍" in labels:
+                api.tap(guest, frame, frame.buttons[0][1])
+            elif "𝐒𝐇𝐎𝐎𝐓" in labels:
+                api.tap(turn_of(frame), frame, random.choice(frame.buttons)[1])
+            elif "𝐍𝐄𝐖" in labels:
+                self.game_over()
+                api.command(chat_id, host, "/buckshot")
+                self.playing += 1
+            tapped = time.monotonic()
+
+
+def percentile_ms(samples: list, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def start_bot(args, port: int, folder: str) -> subprocess.Popen:
+    # A fresh folder per run for the database and shutdown snapshot, so no
+    # games from an earlier run come back; restarts within the run share it
+    env = dict(os.environ, BOT_TOKEN=args.token, BOT_API_URL=f"http://127.0.0.1:{port}",
+               UPDATE_MODE="polling", PORT=str(args.bot_port),
+               DB_PATH=os.path.join(folder, "buckshot.db"), SNAPSHOT_PATH=os.path.join(folder, "buckshot.snapshot"))
+    env.pop("WEBHOOK_URL", None)
+    if not args.keep_limits:
+        # Throttling is this server's job here (--rate-limit), not the bot's
+        env.update(PRIVATE_EDIT_RATE="1e9", GROUP_EDIT_RATE="1e9", GLOBAL_EDIT_RATE="1e9", CHAT_EDIT_BURST="1e9")
+    for assignment in args.bot_env:
+        name, _, value = assignment.partition("=")
+        env[name] = value
+    log = open(args.bot_log, 'ab') if args.bot_log else subprocess.DEVNULL
+    return subprocess.Popen([sys.executable, "main.py"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def stop_bot(bot: subprocess.Popen) -> float:
+    """SIGTERM the bot and wait for it to exit, serving its last calls meanwhile; returns the seconds it took"""
+    start = time.monotonic()
+    bot.terminate()
+    await asyncio.to_thread(bot.wait)
+    return time.monotonic() - start
+
+
+async def restart_bot(args, api: FakeBotAPI, port: int, folder: str, bot: subprocess.Popen) -> tuple:
+    """Stop the bot the way a deploy would and start a new one on the same data.
+
+    Returns (new bot, seconds to exit, seconds until the new one polls).
+    """
+    stopped = await stop_bot(bot)
+    start = time.monotonic()
+    polls = api.calls.get("getUpdates", 0)
+    bot = start_bot(args, port, folder)
+    while api.calls.get("getUpdates", 0) == polls and bot.poll() is None:
+        await asyncio.sleep(0.05)
+    return bot, stopped, time.monotonic() - start
+
+
+async def run(args) -> int:
+    api = FakeBotAPI(args.token, args.latency, args.jitter, args.rate_limit, args.retry_after, args.server_errors)
+    server = await asyncio.start_server(lambda r, w: serve(api, r, w), args.host, args.port)
+    port = server.sockets[0].getsockname()[1]
+    print(f"fake Bot API on http://{args.host}:{port}  (token {args.token})")
+    if args.serve_only:
+        async with server:
+            await server.serve_forever()
+
+    folder = tempfile.mkdtemp()
+    bot = start_bot(args, port, folder)
+    swarm = Swarm(api, args.think, args.stall)
+    while "getUpdates" not in api.calls:
+        if bot.poll() is not None:
+            print(f"bot exited with {bot.returncode} before polling")
+            return 1
+        await asyncio.sleep(0.1)
+    rss_start = rss_peak = rss_mb(bot.pid)
+    print(f"bot pid {bot.pid} polling, RSS {rss_start:.1f} MB; "
+          f"{args.private:,} private players, {args.groups:,} group pairs for {args.duration:.0f}s")
+
+    players = [swarm.private_player(1_000_000 + i) for i in range(args.private)]
+    players += [swarm.group_pair(i) for i in range(args.groups)]
+    random.shuffle(players)
+    tasks = []
+    started = time.monotonic()
+    for i, player in enumerate(players):
+        tasks.append(asyncio.create_task(player))
+        if args.ramp and i % 100 == 99:
+            await asyncio.sleep(args.ramp * 100 / len(players))
+
+    finished, calls = 0, 0
+    last = last_restart = time.monotonic()
+    restarts = []
+    while time.monotonic() - started < args.duration and bot.poll() is None:
+        await asyncio.sleep(args.report)
+        if args.restart_every and time.monotonic() - last_restart >= args.restart_every:
+            bot, stopped, back = await restart_bot(args, api, port, folder, bot)
+            restarts.append((stopped, back))
+            last_restart = time.monotonic()
+            print(f"        restart {len(restarts)}: old bot exited in {stopped:.1f}s, new one polling {back:.1f}s later")
+        now = time.monotonic()
+        window, swarm.latencies = swarm.latencies, []
+        rss = rss_mb(bot.pid)
+        rss_peak = max(rss_peak, rss)
+        total_calls = sum(api.calls.values())
+        print(f"{now - started:6.0f}s  games/s {(swarm.finished - finished) / (now - last):7.1f}  "
+              f"playing {swarm.playing:6,}  tap->edit p50 {percentile_ms(window, 0.5):6.0f}ms "
+              f"p99 {percentile_ms(window, 0.99):6.0f}ms  API calls/s {(total_calls - calls) / (now - last):7.0f}  "
+              f"429 {api.faults[429]:,}  502 {api.faults[502]:,}  stalls {swarm.stalls:,}  RSS {rss:7.1f} MB")
+        finished, calls, last = swarm.finished, total_calls, now
+
+    swarm.running = False
+    for task in tasks:
+        task.cancel()
+    elapsed = time.monotonic() - started
+    rss_end = rss_mb(bot.pid) if bot.poll() is None else 0.0
+    await stop_bot(bot)
+    server.close()
+    api.new_update.set()
+
+    print(f"\n{swarm.finished:,} games in {elapsed:.0f}s ({swarm.finished / elapsed:.1f}/s), {swarm.stalls:,} stalls")
+    print("calls    " + "  ".join(f"{method} {count:,}" for method, count in sorted(api.calls.items())))
+    print(f"bot RSS  start {rss_start:.1f} MB  peak {rss_peak:.1f} MB  end {rss_end:.1f} MB  "
+          f"growth {rss_end - rss_start:+.1f} MB")
+    if restarts:
+        print(f"restarts {len(restarts)}  exit max {max(s for s, _ in restarts):.1f}s  "
+              f"back polling max {max(b for _, b in restarts):.1f}s")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API and player swarm for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--token", default="123456:fake")
+    parser.add_argument("--serve-only", action="store_true", help="only run the API; start the bot yourself")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every call")
+    parser.add_argument("--jitter", type=float, default=0.05, help="up to this many more seconds, at random")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="share of outbound calls answered 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="seconds a 429 asks the bot to wait")
+    parser.add_argument("--server-errors", type=float, default=0.0, help="share of outbound calls answered 502")
+    parser.add_argument("--private", type=int, default=200, help="private players, one game at a time each")
+    parser.add_argument("--groups", type=int, default=50, help="pairs playing in their own group")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which players join")
+    parser.add_argument("--think", type=float, default=1.0, help="mean seconds a player takes per tap")
+    parser.add_argument("--stall", type=float, default=30, help="seconds without a keyboard before tapping again")
+    parser.add_argument("--report", type=float, default=5, help="seconds between progress lines")
+    parser.add_argument("--restart-every", type=float, default=0,
+                        help="SIGTERM the bot and start a new one this often (seconds), like a deploy")
+    parser.add_argument("--bot-port", type=int, default=8099, help="the bot's own HTTP port")
+    parser.add_argument("--bot-log", help="append the bot's output here (default: discarded)")
+    parser.add_argument("--keep-limits", action="store_true",
+                        help="keep the bot's Telegram edit budgets (lifted by default)")
+    parser.add_argument("--bot-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the bot, e.g. ANIMATION_SPEED=0")
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
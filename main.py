@@ -1,24 +1,196 @@
+import time
+
+# Taken before the imports below so STARTUP_PROFILE can report them
+IMPORT_STARTED = time.perf_counter()
+
 import os
+import gc
+import json
 import asyncio
+import base64
+import binascii
+import bisect
+import contextvars
 import random
+import string
+import heapq
+import importlib.util
 import logging
+import logging.handlers
+import math
+import multiprocessing
+import signal
+import sqlite3
+import struct
+import zlib
+from collections import OrderedDict
 from datetime import datetime
+from functools import lru_cache, partial, wraps
+from queue import SimpleQueue
 from threading import Thread
-from flask import Flask
+
+import httpx
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, TypeHandler
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter, TelegramError, TimedOut
+from telegram.request import HTTPXRequest
+
+import engine
+import eventlog
 
 # Config
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
 TOKEN = os.getenv("BOT_TOKEN")
-
-# In-Memory Game Storage
-private_games = {}
-group_games = {}
+# Bot API server; point it at fake_telegram.py to load-test without Telegram
+BOT_API_URL = os.getenv("BOT_API_URL", "https://api.telegram.org").rstrip("/")
+
+# HTTP surface (health, readiness, metrics, webhook): "flask" runs Werkzeug in a
+# thread, "asyncio" serves it from the bot's own event loop
+HTTP_SERVER = os.getenv("HTTP_SERVER", "flask")
+PORT = int(os.getenv("PORT", "8000"))
+# /ready fails once the last Bot API call failed, or none succeeded for this long
+# (an idle bot calls getMe every third of it, so quiet webhook hours stay ready)
+READY_MAX_SILENCE = float(os.getenv("READY_MAX_SILENCE", "300"))
+
+# Update ingestion: webhook when a public URL is configured, long-polling otherwise.
+# UPDATE_MODE=webhook without WEBHOOK_URL serves the endpoint without registering
+# it with Telegram (handy for POSTing recorded updates locally).
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = "/" + os.getenv("WEBHOOK_PATH", "telegram").strip("/")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+UPDATE_MODE = os.getenv("UPDATE_MODE", "webhook" if WEBHOOK_URL else "polling")
+# Updates handled at once. Handlers only validate a tap and queue it for the
+# game's actor before their first await, so they can overlap; 1 = in order
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "1"))
+
+# Set by main() once the Application is running; read by the HTTP server
+bot_app = None
+bot_loop = None
+# Set once shutdown starts: new games are refused and animations skip their pauses
+draining = False
+
+# Monotonic times of the last update handled and the last Bot API call outcomes
+liveness = {'update': 0.0, 'api_ok': 0.0, 'api_error': 0.0}
+
+# Log how long imports, building the Application, initialize() and the first
+# poll took, once the first update has been handled ("1" to enable)
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "0") == "1"
+
+# Per-update traces, written as OTLP JSON lines to TRACE_FILE (rotated at
+# TRACE_MAX_BYTES, TRACE_BACKUPS old files kept); empty disables tracing.
+# TRACE_SAMPLE of updates are written, plus every update that spent more
+# than TRACE_SLOW_MS outside animation pauses, which is also logged in full
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_SAMPLE = float(os.getenv("TRACE_SAMPLE", "0.01"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "1000"))
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(50 << 20)))
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", "5"))
+
+# In-Memory Game Storage (private_games is a GameStore, created below)
+group_games = {}    # game_id -> game
+chat_games = {}     # chat_id -> set of that chat's game ids
+
+# One actor per live game, keyed "pv:<user_id>" / "gp:<game_id>"
+game_actors = {}
+
+# Private game store bounds: total games kept, seconds a finished game is
+# kept for its Play Again button, seconds before an abandoned game is dropped
+MAX_PRIVATE_GAMES = int(os.getenv("MAX_PRIVATE_GAMES", "200000"))
+FINISHED_GAME_GRACE = float(os.getenv("FINISHED_GAME_GRACE", "600"))
+IDLE_GAME_TIMEOUT = float(os.getenv("IDLE_GAME_TIMEOUT", "3600"))
+STORE_SWEEP_INTERVAL = float(os.getenv("STORE_SWEEP_INTERVAL", "60"))
+
+# Group deadlines (seconds): a player who sits on their turn either forfeits
+# or has the gun fired at their opponent for them; unfilled lobbies close
+TURN_TIMEOUT = float(os.getenv("TURN_TIMEOUT", "90"))
+TURN_TIMEOUT_ACTION = os.getenv("TURN_TIMEOUT_ACTION", "forfeit")  # forfeit | shoot
+LOBBY_TIMEOUT = float(os.getenv("LOBBY_TIMEOUT", "300"))
+TIMER_TICK = float(os.getenv("TIMER_TICK", "1"))
+
+# Sharded mode: WORKERS > 1 runs a front process that receives updates and
+# routes each one by game key to one of WORKERS worker processes. Player stats
+# and /top stay in the front (stats in DB_PATH), the games in DB_PATH.<worker>
+WORKERS = int(os.getenv("WORKERS", "1"))
+# This process's shard (set in worker processes)
+WORKER_INDEX = 0
+WORKER_COUNT = 1
+
+# Durable copy of live games (SQLite, WAL). Empty DB_PATH keeps games in memory only
+DB_PATH = os.getenv("DB_PATH", "buckshot.db")
+FLUSH_INTERVAL = float(os.getenv("FLUSH_INTERVAL", "0.5"))
+# Append-only binary log of every deal, shot and game end (see eventlog.py and
+# replay.py); empty disables it. Buffered events are written every EVENT_LOG_FLUSH seconds
+EVENT_LOG = os.getenv("EVENT_LOG", "")
+EVENT_LOG_FLUSH = float(os.getenv("EVENT_LOG_FLUSH", "0.2"))
+# Seconds of the log's tail replayed over the snapshot at startup. Rows are
+# at most FLUSH_INTERVAL behind the log, so this only needs a margin. Quiet
+# games whose row is still unwritten are checkpointed every third of it
+EVENT_LOG_TAIL = float(os.getenv("EVENT_LOG_TAIL", "60"))
+# Graceful shutdown on SIGTERM/SIGINT: new games are refused, moves already
+# running finish without their pauses for up to DRAIN_TIMEOUT seconds, then
+# every live game is written to SNAPSHOT_PATH. The next boot restores it,
+# repaints boards a cut-off move left behind and deletes it (empty = no snapshot)
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "8"))
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "buckshot.snapshot")
+
+# Players listed by /top, per group chat and across all games
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "10"))
+
+# Lobbies + matches allowed at once in a single group chat
+MAX_GAMES_PER_CHAT = int(os.getenv("MAX_GAMES_PER_CHAT", "20"))
+GAME_ID_ALPHABET = string.ascii_lowercase + string.digits
+
+# Dealer: "optimal" plays from the solved policy table, "heuristic" is the
+# old rule of thumb. DEALER_SKILL is the share of optimal moves, the rest
+# are coin flips. DEALER_TABLE caches the solved table on disk
+DEALER_POLICY = os.getenv("DEALER_POLICY", "optimal")
+DEALER_SKILL = float(os.getenv("DEALER_SKILL", "1"))
+DEALER_TABLE = os.getenv("DEALER_TABLE", "")
+
+# Multiplier for the pauses between animation frames (0 = no pauses)
+ANIMATION_SPEED = float(os.getenv("ANIMATION_SPEED", "1"))
+# Rendered frames kept per builder (boards are keyed on game state, not names)
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "4096"))
+# Seconds an actor with an empty mailbox stays alive before retiring
+ACTOR_IDLE_TIMEOUT = float(os.getenv("ACTOR_IDLE_TIMEOUT", "300"))
+
+# Outbound edit budgets (edits/second). Telegram allows roughly one message
+# per second in a private chat, 20 per minute in a group and 30/s overall.
+PRIVATE_EDIT_RATE = float(os.getenv("PRIVATE_EDIT_RATE", "1"))
+GROUP_EDIT_RATE = float(os.getenv("GROUP_EDIT_RATE", "0.33"))
+CHAT_EDIT_BURST = float(os.getenv("CHAT_EDIT_BURST", "3"))
+GLOBAL_EDIT_RATE = float(os.getenv("GLOBAL_EDIT_RATE", "30"))
+# Messages whose last frame is remembered, so an identical edit is skipped
+SHOWN_FRAMES = int(os.getenv("SHOWN_FRAMES", "100000"))
+# Fast play sends a move as one frame (recap lines above the board). /fast
+# toggles it per chat; every game plays fast while FAST_PLAY_BACKLOG or more
+# messages have edits queued (0 = only on request)
+FAST_PLAY_BACKLOG = int(os.getenv("FAST_PLAY_BACKLOG", "100"))
+
+# Bot API connections. Outbound calls (sends, edits, answers) and getUpdates
+# have separate pools; a call made while its pool is busy waits up to
+# API_POOL_TIMEOUT seconds for a connection. Idle connections are kept open
+# API_KEEPALIVE seconds. API_HTTP_VERSION=2 needs the h2 package
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "32"))
+UPDATES_POOL_SIZE = int(os.getenv("UPDATES_POOL_SIZE", "1"))
+API_KEEPALIVE = float(os.getenv("API_KEEPALIVE", "30"))
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "5"))
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "5"))
+API_WRITE_TIMEOUT = float(os.getenv("API_WRITE_TIMEOUT", "5"))
+API_POOL_TIMEOUT = float(os.getenv("API_POOL_TIMEOUT", "1"))
+API_HTTP_VERSION = os.getenv("API_HTTP_VERSION", "1.1")
+
+# Frame priorities: cosmetic frames are dropped when a chat is over budget,
+# boards (buttons / game over) always go out and win over everything else
+PRIO_COSMETIC = 0
+PRIO_FRAME = 1
+PRIO_BOARD = 2
+
+# Created in main() once the bot exists; every game message edit goes through it
+edit_scheduler = None
 
 # SFX Text Effects
 SFX = {
@@ -38,29 +210,2015 @@ BLANK_SHELL = "💨"
 UNKNOWN_SHELL = "❓"
 
 
-@app.route('/')
-def health():
-    return "🔫 BUCKSHOT ROULETTE BOT IS LIVE"
+# ═══════════════════════════════════════
+#                HTTP
+# ═══════════════════════════════════════
+
+HEALTH_TEXT = "🔫 BUCKSHOT ROULETTE BOT IS LIVE"
+METRICS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def readiness() -> tuple:
+    """(ready, details) from the running bot's last update and Bot API outcomes"""
+    now = time.monotonic()
+    api_ok, api_error, update = liveness['api_ok'], liveness['api_error'], liveness['update']
+    ready = bot_app is not None and api_ok > api_error and now - api_ok < READY_MAX_SILENCE
+    details = {
+        'ready': ready,
+        'last_update_age': round(now - update, 1) if update else None,
+        'last_api_ok_age': round(now - api_ok, 1) if api_ok else None,
+        'last_api_error_age': round(now - api_error, 1) if api_error else None,
+    }
+    return ready, details
+
+
+async def probe_api(bot):
+    """Call getMe whenever no Bot API call succeeded for a third of READY_MAX_SILENCE"""
+    while True:
+        await asyncio.sleep(READY_MAX_SILENCE / 3)
+        if time.monotonic() - liveness['api_ok'] > READY_MAX_SILENCE / 3:
+            try:
+                await bot.get_me()
+            except TelegramError:
+                pass    # MeteredRequest has marked the failure; /ready reports it
+
+
+def check_webhook(secret, data) -> tuple:
+    """(status, text) for a webhook POST; status 200 means `data` should be queued"""
+    if UPDATE_MODE != "webhook":
+        return 404, "webhook disabled"
+
+    if WEBHOOK_SECRET and secret != WEBHOOK_SECRET:
+        return 403, "forbidden"
+
+    if bot_app is None or bot_loop is None:
+        return 503, "stopping" if draining else "starting"
+
+    if not isinstance(data, dict):
+        return 400, "bad update"
+
+    return 200, "ok"
+
+
+def parse_update(data: dict):
+    """The Update a webhook body holds, or None if it is not one"""
+    try:
+        return Update.de_json(data, bot_app.bot)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def create_flask_app():
+    """Flask app for HTTP_SERVER=flask; Flask is only imported when this runs"""
+    from flask import Flask, request
+
+    app = Flask(__name__)
+
+    @app.route('/')
+    def health():
+        return HEALTH_TEXT
+
+    @app.route('/ready')
+    def ready():
+        ok, details = readiness()
+        return details, 200 if ok else 503
+
+    @app.route(WEBHOOK_PATH, methods=['POST'])
+    def webhook():
+        """Receive a Telegram update and hand it to the bot's update queue"""
+        data = request.get_json(force=True, silent=True)
+        status, text = check_webhook(request.headers.get("X-Telegram-Bot-Api-Secret-Token"), data)
+        update = parse_update(data) if status == 200 else None
+        if update is not None:
+            bot_loop.call_soon_threadsafe(bot_app.update_queue.put_nowait, update)
+        elif status == 200:
+            status, text = 400, "bad update"
+        return text, status
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus text exposition"""
+        return render_metrics(), 200, {'Content-Type': METRICS_TYPE}
+
+    return app
 
 
 def run_flask():
     from werkzeug.serving import make_server
-    server = make_server('0.0.0.0', int(os.environ.get("PORT", 8000)), app, threaded=True)
+    server = make_server('0.0.0.0', PORT, create_flask_app(), threaded=True)
     server.serve_forever()
 
 
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+                405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+# Largest request body accepted (Telegram updates are a few KB)
+MAX_HTTP_BODY = 1 << 20
+
+
+def route_http(method: str, path: str, headers: dict, body: bytes) -> tuple:
+    """(status, content type, body) for one request to the asyncio server"""
+    if path == WEBHOOK_PATH and method == "POST":
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        status, text = check_webhook(headers.get("x-telegram-bot-api-secret-token"), data)
+        update = parse_update(data) if status == 200 else None
+        if update is not None:
+            bot_app.update_queue.put_nowait(update)
+        elif status == 200:
+            status, text = 400, "bad update"
+        return status, "text/plain; charset=utf-8", text.encode()
+
+    if method != "GET":
+        return 405, "text/plain; charset=utf-8", b"method not allowed"
+    if path == "/":
+        return 200, "text/html; charset=utf-8", HEALTH_TEXT.encode()
+    if path == "/ready":
+        ok, details = readiness()
+        return 200 if ok else 503, "application/json", json.dumps(details).encode()
+    if path == "/metrics":
+        return 200, METRICS_TYPE, render_metrics().encode()
+    return 404, "text/plain; charset=utf-8", b"not found"
+
+
+async def handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """One HTTP/1.1 request per connection, answered from the event loop"""
+    try:
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+            request_line, *header_lines = head.decode('latin-1').split("\r\n")
+            method, target, _ = request_line.split(" ", 2)
+            headers = {}
+            for line in header_lines:
+                name, _, value = line.partition(":")
+                if value:
+                    headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get("content-length", 0))
+            if length > MAX_HTTP_BODY:
+                status, content_type, payload = 413, "text/plain; charset=utf-8", b"too large"
+            else:
+                body = await asyncio.wait_for(reader.readexactly(length), 10) if length else b""
+                status, content_type, payload = route_http(method, target.split("?", 1)[0], headers, body)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError):
+            status, content_type, payload = 400, "text/plain; charset=utf-8", b"bad request"
+
+        writer.write(
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n\r\n".encode() + payload
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_http():
+    """Start the configured HTTP server; returns the asyncio server, or None for Flask"""
+    if HTTP_SERVER == "asyncio":
+        server = await asyncio.start_server(handle_http, '0.0.0.0', PORT)
+        logger.info(f"🌐 HTTP on :{PORT} (asyncio)")
+        return server
+
+    Thread(target=run_flask, daemon=True).start()
+    return None
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
 def get_hp_display(hp: int, max_hp: int = 3) -> str:
     """Generate HP display with hearts"""
     return HEART * hp + DEAD_HEART * (max_hp - hp)
 
 
-def generate_shells() -> tuple:
-    """Generate random shells for the shotgun"""
-    live = random.randint(1, 4)
-    blank = random.randint(1, 4)
-    shells = ['L'] * live + ['B'] * blank
-    random.shuffle(shells)
-    return ''.join(shells), live, blank
+# ═══════════════════════════════════════
+#               METRICS
+# ═══════════════════════════════════════
+
+class Counter:
+    """Monotonic count per label value.
+
+    Only the event loop writes; the Flask thread renders from a copy
+    (dict.copy() runs under the GIL), so neither side takes a lock.
+    """
+
+    def __init__(self, name: str, help: str, label: str):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = {}
+
+    def inc(self, value: str, amount: int = 1):
+        self.values[value] = self.values.get(value, 0) + amount
+
+    def render(self, lines: list):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} counter")
+        for value, count in sorted(self.values.copy().items()):
+            lines.append(f'{self.name}{{{self.label}="{value}"}} {count}')
+
+
+class Histogram:
+    """Latency distribution per label value, with fixed buckets (seconds).
+
+    Each series is a list of per-bucket counts, then the +Inf count,
+    then the running sum; observe() bumps two slots of it.
+    """
+
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name: str, help: str, label: str, buckets: tuple = BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value: str, seconds: float):
+        series = self.series.get(value)
+        if series is None:
+            series = self.series[value] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, seconds)] += 1
+        series[-1] += seconds
+
+    def render(self, lines: list):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} histogram")
+        for value, series in sorted(self.series.copy().items()):
+            series = list(series)
+            label = f'{self.label}="{value}"'
+            total = 0
+            for bound, count in zip(self.buckets, series):
+                total += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {total}')
+            total += series[-2]
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {total}')
+            lines.append(f'{self.name}_sum{{{label}}} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{{{label}}} {total}')
+
+
+HANDLER_SECONDS = Histogram("buckshot_handler_seconds", "Callback handler latency by button kind", "kind")
+API_SECONDS = Histogram("buckshot_api_seconds", "Telegram Bot API call latency by method", "method")
+API_ERRORS = Counter("buckshot_api_errors_total", "Failed Telegram Bot API calls by method", "method")
+API_RETRY_AFTER = Counter("buckshot_api_retry_after_total", "Telegram 429 (RetryAfter) answers by method", "method")
+GAMES_STARTED = Counter("buckshot_games_started_total", "Games started", "kind")
+GAMES_FINISHED = Counter("buckshot_games_finished_total", "Games finished", "kind")
+API_POOL_WAIT = Histogram("buckshot_api_pool_wait_seconds", "Time Bot API calls waited for a connection", "pool")
+API_POOL_TIMEOUTS = Counter("buckshot_api_pool_timeouts_total", "Bot API calls that never got a connection", "pool")
+FAST_MOVES = Counter("buckshot_fast_moves_total", "Moves played as a single frame, by why", "reason")
+SLOW_UPDATES = Counter("buckshot_slow_updates_total", "Traced updates over TRACE_SLOW_MS outside pauses", "handler")
+
+# Live request objects by pool name, for the pool gauges
+api_pools = {}
+
+@lru_cache(maxsize=None)
+def tls_context():
+    """TLS context shared by every Bot API client, so the CA bundle is parsed once"""
+    return httpx.create_ssl_context()
+
+
+class MeteredRequest(HTTPXRequest):
+    """HTTPXRequest that times every Bot API call and counts errors and 429s.
+
+    Calls in flight are capped at the pool size here rather than inside
+    httpx, so the time a call spends waiting for a connection is measured.
+    """
+
+    def __init__(self, pool: str = "api", connection_pool_size: int = 1,
+                 keepalive: float = API_KEEPALIVE, pool_timeout: float = API_POOL_TIMEOUT, **kwargs):
+        self.pool = pool
+        self.size = connection_pool_size
+        self.keepalive = keepalive
+        self.wait_timeout = pool_timeout
+        self.slots = asyncio.Semaphore(connection_pool_size)
+        self.busy = 0
+        self.waiting = 0
+        super().__init__(connection_pool_size=connection_pool_size, pool_timeout=pool_timeout, **kwargs)
+        api_pools[pool] = self
+
+    def _build_client(self) -> httpx.AsyncClient:
+        kwargs = dict(self._client_kwargs)
+        kwargs['limits'] = httpx.Limits(max_connections=self.size, max_keepalive_connections=self.size,
+                                        keepalive_expiry=self.keepalive)
+        return httpx.AsyncClient(**kwargs, verify=tls_context())
+
+    async def acquire(self):
+        """Take a connection slot, waiting at most the pool timeout"""
+        if not self.slots.locked():
+            await self.slots.acquire()
+            self.busy += 1
+            return
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            with child_span("pool wait", pool=self.pool):
+                await asyncio.wait_for(self.slots.acquire(), self.wait_timeout)
+            self.busy += 1
+        except asyncio.TimeoutError:
+            API_POOL_TIMEOUTS.inc(self.pool)
+            raise TimedOut(f"Pool timeout: all {self.size} {self.pool} connections are busy") from None
+        finally:
+            self.waiting -= 1
+            API_POOL_WAIT.observe(self.pool, time.perf_counter() - start)
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        if api_method == "getUpdates":
+            startup.once("first poll")
+        with child_span(api_method, SPAN_CLIENT) as span:
+            await self.acquire()
+            start = time.perf_counter()
+            try:
+                code, payload = await super().do_request(url, method, *args, **kwargs)
+            except Exception:
+                API_ERRORS.inc(api_method)
+                liveness['api_error'] = time.monotonic()
+                raise
+            finally:
+                self.busy -= 1
+                self.slots.release()
+                API_SECONDS.observe(api_method, time.perf_counter() - start)
+            span.set('http.status_code', code)
+        if code == 429:
+            API_RETRY_AFTER.inc(api_method)
+        elif code >= 400:
+            API_ERRORS.inc(api_method)
+        # Any answer from Telegram, even an error or a 429, means the API is reachable
+        liveness['api_ok'] = time.monotonic()
+        return code, payload
+
+
+def api_request(pool: str) -> MeteredRequest:
+    """Request object for the "api" (outbound calls) or "updates" (getUpdates) pool"""
+    http_version = API_HTTP_VERSION
+    if http_version != "1.1" and importlib.util.find_spec("h2") is None:
+        logger.warning(f"⚠️ API_HTTP_VERSION={http_version} needs the h2 package, using HTTP/1.1")
+        http_version = "1.1"
+    return MeteredRequest(
+        pool,
+        connection_pool_size=API_POOL_SIZE if pool == "api" else UPDATES_POOL_SIZE,
+        connect_timeout=API_CONNECT_TIMEOUT,
+        read_timeout=API_READ_TIMEOUT,
+        write_timeout=API_WRITE_TIMEOUT,
+        http_version=http_version,
+    )
+
+
+def snapshot(values) -> list:
+    """Copy of a live collection taken from the Flask thread; retried if it changed mid-copy"""
+    for _ in range(3):
+        try:
+            return list(values)
+        except RuntimeError:
+            continue
+    return []
+
+
+def render_metrics() -> str:
+    lines = [
+        "# HELP buckshot_games Games in memory by kind and status",
+        "# TYPE buckshot_games gauge",
+    ]
+    for kind, games in (("private", private_games.games.values()), ("group", group_games.values())):
+        counts = dict.fromkeys(('waiting', 'playing', 'finished'), 0)
+        for game in snapshot(games):
+            counts[game.status] = counts.get(game.status, 0) + 1
+        for status, count in counts.items():
+            lines.append(f'buckshot_games{{kind="{kind}",status="{status}"}} {count}')
+
+    for metric in (GAMES_STARTED, GAMES_FINISHED, HANDLER_SECONDS, API_SECONDS, API_ERRORS, API_RETRY_AFTER,
+                   API_POOL_WAIT, API_POOL_TIMEOUTS, FAST_MOVES, SLOW_UPDATES):
+        metric.render(lines)
+
+    lines.append("# HELP buckshot_api_pool_connections Bot API connection slots by pool and state")
+    lines.append("# TYPE buckshot_api_pool_connections gauge")
+    for pool, request in sorted(api_pools.copy().items()):
+        lines.append(f'buckshot_api_pool_connections{{pool="{pool}",state="busy"}} {request.busy}')
+        lines.append(f'buckshot_api_pool_connections{{pool="{pool}",state="free"}} {request.size - request.busy}')
+        lines.append(f'buckshot_api_pool_connections{{pool="{pool}",state="waiting"}} {request.waiting}')
+
+    if edit_scheduler is not None:
+        lines.append("# HELP buckshot_edits_total Game message edits by outcome")
+        lines.append("# TYPE buckshot_edits_total counter")
+        for outcome, count in edit_scheduler.stats.copy().items():
+            lines.append(f'buckshot_edits_total{{outcome="{outcome}"}} {count}')
+
+    lines.append("# HELP buckshot_evictions_total Private games dropped from memory by reason")
+    lines.append("# TYPE buckshot_evictions_total counter")
+    for reason, count in private_games.evictions.copy().items():
+        lines.append(f'buckshot_evictions_total{{reason="{reason}"}} {count}')
+
+    return "\n".join(lines) + "\n"
+
+
+# ═══════════════════════════════════════
+#               TRACING
+# ═══════════════════════════════════════
+
+# OTLP span kinds
+SPAN_INTERNAL = 1
+SPAN_SERVER = 2
+SPAN_CLIENT = 3
+# Spans kept per trace; any past this still count towards the trace's end
+TRACE_MAX_SPANS = 512
+# perf_counter_ns() + TRACE_EPOCH_NS = Unix time in ns
+TRACE_EPOCH_NS = time.time_ns() - time.perf_counter_ns()
+
+# The span the running code belongs to (None outside traced updates)
+active_span = contextvars.ContextVar("active_span", default=None)
+
+
+class Span:
+    """One timed step of a traced update.
+
+    As a context manager it is the active span while its block runs and
+    ends when the block exits; otherwise end() closes it.
+    """
+
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'start', 'stop', 'attributes', 'error', 'token')
+
+    def __init__(self, trace, parent_id: int, name: str, kind: int = SPAN_INTERNAL,
+                 attributes: dict = None, start: int = None):
+        self.trace = trace
+        self.span_id = random.getrandbits(64) or 1
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = start or time.perf_counter_ns()
+        self.stop = None
+        self.attributes = attributes or {}
+        self.error = None
+        self.token = None
+        trace.opened(self)
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def mark(self, key: str):
+        """Set `key` to the milliseconds since the span started"""
+        self.attributes[key] = round((time.perf_counter_ns() - self.start) / 1e6, 1)
+
+    def activate(self):
+        """Make this the active span for the rest of the current task"""
+        active_span.set(self)
+
+    def end(self, error: str = None):
+        if self.stop is None:
+            self.stop = time.perf_counter_ns()
+            self.error = error
+            self.trace.closed(self)
+
+    def __enter__(self):
+        self.token = active_span.set(self)
+        return self
+
+    def __exit__(self, kind, error, tb):
+        active_span.reset(self.token)
+        self.end(None if kind is None else f"{kind.__name__}: {error}".rstrip(": "))
+
+
+class NullSpan:
+    """Stands in for a span outside traced updates; code run under it is untraced"""
+
+    __slots__ = ()
+
+    def set(self, key: str, value):
+        pass
+
+    def mark(self, key: str):
+        pass
+
+    def activate(self):
+        active_span.set(None)
+
+    def end(self, error: str = None):
+        pass
+
+    def __enter__(self):
+        # Tasks inherit the span that was active where they were created,
+        # so a long-lived task could otherwise add to a finished update
+        active_span.set(None)
+        return self
+
+    def __exit__(self, kind, error, tb):
+        pass
+
+
+NO_SPAN = NullSpan()
+
+
+class Trace:
+    """Every span of one update; it is done once its last open span ends"""
+
+    __slots__ = ('trace_id', 'spans', 'open', 'sleep_ns', 'done')
+
+    def __init__(self):
+        self.trace_id = random.getrandbits(128) or 1
+        self.spans = []
+        self.open = 0
+        self.sleep_ns = 0
+        self.done = False
+
+    def opened(self, span: Span):
+        self.open += 1
+        if len(self.spans) < TRACE_MAX_SPANS:
+            self.spans.append(span)
+
+    def closed(self, span: Span):
+        if span.name == "sleep":
+            self.sleep_ns += span.stop - span.start
+        self.open -= 1
+        if not self.open:
+            self.done = True
+            tracer.finish(self)
+
+
+def child_span(name: str, kind: int = SPAN_INTERNAL, **attributes):
+    """New span under the active one, or NO_SPAN outside a traced update"""
+    parent = active_span.get()
+    if parent is None or parent.trace.done:
+        return NO_SPAN
+    return Span(parent.trace, parent.span_id, name, kind, attributes)
+
+
+def current_span():
+    return active_span.get() or NO_SPAN
+
+
+def otlp_attributes(values: dict) -> list:
+    attributes = []
+    for key, value in values.items():
+        if isinstance(value, bool):
+            typed = {'boolValue': value}
+        elif isinstance(value, int):
+            typed = {'intValue': str(value)}
+        elif isinstance(value, float):
+            typed = {'doubleValue': value}
+        else:
+            typed = {'stringValue': str(value)}
+        attributes.append({'key': key, 'value': typed})
+    return attributes
+
+
+def format_trace(trace: Trace) -> str:
+    """Indented span tree: start offset from the update's arrival, duration, attributes"""
+    root = trace.spans[0]
+    children = {}
+    for span in trace.spans[1:]:
+        children.setdefault(span.parent_id, []).append(span)
+
+    lines = []
+
+    def walk(span: Span, depth: int):
+        details = " ".join(f"{key}={value}" for key, value in span.attributes.items())
+        error = f" ❌ {span.error}" if span.error else ""
+        lines.append(f"{'  ' * depth}{span.name}  +{(span.start - root.start) / 1e6:.0f}ms "
+                     f"{(span.stop - span.start) / 1e6:.1f}ms  {details}{error}".rstrip())
+        for child in children.get(span.span_id, ()):
+            walk(child, depth + 1)
+
+    walk(root, 1)
+    return "\n".join(lines)
+
+
+class Tracer:
+    """Starts a trace per update and writes out the ones worth keeping.
+
+    The choice is made once a trace is done, so a slow update is always
+    kept however low the sample rate. Lines are queued to a
+    RotatingFileHandler on a listener thread, off the event loop.
+    """
+
+    def __init__(self, sample: float, slow_ms: float):
+        self.sample = sample
+        self.slow_ns = slow_ms * 1e6
+        self.arrivals = {}      # update_id -> perf_counter_ns() when it was queued
+        self.output = None
+        self.listener = None
+        self.resource = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.output is not None
+
+    def start(self, path: str):
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUPS, encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        lines = SimpleQueue()
+        self.listener = logging.handlers.QueueListener(lines, handler)
+        self.listener.start()
+
+        self.output = logging.getLogger("buckshot.traces")
+        self.output.propagate = False
+        self.output.setLevel(logging.INFO)
+        self.output.addHandler(logging.handlers.QueueHandler(lines))
+        self.resource = {'attributes': otlp_attributes({
+            'service.name': "buckshot-bot", 'service.instance.id': f"shard-{WORKER_INDEX}"
+        })}
+        logger.info(f"🔬 Tracing {TRACE_SAMPLE:.0%} of updates and any over {TRACE_SLOW_MS:.0f}ms to {path}")
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+
+    def update(self, update: Update, handler: str) -> Span:
+        """Root span of a new trace; it starts when the update was queued"""
+        now = time.perf_counter_ns()
+        queued = self.arrivals.pop(update.update_id, now)
+        trace = Trace()
+        root = Span(trace, 0, handler, SPAN_SERVER, {'update.id': update.update_id}, start=queued)
+        if update.effective_chat is not None:
+            root.set('chat.id', update.effective_chat.id)
+        if update.effective_user is not None:
+            root.set('user.id', update.effective_user.id)
+        if update.message is not None:
+            root.set('message.age_s', int(time.time() - update.message.date.timestamp()))
+        if now > queued:
+            Span(trace, root.span_id, "queue", start=queued).end()
+        return root
+
+    def finish(self, trace: Trace):
+        root = trace.spans[0]
+        busy = max(span.stop for span in trace.spans) - root.start - trace.sleep_ns
+        slow = busy > self.slow_ns
+        if not slow and random.random() >= self.sample:
+            return
+
+        root.set('busy_ms', round(busy / 1e6, 1))
+        root.set('slow', slow)
+        if slow:
+            SLOW_UPDATES.inc(root.name)
+            logger.warning(f"🐢 Update {root.attributes['update.id']} spent {busy / 1e6:.0f}ms "
+                           f"outside pauses:\n{format_trace(trace)}")
+        self.output.info(json.dumps(self.export(trace), ensure_ascii=False, separators=(',', ':')))
+
+    def export(self, trace: Trace) -> dict:
+        """The trace as an OTLP/JSON ExportTraceServiceRequest, one per line"""
+        trace_id = f"{trace.trace_id:032x}"
+        spans = []
+        for span in trace.spans:
+            record = {
+                'traceId': trace_id,
+                'spanId': f"{span.span_id:016x}",
+                'name': span.name,
+                'kind': span.kind,
+                'startTimeUnixNano': str(TRACE_EPOCH_NS + span.start),
+                'endTimeUnixNano': str(TRACE_EPOCH_NS + span.stop),
+                'attributes': otlp_attributes(span.attributes),
+            }
+            if span.parent_id:
+                record['parentSpanId'] = f"{span.parent_id:016x}"
+            if span.error:
+                record['status'] = {'code': 2, 'message': span.error}
+            spans.append(record)
+        return {'resourceSpans': [{
+            'resource': self.resource,
+            'scopeSpans': [{'scope': {'name': "buckshot"}, 'spans': spans}],
+        }]}
+
+
+# Started in main() when TRACE_FILE is set
+tracer = Tracer(TRACE_SAMPLE, TRACE_SLOW_MS)
+
+
+def traced(handler):
+    """Run an update handler as the root span of its update's trace"""
+    @wraps(handler)
+    async def run(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+        if not tracer.enabled:
+            return await handler(update, ctx)
+        with tracer.update(update, handler.__name__):
+            return await handler(update, ctx)
+    return run
+
+
+class StampedQueue(asyncio.Queue):
+    """Update queue that notes when each update arrived, so its trace starts there"""
+
+    def put_nowait(self, item):
+        if isinstance(item, Update):
+            arrivals = tracer.arrivals
+            arrivals[item.update_id] = time.perf_counter_ns()
+            if len(arrivals) > 10000:
+                # Updates no traced handler took
+                del arrivals[next(iter(arrivals))]
+        super().put_nowait(item)
+
+
+# ═══════════════════════════════════════
+#             GAME STATE
+# ═══════════════════════════════════════
+
+class Player:
+    """A group player; the display name is built once, at join time"""
+
+    __slots__ = ('id', 'username', 'name', 'display', 'label')
+
+    def __init__(self, user_id: int, username, name: str):
+        self.id = user_id
+        self.username = username
+        self.name = name
+        self.display = f"@{username}" if username else name
+        self.label = self.display[:12]
+
+    @property
+    def mention(self):
+        return f"@{self.username}" if self.username else None
+
+
+class Game:
+    """One private or group game; the magazine is a bitmask (bit i set = shell i live) plus its length"""
+
+    __slots__ = (
+        'status', 'chat_id', 'message_id', 'game_id', 'p1', 'p2',
+        'p1_hp', 'p2_hp', 'magazine', 'mag_len', 'shell_idx', 'live', 'blank', 'turn',
+        'last_active', 'seed', 'reloads', 'seq'
+    )
+
+    def __init__(self, chat_id: str, message_id=None, game_id: str = None,
+                 p1: Player = None, p2: Player = None, status: str = 'playing'):
+        self.status = status
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.game_id = game_id
+        self.p1 = p1
+        self.p2 = p2
+        self.p1_hp = engine.MAX_HP
+        self.p2_hp = engine.MAX_HP
+        self.turn = 1
+        self.last_active = time.monotonic()
+        self.seed = random.getrandbits(32)
+        self.reloads = 0
+        self.seq = 0
+        self.magazine = self.mag_len = self.shell_idx = 0
+        journal(self, eventlog.EV_START)
+        self.reload()
+
+    @property
+    def key(self) -> str:
+        """Store/actor key: "gp:<game_id>" for group games, "pv:<user_id>" for private ones"""
+        return f"gp:{self.game_id}" if self.game_id else f"pv:{self.chat_id}"
+
+    @property
+    def players(self) -> list:
+        return [p for p in (self.p1, self.p2) if p is not None]
+
+    @property
+    def remaining(self) -> int:
+        return self.mag_len - self.shell_idx
+
+    def reload(self):
+        """Load a fresh, shuffled magazine, dealt from the game's seed"""
+        self.magazine, self.live, self.blank = engine.generate_shells(engine.magazine_rng(self.seed, self.reloads))
+        self.reloads += 1
+        self.mag_len = self.live + self.blank
+        self.shell_idx = 0
+        journal(self, eventlog.EV_RELOAD, shell=self.reloads - 1)
+
+    def draw(self) -> bool:
+        """Fire the next shell; True if it was live"""
+        is_live = (self.magazine >> self.shell_idx) & 1 == 1
+        self.shell_idx += 1
+        if is_live:
+            self.live -= 1
+        else:
+            self.blank -= 1
+        return is_live
+
+    def shoot(self, at_self: bool) -> bool:
+        """Fire the next shell at the player whose turn it is or at their opponent; True if live"""
+        actor = self.turn
+        is_live = self.draw()
+        self.p1_hp, self.p2_hp, self.turn = engine.resolve_shot(
+            self.p1_hp, self.p2_hp, self.turn, at_self, is_live
+        )
+        journal(self, eventlog.EV_SHOT, actor=actor, target=int(at_self), shell=int(is_live))
+        return is_live
+
+
+class GameStore:
+    """Private games by user id, kept in least-recently-active order.
+
+    Finished games stay for `finished_grace` seconds so their Play Again
+    button still has something to show, in-progress games are dropped
+    after `idle_timeout` seconds without a move, and the store never holds
+    more than `max_games` (oldest activity goes first, skipping games whose
+    actor is mid-move). Play Again always starts a fresh game, so an
+    evicted game's button keeps working.
+    """
+
+    def __init__(self, max_games: int, finished_grace: float, idle_timeout: float):
+        self.games = OrderedDict()
+        self.max_games = max_games
+        self.finished_grace = finished_grace
+        self.idle_timeout = idle_timeout
+        self.evictions = {'finished': 0, 'idle': 0, 'capacity': 0}
+
+    def __len__(self) -> int:
+        return len(self.games)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.games
+
+    def __getitem__(self, key: str) -> Game:
+        return self.games[key]
+
+    def __setitem__(self, key: str, game: Game):
+        self.games[key] = game
+        self.touch(key)
+        while len(self.games) > self.max_games:
+            # A game mid-move would vanish under its animation
+            evicted = next((k for k in self.games if k != key and not actor_busy(f"pv:{k}")), None)
+            if evicted is None:
+                break
+            game = self.games.pop(evicted)
+            self.evictions['capacity'] += 1
+            forget(f"pv:{evicted}", game)
+
+    def get(self, key: str, default=None):
+        return self.games.get(key, default)
+
+    def pop(self, key: str, default=None):
+        return self.games.pop(key, default)
+
+    def values(self):
+        return self.games.values()
+
+    def touch(self, key: str):
+        """Record activity on a game"""
+        game = self.games.get(key)
+        if game is not None:
+            game.last_active = time.monotonic()
+            self.games.move_to_end(key)
+
+    def sweep(self) -> int:
+        """Evict expired games, oldest first; returns how many went"""
+        now = time.monotonic()
+        horizon = min(self.finished_grace, self.idle_timeout)
+        expired = []
+
+        # Walk from the least recently used end and stop at the first fresh game
+        for key, game in self.games.items():
+            age = now - game.last_active
+            if age < horizon:
+                break
+            if actor_busy(f"pv:{key}"):
+                continue
+
+            if game.status == 'finished' and age >= self.finished_grace:
+                expired.append((key, game, 'finished'))
+            elif game.status != 'finished' and age >= self.idle_timeout:
+                expired.append((key, game, 'idle'))
+
+        for key, game, reason in expired:
+            del self.games[key]
+            self.evictions[reason] += 1
+            forget(f"pv:{key}", game)
+
+        return len(expired)
+
+    def stats(self) -> dict:
+        return {'size': len(self.games), **{f"evicted_{k}": v for k, v in self.evictions.items()}}
+
+
+# Private games, keyed by user id
+private_games = GameStore(MAX_PRIVATE_GAMES, FINISHED_GAME_GRACE, IDLE_GAME_TIMEOUT)
+
+
+async def sweep_games():
+    """Periodically evict finished and abandoned private games"""
+    while True:
+        await asyncio.sleep(STORE_SWEEP_INTERVAL)
+        if private_games.sweep():
+            logger.info(f"🧹 Private game store: {private_games.stats()}")
+
+
+# ═══════════════════════════════════════
+#             GAME ACTORS
+# ═══════════════════════════════════════
+
+async def pause(seconds: float):
+    """Hold an animation frame on screen (not while shutting down)"""
+    if ANIMATION_SPEED > 0 and not draining:
+        with child_span("sleep", seconds=seconds * ANIMATION_SPEED):
+            await asyncio.sleep(seconds * ANIMATION_SPEED)
+
+
+class GameActor:
+    """Drives a single game: jobs from its mailbox run one at a time, in order.
+
+    Handlers only validate a tap and post a job, so the animation pauses
+    never hold an update-handling slot and two taps can't interleave.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.mailbox = asyncio.Queue()
+        self.task = None
+        self.unfinished = 0   # jobs posted and not yet done, including one just taken off the mailbox
+
+    @property
+    def busy(self) -> bool:
+        """True while a job is running or waiting in the mailbox"""
+        return self.unfinished > 0
+
+    def post(self, job, *args):
+        """Queue a job coroutine function and make sure the actor is running.
+
+        A job posted while handling a traced update is a span of that
+        update, from when it was posted until it is done.
+        """
+        self.unfinished += 1
+        self.mailbox.put_nowait((job, args, child_span(job.__name__, game=self.key)))
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                job, args, span = await asyncio.wait_for(self.mailbox.get(), ACTOR_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                if self.mailbox.empty():
+                    break
+                continue
+
+            try:
+                with span:
+                    span.mark('mailbox_ms')
+                    await job(*args)
+            except Exception:
+                logger.exception(f"Game actor {self.key} failed in {job.__name__}")
+            finally:
+                self.unfinished -= 1
+
+        if game_actors.get(self.key) is self:
+            del game_actors[self.key]
+
+
+def get_actor(key: str) -> GameActor:
+    """Get the actor for a game, creating it on first use"""
+    actor = game_actors.get(key)
+    if actor is None:
+        actor = game_actors[key] = GameActor(key)
+    return actor
+
+
+def actor_busy(key: str) -> bool:
+    """Whether a game still has animation frames to play"""
+    actor = game_actors.get(key)
+    return actor is not None and actor.busy
+
+
+# ═══════════════════════════════════════
+#             PERSISTENCE
+# ═══════════════════════════════════════
+
+# p1_hp, p2_hp, magazine, mag_len, shell_idx, live, blank, turn, seed, reloads, seq
+GAME_STATE = struct.Struct('<BBHBBBBBIHI')
+# Rows written before games had a seed
+GAME_STATE_V1 = struct.Struct('<BBHBBBBB')
+
+
+class GameDB:
+    """SQLite (WAL) copy of every unfinished game, written behind the hot path.
+
+    Game code only marks games dirty. A flusher task collects the dirty set
+    every FLUSH_INTERVAL seconds and writes it in one transaction on a
+    worker thread, so a move never waits on disk. Finished and dropped
+    games are deleted.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS games ("
+            " key TEXT PRIMARY KEY, chat_id TEXT NOT NULL, message_id INTEGER,"
+            " status TEXT NOT NULL, state BLOB NOT NULL, players TEXT)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS stats ("
+            " scope TEXT NOT NULL, user_id INTEGER NOT NULL, name TEXT NOT NULL, wins INTEGER NOT NULL,"
+            " losses INTEGER NOT NULL, streak INTEGER NOT NULL, best_streak INTEGER NOT NULL,"
+            " PRIMARY KEY (scope, user_id))"
+        )
+        self.dirty = {}     # key -> Game, or None once the game is gone
+        self.dirty_stats = {}   # (scope, user_id) -> PlayerStats
+        self.task = None
+        self.lock = asyncio.Lock()
+        self.stats = {'flushes': 0, 'written': 0, 'deleted': 0}
+
+    def mark(self, key: str, game):
+        self.dirty[key] = game
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    def mark_stats(self, scope: str, user_id: int, stats):
+        self.dirty_stats[scope, user_id] = stats
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    @staticmethod
+    def row(key: str, game: Game) -> tuple:
+        state = GAME_STATE.pack(
+            game.p1_hp, game.p2_hp, game.magazine, game.mag_len,
+            game.shell_idx, game.live, game.blank, game.turn,
+            game.seed, game.reloads, game.seq
+        )
+        players = json.dumps([[p.id, p.username, p.name] for p in game.players]) if game.game_id else None
+        return key, game.chat_id, game.message_id, game.status, state, players
+
+    def collect(self) -> tuple:
+        """Snapshot the dirty set into (upserts, deletes) rows"""
+        dirty, self.dirty = self.dirty, {}
+        upserts, deletes = [], []
+        for key, game in dirty.items():
+            if game is None or game.status == 'finished':
+                deletes.append((key,))
+            else:
+                upserts.append(self.row(key, game))
+        return upserts, deletes
+
+    def collect_stats(self) -> list:
+        """Snapshot the changed player stats into rows"""
+        dirty, self.dirty_stats = self.dirty_stats, {}
+        return [
+            (scope, user_id, stats.name, stats.wins, stats.losses, stats.streak, stats.best_streak)
+            for (scope, user_id), stats in dirty.items()
+        ]
+
+    def write(self, upserts: list, deletes: list, stats: list = ()):
+        """Apply one batch in a single transaction (runs on a worker thread)"""
+        with self.conn:
+            self.conn.execute("BEGIN")
+            if upserts:
+                self.conn.executemany("INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?)", upserts)
+            if deletes:
+                self.conn.executemany("DELETE FROM games WHERE key = ?", deletes)
+            if stats:
+                self.conn.executemany("INSERT OR REPLACE INTO stats VALUES (?, ?, ?, ?, ?, ?, ?)", stats)
+        self.stats['flushes'] += 1
+        self.stats['written'] += len(upserts)
+        self.stats['deleted'] += len(deletes)
+
+    async def flush(self):
+        async with self.lock:
+            dirty, dirty_stats = self.dirty, self.dirty_stats
+            upserts, deletes = self.collect()
+            stats = self.collect_stats()
+            if not (upserts or deletes or stats):
+                return
+            try:
+                await asyncio.to_thread(self.write, upserts, deletes, stats)
+            except sqlite3.Error:
+                # Put the batch back under anything marked since, so the next flush retries it
+                self.dirty = {**dirty, **self.dirty}
+                self.dirty_stats = {**dirty_stats, **self.dirty_stats}
+                raise
+
+    async def _run(self):
+        while self.dirty or self.dirty_stats:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except sqlite3.Error:
+                logger.exception("Game flush failed")
+
+    def load(self) -> list:
+        return self.conn.execute(
+            "SELECT key, chat_id, message_id, status, state, players FROM games WHERE status != 'finished'"
+        ).fetchall()
+
+    def load_stats(self) -> list:
+        return self.conn.execute(
+            "SELECT scope, user_id, name, wins, losses, streak, best_streak FROM stats"
+        ).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+    async def stop(self):
+        """Stop the flusher, write what is left and close; a failed write is logged"""
+        if self.task is not None:
+            # Not while a batch is on the worker thread: cancelling would leave it writing
+            async with self.lock:
+                self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        try:
+            await self.flush()
+        except sqlite3.Error:
+            logger.exception(f"Final game flush failed: {len(self.dirty)} games not saved")
+        finally:
+            self.close()
+
+
+# Created in main() when DB_PATH is set
+game_db = None
+
+
+def persist(game: Game):
+    """Queue a game's current state for the next flush"""
+    if game_db is not None:
+        game_db.mark(game.key, game)
+
+
+def forget(key: str, game: Game = None):
+    """Queue a game's row for deletion; an unfinished `game` is logged as dropped"""
+    if game_db is not None:
+        game_db.mark(key, None)
+    if game is not None and game.status != 'finished':
+        journal(game, eventlog.EV_END, target=eventlog.END_DROPPED)
+
+
+# Created at startup when EVENT_LOG is set, with the task that checkpoints it
+event_log = None
+checkpointer = None
+
+
+def journal(game: Game, kind: int, actor: int = 0, target: int = 0, shell: int = 0):
+    """Append an event and the state it left the game in to the event log"""
+    if event_log is None:
+        return
+    game.seq += 1
+    ref, flags = eventlog.game_ref(game.key)
+    event_log.append(
+        ref, game.seq, int(time.time()), kind, flags, actor, target, shell,
+        game.p1_hp, game.p2_hp, game.turn, game.seed, game.magazine, game.mag_len, game.shell_idx
+    )
+
+
+async def checkpoint_games(games: list) -> int:
+    """Log the state of each live game in `games` (unwritten rows) that has no record since the last round"""
+    recent, event_log.recent = event_log.recent, set()
+    logged = 0
+    for i, game in enumerate(games):
+        if game is not None and game.status != 'finished' and eventlog.game_ref(game.key)[0] not in recent:
+            journal(game, eventlog.EV_CHECKPOINT, shell=max(game.reloads - 1, 0))
+            logged += 1
+        if i % 1000 == 999:
+            await asyncio.sleep(0)
+    return logged
+
+
+async def checkpoint_events():
+    """Every third of EVENT_LOG_TAIL, checkpoint quiet games the database has not
+    caught up with (a failing flush), so its rows and the tail hold every live game
+    """
+    while True:
+        await asyncio.sleep(EVENT_LOG_TAIL / 3)
+        await checkpoint_games(list(game_db.dirty.values()) if game_db is not None else [])
+
+
+def catch_up(game: Game, state: tuple) -> bool:
+    """Move a restored game on to its last logged event, which can be newer
+    than its row (rows are flushed less often). False if the log says it ended.
+    """
+    event, reload = state
+    if event.seed != game.seed or event.seq <= game.seq:
+        return True
+    if event.kind == eventlog.EV_END:
+        return False
+
+    game.seq = event.seq
+    game.p1_hp, game.p2_hp, game.turn = event.p1_hp, event.p2_hp, event.turn
+    game.magazine, game.mag_len, game.shell_idx = event.magazine, event.mag_len, event.shell_idx
+    game.live = bin(game.magazine >> game.shell_idx).count("1")
+    game.blank = game.remaining - game.live
+    if reload is not None:
+        game.reloads = reload + 1
+    return True
+
+
+def finish_game(game: Game, reason: int = eventlog.END_FINISHED):
+    """Mark a game over: count it, score it, log it and queue its row for deletion"""
+    game.status = 'finished'
+    GAMES_FINISHED.inc("group" if game.game_id else "private")
+    # A forfeit leaves both players standing; the one not on turn wins
+    if reason == eventlog.END_FORFEIT:
+        seat = 2 if game.turn == 1 else 1
+    else:
+        seat = engine.winner(game.p1_hp, game.p2_hp)
+    if game.game_id is None:
+        player_stats.record_private(int(game.chat_id), seat == 1)
+    elif seat:
+        winner, loser = (game.p1, game.p2) if seat == 1 else (game.p2, game.p1)
+        player_stats.record_match(game.chat_id, winner, loser)
+    persist(game)
+    journal(game, eventlog.EV_END, target=reason)
+
+
+def game_from_row(row: tuple) -> Game:
+    key, chat_id, message_id, status, state, players = row
+    p1 = p2 = None
+    if players is not None:
+        seats = [Player(*p) for p in json.loads(players)]
+        p1 = seats[0]
+        p2 = seats[1] if len(seats) > 1 else None
+
+    # Skip __init__: it would deal a magazine only to overwrite it
+    game = Game.__new__(Game)
+    game.status = status
+    game.chat_id = chat_id
+    game.message_id = message_id
+    game.game_id = key[3:] if key.startswith("gp:") else None
+    game.p1 = p1
+    game.p2 = p2
+    game.last_active = time.monotonic()
+    if len(state) == GAME_STATE_V1.size:
+        state = GAME_STATE.pack(*GAME_STATE_V1.unpack(state), random.getrandbits(32), 0, 0)
+    (game.p1_hp, game.p2_hp, game.magazine, game.mag_len,
+     game.shell_idx, game.live, game.blank, game.turn,
+     game.seed, game.reloads, game.seq) = GAME_STATE.unpack(state)
+    return game
+
+
+def restore_games(rows: list, logged: dict = None) -> int:
+    """Rebuild the in-memory stores from saved rows.
+
+    Old keyboards keep working because their callback data only carries
+    the user id / game id. Games that were mid-sequence (the dealer's turn,
+    a full lobby about to start) are handed back to their actors, and group
+    deadlines are re-armed from now. `logged` (eventlog.last_states) moves
+    games on to moves made after their row was last flushed.
+    """
+    restored = 0
+    # Bulk allocation would otherwise trigger a full GC pass every few
+    # thousand games
+    gc.disable()
+    try:
+        for row in rows:
+            game = game_from_row(row)
+            state = logged.get(game.key) if logged else None
+            if state is not None and not catch_up(game, state):
+                forget(game.key)
+                continue
+            restore_game(game)
+            restored += 1
+    finally:
+        gc.enable()
+    return restored
+
+
+def cut_mid_move(game: Game) -> bool:
+    """Whether a game was saved between a shot and what follows it (game over or a reload)"""
+    return game.status == 'playing' and (engine.winner(game.p1_hp, game.p2_hp) != 0 or game.remaining <= 0)
+
+
+def restore_game(game: Game):
+    """Put one saved game back into the live stores"""
+    if game.game_id is None:
+        private_games[game.chat_id] = game
+        if cut_mid_move(game):
+            get_actor(game.key).post(settle_move, game.key)
+        elif game.status == 'playing' and game.turn == 2:
+            get_actor(game.key).post(process_ai_turn, game.chat_id)
+        return
+
+    group_games[game.game_id] = game
+    chat_games.setdefault(game.chat_id, set()).add(game.game_id)
+    if cut_mid_move(game):
+        get_actor(game.key).post(settle_move, game.key)
+    elif game.status == 'waiting' and game.p2 is not None:
+        get_actor(game.key).post(start_group_match, game.game_id)
+    elif game.status == 'waiting':
+        arm_deadline(game.game_id, LOBBY_TIMEOUT, expire_lobby)
+    else:
+        arm_deadline(game.game_id, TURN_TIMEOUT, turn_timeout)
+
+
+async def settle_move(key: str):
+    """Finish the move a restored game was cut off in: game over if someone is
+    out of lives, else the reload and the board (or the dealer's turn)
+    """
+    game = private_games.get(key[3:]) if key.startswith("pv:") else group_games.get(key[3:])
+    if game is None or not cut_mid_move(game):
+        return
+
+    animation = Animation(game)
+    seat = engine.winner(game.p1_hp, game.p2_hp)
+    if seat:
+        finish_game(game)
+        if game.game_id is None:
+            if seat == 1:
+                game_over = get_game_over_msg("𝕐𝕆𝕌 👑", "𝔻𝔼𝔸𝕃𝔼ℝ 🤖")
+            else:
+                game_over = get_game_over_msg("𝔻𝔼𝔸𝕃𝔼ℝ 🤖", "𝕐𝕆𝕌 😵")
+            await animation.close(game_over, get_play_again_kb(True))
+        else:
+            winner, loser = (game.p1, game.p2) if seat == 1 else (game.p2, game.p1)
+            game_over = get_game_over_msg(winner.display + " 👑", loser.display + " 💀", winner.mention)
+            await animation.close(game_over, get_play_again_kb(False))
+            drop_group_game(game.game_id)
+        return
+
+    game.reload()
+    persist(game)
+    await animation.frame(get_reload_msg(game.live, game.blank), get_reload_line(game.live, game.blank), 2)
+
+    if game.game_id is None:
+        if game.turn == 2:
+            await process_ai_turn(game.chat_id, animation)
+        else:
+            await animation.close(get_game_display(game, is_group=False), get_private_game_kb(game.chat_id))
+    else:
+        await animation.close(get_game_display(game, is_group=True), get_group_game_kb(game.game_id))
+        arm_deadline(game.game_id, TURN_TIMEOUT, turn_timeout)
+
+
+# Shutdown snapshot: a header, then per game a SNAPSHOT_GAME record followed
+# by its key, chat id, packed state and players JSON (the GameDB row fields)
+SNAPSHOT_MAGIC = b"BRS1"
+SNAPSHOT_HEADER = struct.Struct('<4sII')    # magic, games, unix time written
+SNAPSHOT_GAME = struct.Struct('<BBBqBH')    # flags, key/chat id lengths, message id, state/players lengths
+
+# Snapshot flags
+SNAP_PLAYING = 1    # status 'playing', else 'waiting'
+SNAP_STALE = 2      # its move was cut off, so the message may not show the board
+SNAP_PLAYERS = 4    # players JSON follows (group games)
+
+
+def write_snapshot(path: str, entries: list):
+    """Write (row, stale) entries to `path`, replacing it atomically (runs on a worker thread)"""
+    pack = SNAPSHOT_GAME.pack
+    parts = [SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(entries), int(time.time()))]
+    for (key, chat_id, message_id, status, state, players), stale in entries:
+        key, chat_id = key.encode(), chat_id.encode()
+        flags = (SNAP_PLAYING if status == 'playing' else 0) | (SNAP_STALE if stale else 0)
+        if players is not None:
+            flags |= SNAP_PLAYERS
+            players = players.encode()
+        else:
+            players = b""
+        parts += (pack(flags, len(key), len(chat_id), message_id or 0, len(state), len(players)),
+                  key, chat_id, state, players)
+
+    temp = path + ".tmp"
+    with open(temp, 'wb') as f:
+        f.write(b"".join(parts))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+
+
+def read_snapshot(path: str) -> tuple:
+    """(rows shaped like GameDB.load(), keys of stale games) from a snapshot file"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, count, _ = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path} is not a game snapshot")
+
+    unpack, size = SNAPSHOT_GAME.unpack_from, SNAPSHOT_GAME.size
+    rows, stale = [], []
+    offset = SNAPSHOT_HEADER.size
+    for _ in range(count):
+        flags, key_len, chat_len, message_id, state_len, players_len = unpack(data, offset)
+        offset += size
+        key = data[offset:offset + key_len].decode()
+        offset += key_len
+        chat_id = data[offset:offset + chat_len].decode()
+        offset += chat_len
+        state = data[offset:offset + state_len]
+        offset += state_len
+        players = data[offset:offset + players_len].decode() if flags & SNAP_PLAYERS else None
+        offset += players_len
+
+        status = 'playing' if flags & SNAP_PLAYING else 'waiting'
+        rows.append((key, chat_id, message_id or None, status, state, players))
+        if flags & SNAP_STALE:
+            stale.append(key)
+    if offset != len(data):
+        raise ValueError(f"{path} is truncated or has trailing data")
+    return rows, stale
+
+
+async def save_snapshot(path: str, cut: set) -> int:
+    """Write every live game to the snapshot; `cut` holds the keys of games whose move was cut off"""
+    unsent = edit_scheduler.pending.keys() | edit_scheduler.inflight.keys()
+    entries = []
+    for game in [*private_games.values(), *group_games.values()]:
+        if game.status == 'finished':
+            continue
+        if game.message_id is None:
+            # Stopped before its first message went out: nothing to put it back on
+            forget(game.key, game)
+            continue
+        stale = game.key in cut or (game.chat_id, game.message_id) in unsent
+        entries.append((GameDB.row(game.key, game), stale))
+    await asyncio.to_thread(write_snapshot, path, entries)
+    return len(entries)
+
+
+def board_frame(game: Game):
+    """(text, keyboard) a restored game's message shows between moves, or None
+    if restore_game() already handed it to its actor to carry on
+    """
+    if cut_mid_move(game):
+        return None
+    if game.game_id is None:
+        if game.status == 'playing' and game.turn == 1:
+            return get_game_display(game, is_group=False), get_private_game_kb(game.chat_id)
+    elif game.status == 'playing':
+        return get_game_display(game, is_group=True), get_group_game_kb(game.game_id)
+    elif game.p2 is None:
+        return get_lobby_msg(game.players), get_lobby_kb(game.game_id)
+    return None
+
+
+def repaint_games(keys) -> int:
+    """Queue each restored game's board onto its message; returns how many were queued"""
+    repainted = 0
+    for key in keys:
+        game = private_games.get(key[3:]) if key.startswith("pv:") else group_games.get(key[3:])
+        frame = board_frame(game) if game is not None and game.message_id is not None else None
+        if frame is not None:
+            edit_scheduler.edit(game.chat_id, game.message_id, *frame, priority=PRIO_BOARD)
+            repainted += 1
+    return repainted
+
+
+# ═══════════════════════════════════════
+#             PLAYER STATS
+# ═══════════════════════════════════════
+
+GLOBAL_SCOPE = "global"
+
+
+class PlayerStats:
+    """One player's record in one scope (a group chat, or everything)"""
+
+    __slots__ = ('name', 'wins', 'losses', 'streak', 'best_streak')
+
+    def __init__(self, name: str, wins: int = 0, losses: int = 0, streak: int = 0, best_streak: int = 0):
+        self.name = name
+        self.wins = wins
+        self.losses = losses
+        self.streak = streak            # > 0 wins in a row, < 0 losses in a row
+        self.best_streak = best_streak
+
+    def record(self, won: bool):
+        if won:
+            self.wins += 1
+            self.streak = self.streak + 1 if self.streak > 0 else 1
+            self.best_streak = max(self.best_streak, self.streak)
+        else:
+            self.losses += 1
+            self.streak = self.streak - 1 if self.streak < 0 else -1
+
+
+class Leaderboard:
+    """The `size` players with the most wins, kept in order.
+
+    Entries are (-wins, user_id), so bisect keeps them sorted and ties go
+    to the earlier account. Wins never go down, so a player outside the
+    board can only get on it through their own win: checking each result
+    against the last entry keeps the board exact without ranking everyone.
+    `version` changes whenever what the board shows does.
+    """
+
+    __slots__ = ('size', 'entries', 'members', 'version')
+
+    def __init__(self, size: int):
+        self.size = size
+        self.entries = []
+        self.members = {}       # user_id -> its entry
+        self.version = 0
+
+    def update(self, user_id: int, wins: int) -> bool:
+        """Place a player after a result; True if the board changed"""
+        entry = (-wins, user_id)
+        old = self.members.get(user_id)
+        if old is not None:
+            # Listed: the shown losses/streak changed even if the rank didn't
+            if old != entry:
+                del self.entries[bisect.bisect_left(self.entries, old)]
+                bisect.insort(self.entries, entry)
+                self.members[user_id] = entry
+        elif len(self.entries) < self.size or entry < self.entries[-1]:
+            bisect.insort(self.entries, entry)
+            self.members[user_id] = entry
+            if len(self.entries) > self.size:
+                del self.members[self.entries.pop()[1]]
+        else:
+            return False
+        self.version += 1
+        return True
+
+    def load(self, scores: dict):
+        """Rebuild from every player's stats in this scope"""
+        self.entries = heapq.nsmallest(self.size, ((-stats.wins, user_id) for user_id, stats in scores.items()))
+        self.members = {entry[1]: entry for entry in self.entries}
+        self.version += 1
+
+
+class StatsStore:
+    """Wins, losses and streaks per player, per group chat and overall.
+
+    A result costs a dict lookup per scope plus an O(log K) board update;
+    /top reads the board and only renders again once its version moves.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.scopes = {}    # scope -> {user_id: PlayerStats}
+        self.boards = {}    # scope -> Leaderboard
+        self.names = {}     # user_id -> display name of private players
+
+    @staticmethod
+    def name_of(user) -> str:
+        return f"@{user.username}" if user.username else (user.first_name or "Player")
+
+    def seen(self, user):
+        """Remember a private player's display name"""
+        self.names[user.id] = self.name_of(user)
+
+    def get(self, scope: str, user_id: int) -> PlayerStats:
+        scores = self.scopes.get(scope)
+        return scores.get(user_id) if scores else None
+
+    def board(self, scope: str) -> Leaderboard:
+        board = self.boards.get(scope)
+        if board is None:
+            board = self.boards[scope] = Leaderboard(self.size)
+            self.scopes.setdefault(scope, {})
+        return board
+
+    def record(self, scope: str, user_id: int, name: str, won: bool):
+        scores = self.scopes.get(scope)
+        if scores is None:
+            scores = self.scopes[scope] = {}
+        stats = scores.get(user_id)
+        if stats is None:
+            stats = scores[user_id] = PlayerStats(name)
+        else:
+            stats.name = name
+        stats.record(won)
+        self.board(scope).update(user_id, stats.wins)
+        if game_db is not None:
+            game_db.mark_stats(scope, user_id, stats)
+
+    def record_private(self, user_id: int, won: bool):
+        """A game against the dealer counts towards the global board only"""
+        stats = self.get(GLOBAL_SCOPE, user_id)
+        name = self.names.get(user_id) or (stats.name if stats else "Player")
+        self.record(GLOBAL_SCOPE, user_id, name, won)
+
+    def record_match(self, chat_id: str, winner: Player, loser: Player):
+        self.record_pair(chat_id, winner.id, winner.display, loser.id, loser.display)
+
+    def record_pair(self, chat_id: str, winner_id: int, winner_name: str, loser_id: int, loser_name: str):
+        for scope in (chat_id, GLOBAL_SCOPE):
+            self.record(scope, winner_id, winner_name, True)
+            self.record(scope, loser_id, loser_name, False)
+
+    def apply(self, result: tuple):
+        """Apply what a shard worker's StatsFeed sent"""
+        kind, *args = result
+        if kind == 'seen':
+            user_id, name = args
+            self.names[user_id] = name
+        elif kind == 'private':
+            self.record_private(*args)
+        else:
+            self.record_pair(*args)
+
+    def load(self, rows: list):
+        """Restore saved rows (GameDB.load_stats) and rebuild every board"""
+        for scope, user_id, name, wins, losses, streak, best_streak in rows:
+            self.scopes.setdefault(scope, {})[user_id] = PlayerStats(name, wins, losses, streak, best_streak)
+        for scope, scores in self.scopes.items():
+            self.board(scope).load(scores)
+
+
+class StatsFeed:
+    """A shard worker's player_stats: results go to the front process, which
+    owns every scope, so a player's record doesn't depend on which worker
+    their games landed on
+    """
+
+    def __init__(self, outbox):
+        self.outbox = outbox
+
+    def seen(self, user):
+        self.outbox.put_nowait(('seen', user.id, StatsStore.name_of(user)))
+
+    def record_private(self, user_id: int, won: bool):
+        self.outbox.put_nowait(('private', user_id, won))
+
+    def record_match(self, chat_id: str, winner: Player, loser: Player):
+        self.outbox.put_nowait(('match', chat_id, winner.id, winner.display, loser.id, loser.display))
+
+    def load(self, rows: list):
+        """Nothing to load: the front has the stats"""
+
+
+# A StatsFeed in shard workers
+player_stats = StatsStore(LEADERBOARD_SIZE)
+
+
+# ═══════════════════════════════════════
+#              DEADLINES
+# ═══════════════════════════════════════
+
+class TimerWheel:
+    """Hashed timing wheel holding at most one deadline per key.
+
+    Arming and cancelling are a dict insert/delete, so re-arming on every
+    move is O(1); a single task advances the wheel one slot per tick and
+    fires whatever is due there. Deadlines further out than one turn of the
+    wheel simply stay in their slot until their round comes up.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 512):
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]
+        self.timers = {}     # key -> slot index
+        self.origin = time.monotonic()
+        self.cursor = 0      # last tick processed
+        self.task = None
+
+    def __len__(self) -> int:
+        return len(self.timers)
+
+    def arm(self, key, delay: float, callback, *args):
+        """Call `callback(*args)` after `delay` seconds, replacing any deadline for `key`"""
+        self.cancel(key)
+        now_tick = int((time.monotonic() - self.origin) / self.tick)
+        idle = self.task is None or self.task.done()
+        if idle:
+            self.cursor = now_tick
+
+        due = now_tick + max(1, math.ceil(delay / self.tick))
+        slot = due % len(self.slots)
+        self.slots[slot][key] = (due, callback, args)
+        self.timers[key] = slot
+
+        if idle:
+            self.task = asyncio.create_task(self._run())
+
+    def cancel(self, key):
+        slot = self.timers.pop(key, None)
+        if slot is not None:
+            del self.slots[slot][key]
+
+    async def _run(self):
+        # Deadlines fire outside any update's trace, whichever update armed the first one
+        active_span.set(None)
+        while self.timers:
+            next_tick = self.origin + (self.cursor + 1) * self.tick
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+
+            target = int((time.monotonic() - self.origin) / self.tick)
+            while self.cursor < target:
+                self.cursor += 1
+                slot = self.slots[self.cursor % len(self.slots)]
+                due = [key for key, entry in slot.items() if entry[0] <= self.cursor]
+                for key in due:
+                    _, callback, args = slot.pop(key)
+                    del self.timers[key]
+                    try:
+                        callback(*args)
+                    except Exception:
+                        logger.exception(f"Deadline callback for {key} failed")
+
+
+# Turn and lobby deadlines of group games, keyed like their actors
+deadlines = TimerWheel(TIMER_TICK)
+
+
+def arm_deadline(game_id: str, delay: float, job):
+    """(Re)arm a group game's deadline; when it passes `job(game_id)` runs on the game's actor"""
+    key = f"gp:{game_id}"
+    deadlines.arm(key, delay, lambda: get_actor(key).post(job, game_id))
+
+
+# ═══════════════════════════════════════
+#            OUTBOUND EDITS
+# ═══════════════════════════════════════
+
+class TokenBucket:
+    """Refilling edit budget; `blocked_until` holds a Telegram RetryAfter"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'stamp', 'blocked_until')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+        self.blocked_until = 0.0
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available (0 = available now)"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> float:
+        """Consume a token if one is available, else return the wait"""
+        wait = self.wait_time(now)
+        if wait <= 0:
+            self.tokens -= 1
+        return wait
+
+    def full(self, now: float) -> bool:
+        return self.wait_time(now) <= 0 and self.tokens >= self.capacity
+
+
+def frame_digest(text: str, reply_markup) -> int:
+    """Hash of what a frame puts on screen (keyboards hash by their buttons)"""
+    return hash((text, reply_markup))
+
+
+class EditFrame:
+    """A pending edit; `done` resolves True once sent, False if dropped.
+
+    Its span (when queued by a traced update) runs until then.
+    """
+
+    __slots__ = ('key', 'text', 'reply_markup', 'priority', 'seq', 'digest', 'done', 'span')
+
+    def __init__(self, key: tuple, text: str, reply_markup, priority: int, seq: int, digest: int):
+        self.key = key
+        self.text = text
+        self.reply_markup = reply_markup
+        self.priority = priority
+        self.seq = seq
+        self.digest = digest
+        self.done = asyncio.get_running_loop().create_future()
+        self.span = child_span("edit", priority=priority)
+
+    def resolve(self, sent: bool, outcome: str = None):
+        if not self.done.done():
+            self.done.set_result(sent)
+            self.span.set('outcome', outcome or ("sent" if sent else "dropped"))
+            self.span.end()
+
+
+class EditScheduler:
+    """Single outbound path for game message edits.
+
+    Each chat has a token bucket and all chats share a global one. Only the
+    newest frame per message is kept, so an edit queued behind the budget is
+    merged into the next one. Frames go out highest priority first;
+    cosmetic frames for a chat that is out of budget are dropped instead of
+    queued, and RetryAfter pauses the chat and retries the frame.
+
+    A frame identical to what the message shows is not sent at all; one
+    queued behind the same frame on the wire is dropped if that lands and
+    sent if it fails. Telegram's "message is not modified" counts as sent.
+    """
+
+    def __init__(self, bot, global_rate: float = GLOBAL_EDIT_RATE):
+        self.bot = bot
+        self.pending = {}       # (chat_id, message_id) -> EditFrame
+        self.inflight = {}      # message key -> digest of the frame on the wire
+        self.shown = {}         # message key -> digest of its last frame, oldest first
+        self.ready = []         # heap of (-priority, seq, key)
+        self.delayed = []       # heap of (ready_at, seq, key), chat out of budget
+        self.buckets = {}
+        self.prune_at = 10000   # bucket count that triggers the next prune of full buckets
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.seq = 0
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.senders = set()
+        self.stats = {'sent': 0, 'merged': 0, 'dropped': 0, 'avoided': 0, 'not_modified': 0,
+                      'retry_after': 0, 'failed': 0}
+
+    def bucket(self, chat_id) -> TokenBucket:
+        bucket = self.buckets.get(chat_id)
+        if bucket is None:
+            rate = GROUP_EDIT_RATE if int(chat_id) < 0 else PRIVATE_EDIT_RATE
+            bucket = self.buckets[chat_id] = TokenBucket(rate, CHAT_EDIT_BURST)
+        return bucket
+
+    def showing(self, chat_id, message_id, text: str, reply_markup=None):
+        """Record what a message shows; sends call this, edits do it themselves"""
+        key = (chat_id, message_id)
+        self.shown.pop(key, None)
+        self.shown[key] = frame_digest(text, reply_markup)
+        if len(self.shown) > SHOWN_FRAMES:
+            del self.shown[next(iter(self.shown))]
+
+    def edit(self, chat_id, message_id, text: str, reply_markup=None, priority: int = PRIO_FRAME):
+        """Queue an edit and return a future that resolves to whether it was sent"""
+        key = (chat_id, message_id)
+        digest = frame_digest(text, reply_markup)
+        previous = self.pending.get(key)
+
+        if key not in self.inflight and digest == self.shown.get(key):
+            # Already on screen: a queued frame would only change it back
+            if previous is not None:
+                del self.pending[key]
+                previous.resolve(False, "merged")
+                self.stats['merged'] += 1
+            self.stats['avoided'] += 1
+            done = asyncio.get_running_loop().create_future()
+            done.set_result(True)
+            return done
+
+        self.seq += 1
+        frame = EditFrame(key, text, reply_markup, priority, self.seq, digest)
+        busy = previous is not None or key in self.inflight
+        if priority == PRIO_COSMETIC and (busy or self.bucket(chat_id).wait_time(time.monotonic()) > 0):
+            self.stats['dropped'] += 1
+            frame.resolve(False)
+            return frame.done
+
+        if previous is not None:
+            # The newer frame replaces the queued one but keeps its rank
+            frame.priority = max(priority, previous.priority)
+            previous.resolve(False, "merged")
+            self.stats['merged'] += 1
+
+        self.pending[key] = frame
+        if key not in self.inflight:
+            heapq.heappush(self.ready, (-frame.priority, frame.seq, key))
+            self.wakeup.set()
+
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._dispatch())
+        return frame.done
+
+    async def close(self):
+        """Stop sending and wait for the senders; edits still queued or on the wire are abandoned"""
+        tasks = [task for task in (self.task, *self.senders) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _current(self, seq: int, key: tuple):
+        frame = self.pending.get(key)
+        return frame if frame is not None and frame.seq == seq else None
+
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            while self.delayed and self.delayed[0][0] <= now:
+                _, seq, key = heapq.heappop(self.delayed)
+                frame = self._current(seq, key)
+                if frame is not None:
+                    heapq.heappush(self.ready, (-frame.priority, seq, key))
+
+            if not self.ready:
+                self.wakeup.clear()
+                timeout = self.delayed[0][0] - now if self.delayed else None
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            wait = self.global_bucket.wait_time(now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            _, seq, key = heapq.heappop(self.ready)
+            frame = self._current(seq, key)
+            if frame is None or key in self.inflight:
+                continue
+            if frame.digest == self.shown.get(key):
+                # Queued behind the same frame, which has landed since
+                del self.pending[key]
+                self.stats['avoided'] += 1
+                frame.resolve(True, "avoided")
+                continue
+
+            wait = self.bucket(key[0]).take(now)
+            if wait > 0:
+                if frame.priority == PRIO_COSMETIC:
+                    del self.pending[key]
+                    self.stats['dropped'] += 1
+                    frame.resolve(False)
+                else:
+                    heapq.heappush(self.delayed, (now + wait, seq, key))
+                continue
+
+            self.global_bucket.take(now)
+            del self.pending[key]
+            self.inflight[key] = frame.digest
+            sender = asyncio.create_task(self._send(frame))
+            self.senders.add(sender)
+            sender.add_done_callback(self.senders.discard)
+
+            if len(self.buckets) > self.prune_at:
+                self.buckets = {c: b for c, b in self.buckets.items() if not b.full(now)}
+                # Next prune once the survivors have doubled, so pruning stays O(1) per send
+                self.prune_at = max(10000, 2 * len(self.buckets))
+
+    async def _send(self, frame: EditFrame):
+        chat_id, message_id = frame.key
+        frame.span.activate()
+        try:
+            await self.bot.edit_message_text(
+                chat_id=chat_id, message_id=message_id,
+                text=frame.text, reply_markup=frame.reply_markup
+            )
+            self.stats['sent'] += 1
+            self.showing(chat_id, message_id, frame.text, frame.reply_markup)
+            frame.resolve(True)
+        except BadRequest as e:
+            if "not modified" not in e.message:
+                self.stats['failed'] += 1
+                logger.warning(f"Edit failed in chat {chat_id}: {e}")
+                frame.resolve(False, "failed")
+            else:
+                # Already showing this frame: as good as sent
+                self.stats['not_modified'] += 1
+                self.showing(chat_id, message_id, frame.text, frame.reply_markup)
+                frame.resolve(True, "not_modified")
+        except RetryAfter as e:
+            self.stats['retry_after'] += 1
+            retry_at = time.monotonic() + float(e.retry_after)
+            self.bucket(chat_id).blocked_until = retry_at
+            logger.warning(f"RetryAfter {e.retry_after}s editing in chat {chat_id}")
+            if frame.key not in self.pending:
+                self.pending[frame.key] = frame
+                heapq.heappush(self.delayed, (retry_at, frame.seq, frame.key))
+            else:
+                frame.resolve(False, "merged")
+        except TelegramError as e:
+            self.stats['failed'] += 1
+            logger.warning(f"Edit failed in chat {chat_id}: {e}")
+            frame.resolve(False, "failed")
+        finally:
+            self.inflight.pop(frame.key, None)
+            waiting = self.pending.get(frame.key)
+            if waiting is not None and waiting is not frame:
+                heapq.heappush(self.ready, (-waiting.priority, waiting.seq, frame.key))
+            self.wakeup.set()
+
+
+async def show(game: Game, text: str, reply_markup=None, priority: int = PRIO_FRAME) -> bool:
+    """Put a frame on a game's message.
+
+    Boards wait until they are on screen; other frames are queued and
+    the caller's pause runs while they go out.
+    """
+    done = edit_scheduler.edit(game.chat_id, game.message_id, text, reply_markup, priority)
+    if priority >= PRIO_BOARD:
+        return await done
+    return True
+
+
+# Chats (users, in private) that asked for fast play with /fast
+fast_chats = set()
+
+
+def fast_play(game: Game) -> bool:
+    """Whether a game's next move plays as a single frame"""
+    if draining:
+        FAST_MOVES.inc("drain")
+        return True
+    if game.chat_id in fast_chats:
+        FAST_MOVES.inc("chat")
+        return True
+    if FAST_PLAY_BACKLOG and edit_scheduler is not None and len(edit_scheduler.pending) >= FAST_PLAY_BACKLOG:
+        FAST_MOVES.inc("load")
+        return True
+    return False
+
+
+class Animation:
+    """The frames of one move.
+
+    Normally each frame is an edit followed by its pause. In fast play only
+    a one-line recap of each is kept, and close() sends them above the
+    closing frame in a single edit, with no pauses.
+    """
+
+    __slots__ = ('game', 'fast', 'recap')
+
+    def __init__(self, game: Game):
+        self.game = game
+        self.fast = fast_play(game)
+        self.recap = []
+
+    async def frame(self, text: str, recap: str, seconds: float, priority: int = PRIO_FRAME):
+        if self.fast:
+            if recap:
+                self.recap.append(recap)
+            return
+        await show(self.game, text, priority=priority)
+        await pause(seconds)
+
+    async def close(self, text: str, reply_markup=None) -> bool:
+        """Show the frame the move ends on (a board or game over)"""
+        if self.recap:
+            text = get_fast_frame(tuple(self.recap), text)
+        return await show(self.game, text, reply_markup, PRIO_BOARD)
 
 
 # ═══════════════════════════════════════
@@ -97,6 +2255,12 @@ def get_welcome_msg() -> str:
 ┊
 ┊ 👥 /buckshot  
 ┊    ➜ Play vs Friend (Group Chat)
+┊
+┊ 🏆 /top
+┊    ➜ Leaderboard (/top global)
+┊
+┊ ⚡ /fast
+┊    ➜ Skip the animations (toggle)
 
 ═══════════════════════════════════════
 
@@ -118,14 +2282,11 @@ def get_lobby_msg(players: list, max_players: int = 2) -> str:
         p1_line = "⦾ ᴡᴀɪᴛɪɴɢ..."
         p2_line = "⦾ ᴡᴀɪᴛɪɴɢ..."
     elif count == 1:
-        p1_name = f"@{players[0]['username']}" if players[0]['username'] else players[0]['name']
-        p1_line = f"⦿ {p1_name[:18]}"
+        p1_line = f"⦿ {players[0].display[:18]}"
         p2_line = "⦾ ᴡᴀɪᴛɪɴɢ..."
     else:
-        p1_name = f"@{players[0]['username']}" if players[0]['username'] else players[0]['name']
-        p2_name = f"@{players[1]['username']}" if players[1]['username'] else players[1]['name']
-        p1_line = f"⦿ {p1_name[:18]}"
-        p2_line = f"⦿ {p2_name[:18]}"
+        p1_line = f"⦿ {players[0].display[:18]}"
+        p2_line = f"⦿ {players[1].display[:18]}"
 
     return f"""
 ༺═══════════════════════════════════༻
@@ -152,10 +2313,29 @@ def get_lobby_msg(players: list, max_players: int = 2) -> str:
 """
 
 
-def get_match_start_msg(p1: dict, p2: dict) -> str:
+def get_lobby_expired_msg() -> str:
+    """Lobby closed because nobody joined in time"""
+    return """
+༺═══════════════════════════════════༻
+
+          𝔻𝔼𝔸𝕋ℍ 𝕃𝕆𝔹𝔹𝕐
+
+༺═══════════════════════════════════༻
+
+⌛ ɴᴏ ᴄʜᴀʟʟᴇɴɢᴇʀ ᴀʀʀɪᴠᴇᴅ...
+
+👻 ʟᴏʙʙʏ ᴄʟᴏsᴇᴅ
+
+👆 sᴇɴᴅ /buckshot ᴛᴏ ᴏᴘᴇɴ ᴀ ɴᴇᴡ ᴏɴᴇ
+
+༺═══════════════════════════════════༻
+"""
+
+
+def get_match_start_msg(p1: Player, p2: Player) -> str:
     """Match found message when 2 players join"""
-    p1_name = f"@{p1['username']}" if p1['username'] else p1['name']
-    p2_name = f"@{p2['username']}" if p2['username'] else p2['name']
+    p1_name = p1.display
+    p2_name = p2.display
 
     return f"""
 ⛧═══════════════════════════════════⛧
@@ -186,27 +2366,21 @@ def get_match_start_msg(p1: dict, p2: dict) -> str:
 #           GAME DISPLAY MESSAGES
 # ═══════════════════════════════════════
 
-def get_game_display(game: dict, is_group: bool = False) -> str:
-    """Main game display showing HP, shells, and turn info"""
-    p1_hp = get_hp_display(game['p1_hp'])
-    p2_hp = get_hp_display(game['p2_hp'])
+# Frames are rendered with NAME in place of player names and split there
+# once, so filling in names is a single join
+NAME = "\0"
+YOU = "𝕐𝕆𝕌"
+DEALER = "𝔻𝔼𝔸𝕃𝔼ℝ"
 
-    if is_group:
-        p1_name = f"@{game['p1']['username']}" if game['p1']['username'] else game['p1']['name']
-        p2_name = f"@{game['p2']['username']}" if game['p2']['username'] else game['p2']['name']
-        p1_display = p1_name[:12]
-        p2_display = p2_name[:12]
-    else:
-        p1_display = "𝕐𝕆𝕌"
-        p2_display = "𝔻𝔼𝔸𝕃𝔼ℝ"
 
-    remaining = len(game['shells']) - game['shell_idx']
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def board_segments(p1_hp: int, p2_hp: int, remaining: int, live: int, blank: int,
+                   turn: int, is_group: bool) -> tuple:
+    """Board frame for one game state, split around the three name slots"""
     shells_display = UNKNOWN_SHELL * min(remaining, 8)
+    turn_indicator = "🔴" if turn == 1 else ("🔵" if is_group else "🤖")
 
-    turn_name = p1_display if game['turn'] == 1 else p2_display
-    turn_indicator = "🔴" if game['turn'] == 1 else ("🔵" if is_group else "🤖")
-
-    return f"""
+    return tuple(f"""
 ◢◤═══════════════════════════════◢◤
 
           𝔅𝔘ℭ𝔎𝔖ℌ𝔒𝔗
@@ -214,13 +2388,13 @@ def get_game_display(game: dict, is_group: bool = False) -> str:
 
 ◢◤═══════════════════════════════◢◤
 
-♰ {p1_display}
-{p1_hp}
+♰ {NAME}
+{get_hp_display(p1_hp)}
 
             ⚔️ ᴠs ⚔️
 
-♰ {p2_display}
-{p2_hp}
+♰ {NAME}
+{get_hp_display(p2_hp)}
 
 ════════════════════════════════════
 
@@ -228,22 +2402,36 @@ def get_game_display(game: dict, is_group: bool = False) -> str:
 
 ░▒▓ {shells_display} ▓▒░
 
-🩸 ʟɪᴠᴇ: {game['live']}    💨 ʙʟᴀɴᴋ: {game['blank']}
+🩸 ʟɪᴠᴇ: {live}    💨 ʙʟᴀɴᴋ: {blank}
 
 ════════════════════════════════════
 
-{turn_indicator} {turn_name}'s ᴛᴜʀɴ
+{turn_indicator} {NAME}'s ᴛᴜʀɴ
 
 ◢◤═══════════════════════════════◢◤
-"""
+""".split(NAME))
 
 
-def get_shot_result_live_opponent(shooter: str, target: str) -> str:
-    """Shot result when LIVE shell hits opponent"""
-    return f"""
+def get_game_display(game: Game, is_group: bool = False) -> str:
+    """Main game display showing HP, shells, and turn info"""
+    if is_group:
+        p1_display = game.p1.label
+        p2_display = game.p2.label
+    else:
+        p1_display = YOU
+        p2_display = DEALER
+
+    head, vs, shells, tail = board_segments(
+        game.p1_hp, game.p2_hp, game.remaining, game.live, game.blank, game.turn, is_group
+    )
+    turn_name = p1_display if game.turn == 1 else p2_display
+    return f"{head}{p1_display}{vs}{p2_display}{shells}{turn_name}{tail}"
+
+
+SHOT_RESULT_LIVE_OPPONENT = tuple(f"""
 ⛧═══════════════════════════════════⛧
 
-🔫 {shooter} ➤ {target}
+🔫 {NAME} ➤ {NAME}
 
 {SFX['tension']}
 
@@ -258,15 +2446,19 @@ def get_shot_result_live_opponent(shooter: str, target: str) -> str:
 ⚰️ ᴅɪʀᴇᴄᴛ ʜɪᴛ! −1 ♥️
 
 ⛧═══════════════════════════════════⛧
-"""
+""".split(NAME))
 
 
-def get_shot_result_live_self(shooter: str) -> str:
-    """Shot result when LIVE shell hits self"""
-    return f"""
+def get_shot_result_live_opponent(shooter: str, target: str) -> str:
+    """Shot result when LIVE shell hits opponent"""
+    head, mid, tail = SHOT_RESULT_LIVE_OPPONENT
+    return f"{head}{shooter}{mid}{target}{tail}"
+
+
+SHOT_RESULT_LIVE_SELF = tuple(f"""
 ⛧═══════════════════════════════════⛧
 
-🔫 {shooter} ➤ 𝕊𝔼𝕃𝔽
+🔫 {NAME} ➤ 𝕊𝔼𝕃𝔽
 
 {SFX['tension']}
 
@@ -281,15 +2473,19 @@ def get_shot_result_live_self(shooter: str) -> str:
 😵 sᴇʟғ ᴅᴀᴍᴀɢᴇ! −1 ♥️
 
 ⛧═══════════════════════════════════⛧
-"""
+""".split(NAME))
 
 
-def get_shot_result_blank_opponent(shooter: str, target: str) -> str:
-    """Shot result when BLANK shell at opponent"""
-    return f"""
+def get_shot_result_live_self(shooter: str) -> str:
+    """Shot result when LIVE shell hits self"""
+    head, tail = SHOT_RESULT_LIVE_SELF
+    return f"{head}{shooter}{tail}"
+
+
+SHOT_RESULT_BLANK_OPPONENT = tuple(f"""
 ༺═══════════════════════════════════༻
 
-🔫 {shooter} ➤ {target}
+🔫 {NAME} ➤ {NAME}
 
 {SFX['tension']}
 
@@ -301,18 +2497,22 @@ def get_shot_result_blank_opponent(shooter: str, target: str) -> str:
 
 ════════════════════════════════════
 
-😮‍💨 {target} sᴜʀᴠɪᴠᴇs!
+😮‍💨 {NAME} sᴜʀᴠɪᴠᴇs!
 
 ༺═══════════════════════════════════༻
-"""
+""".split(NAME))
 
 
-def get_shot_result_blank_self(shooter: str) -> str:
-    """Shot result when BLANK shell at self - EXTRA TURN"""
-    return f"""
+def get_shot_result_blank_opponent(shooter: str, target: str) -> str:
+    """Shot result when BLANK shell at opponent"""
+    head, mid, survivor, tail = SHOT_RESULT_BLANK_OPPONENT
+    return f"{head}{shooter}{mid}{target}{survivor}{target}{tail}"
+
+
+SHOT_RESULT_BLANK_SELF = tuple(f"""
 ༺═══════════════════════════════════༻
 
-🔫 {shooter} ➤ 𝕊𝔼𝕃𝔽
+🔫 {NAME} ➤ 𝕊𝔼𝕃𝔽
 
 {SFX['tension']}
 
@@ -327,9 +2527,16 @@ def get_shot_result_blank_self(shooter: str) -> str:
 🍀 ʟᴜᴄᴋʏ! ᴇxᴛʀᴀ ᴛᴜʀɴ!
 
 ༺═══════════════════════════════════༻
-"""
+""".split(NAME))
 
 
+def get_shot_result_blank_self(shooter: str) -> str:
+    """Shot result when BLANK shell at self - EXTRA TURN"""
+    head, tail = SHOT_RESULT_BLANK_SELF
+    return f"{head}{shooter}{tail}"
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
 def get_reload_msg(live: int, blank: int) -> str:
     """Reload message when shells run out"""
     shells_visual = (LIVE_SHELL * live) + (BLANK_SHELL * blank)
@@ -390,85 +2597,252 @@ def get_game_over_msg(winner: str, loser: str, winner_mention: str = None) -> st
 
 ════════════════════════════════════
 
-⚰️ 𝕃𝕆𝕊𝔼ℝ
-{loser}
+⚰️ 𝕃𝕆𝕊𝔼ℝ
+{loser}
+
+════════════════════════════════════
+
+✧ 𝘝𝘪𝘤𝘵𝘰𝘳𝘺 𝘪𝘴 𝘤𝘭𝘢𝘪𝘮𝘦𝘥 ✧{mention_line}
+
+⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧
+"""
+
+
+def get_ai_thinking_msg() -> str:
+    """AI thinking message"""
+    return f"""
+┏━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┓
+
+          🤖 𝔻𝔼𝔸𝕃𝔼ℝ
+
+              {SFX['tension']}
+
+          🔮 ᴛʜɪɴᴋɪɴɢ...
+
+              {SFX['tension']}
+
+┗━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┛
+"""
+
+
+def get_afk_msg(name: str) -> str:
+    """Turn timer ran out"""
+    return f"""
+⛧═══════════════════════════════════⛧
+
+          ⌛ 𝐓𝐈𝐌𝐄'𝐒 𝐔𝐏
+
+════════════════════════════════════
+
+{name} ғʀᴏᴢᴇ ᴀᴛ ᴛʜᴇ ᴛʀɪɢɢᴇʀ...
+
+⛧═══════════════════════════════════⛧
+"""
+
+
+def get_extra_turn_msg(name: str) -> str:
+    """Extra turn notification"""
+    return f"""
+༺═══════════════════════════════════༻
+
+          🍀 𝐄𝐗𝐓𝐑𝐀 𝐓𝐔𝐑𝐍
+
+════════════════════════════════════
+
+{name} ɢᴇᴛs ᴀɴᴏᴛʜᴇʀ sʜᴏᴛ!
+
+༺═══════════════════════════════════༻
+"""
+
+
+# One-line recaps of the frames above, for fast play
+
+def get_shot_line(shooter: str, target: str, is_live: bool) -> str:
+    outcome = "🩸 ʟɪᴠᴇ −1 ♥️" if is_live else "💨 ʙʟᴀɴᴋ"
+    return f"🔫 {shooter} ➤ {target}  {outcome}"
+
+
+def get_reload_line(live: int, blank: int) -> str:
+    return f"🔄 ʀᴇʟᴏᴀᴅ  🩸 {live}  💨 {blank}"
+
+
+def get_extra_turn_line(name: str) -> str:
+    return f"🍀 {name} ɢᴇᴛs ᴀɴᴏᴛʜᴇʀ sʜᴏᴛ!"
+
+
+def get_match_line(p1: Player, p2: Player) -> str:
+    return f"⚔️ {p1.display[:15]} ᴠs {p2.display[:15]}"
+
+
+def get_afk_line(name: str) -> str:
+    return f"⌛ {name} ғʀᴏᴢᴇ ᴀᴛ ᴛʜᴇ ᴛʀɪɢɢᴇʀ..."
+
+
+def get_fast_frame(recap: tuple, frame: str) -> str:
+    """A move in fast play: what happened, then the frame it ended on"""
+    return "\n" + "\n".join(recap) + "\n" + frame
+
+
+# ═══════════════════════════════════════
+#           LEADERBOARD MESSAGES
+# ═══════════════════════════════════════
+
+RANK_MARKS = ("🥇", "🥈", "🥉")
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def get_leaderboard_msg(scope: str, version: int) -> str:
+    """/top board of a scope; `version` is the board's, so a render lasts until the ranking moves"""
+    board = player_stats.board(scope)
+    scores = player_stats.scopes[scope]
+    title = "𝔾𝕃𝕆𝔹𝔸𝕃 𝕋𝕆ℙ" if scope == GLOBAL_SCOPE else "ℂℍ𝔸𝕋 𝕋𝕆ℙ"
+
+    lines = []
+    for rank, (_, user_id) in enumerate(board.entries):
+        stats = scores[user_id]
+        mark = RANK_MARKS[rank] if rank < len(RANK_MARKS) else f"{rank + 1}."
+        lines.append(f"{mark} {stats.name[:18]}\n┊    👑 {stats.wins}  ⚰️ {stats.losses}  🔥 {stats.best_streak}")
+    body = "\n\n".join(lines) or "👻 ɴᴏ ɢᴀᴍᴇs ᴘʟᴀʏᴇᴅ ʏᴇᴛ"
+
+    return f"""
+⛧═══════════════════════════════════⛧
+
+          🏆 {title} 🏆
 
-════════════════════════════════════
+⛧═══════════════════════════════════⛧
 
-✧ 𝘝𝘪𝘤𝘵𝘰𝘳𝘺 𝘪𝘴 𝘤𝘭𝘢𝘪𝘮𝘦𝘥 ✧{mention_line}
+{body}
 
-⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧⛧
+════════════════════════════════════
 """
 
 
-def get_ai_thinking_msg() -> str:
-    """AI thinking message"""
-    return f"""
-┏━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┓
+def get_player_line(stats: PlayerStats) -> str:
+    """The caller's own record, under the board"""
+    if stats is None:
+        return "\n👤 ɴᴏ ɢᴀᴍᴇs ʏᴇᴛ ʜᴇʀᴇ"
+    if stats.streak > 0:
+        streak = f"🔥 {stats.streak} ᴡɪɴ sᴛʀᴇᴀᴋ"
+    elif stats.streak < 0:
+        streak = f"💀 {-stats.streak} ʟᴏss sᴛʀᴇᴀᴋ"
+    else:
+        streak = ""
+    return f"\n👤 ʏᴏᴜ: 👑 {stats.wins}  ⚰️ {stats.losses}  {streak}".rstrip()
 
-          🤖 𝔻𝔼𝔸𝕃𝔼ℝ
 
-              {SFX['tension']}
+# ═══════════════════════════════════════
+#            CALLBACK DATA
+# ═══════════════════════════════════════
 
-          🔮 ᴛʜɪɴᴋɪɴɢ...
+# Button payloads are (version, opcode, token) packed into 10 bytes and
+# base64url-encoded: 14 characters whatever the ids. The token is the
+# user id for private games and the base-36 game id for group games.
+CALLBACK_VERSION = 1
+CALLBACK_FORMAT = struct.Struct('<BBQ')
+BASE36_DIGITS = string.digits + string.ascii_lowercase
+
+OP_JOIN = 1
+OP_PV_DEALER = 2
+OP_PV_SELF = 3
+OP_GP_OPP = 4
+OP_GP_SELF = 5
+OP_PLAY_AGAIN_PV = 6
+OP_PLAY_AGAIN_GP = 7
+
+# Metrics labels
+OP_NAMES = {
+    OP_JOIN: 'join', OP_PV_DEALER: 'pv_dealer', OP_PV_SELF: 'pv_self', OP_GP_OPP: 'gp_opp',
+    OP_GP_SELF: 'gp_self', OP_PLAY_AGAIN_PV: 'play_again', OP_PLAY_AGAIN_GP: 'play_again',
+}
+GROUP_OPS = (OP_JOIN, OP_GP_OPP, OP_GP_SELF)
 
-              {SFX['tension']}
+# Buttons on messages sent before the codec existed ("gp_opp_<game_id>", ...)
+LEGACY_PREFIXES = (
+    ('join_', OP_JOIN), ('pv_dealer_', OP_PV_DEALER), ('pv_self_', OP_PV_SELF), ('gp_opp_', OP_GP_OPP),
+    ('gp_self_', OP_GP_SELF), ('play_again_pv', OP_PLAY_AGAIN_PV), ('play_again_gp', OP_PLAY_AGAIN_GP),
+)
 
-┗━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┛
-"""
 
+def encode_callback(op: int, key: str = "") -> str:
+    """Callback data for a button: `key` is a user id or a group game id"""
+    if not key:
+        token = 0
+    elif op in GROUP_OPS:
+        token = int(key, 36)
+    else:
+        token = int(key)
+    packed = CALLBACK_FORMAT.pack(CALLBACK_VERSION, op, token)
+    return base64.urlsafe_b64encode(packed).rstrip(b'=').decode()
 
-def get_extra_turn_msg(name: str) -> str:
-    """Extra turn notification"""
-    return f"""
-༺═══════════════════════════════════༻
 
-          🍀 𝐄𝐗𝐓𝐑𝐀 𝐓𝐔𝐑𝐍
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def decode_callback(data: str) -> tuple:
+    """(opcode, key) for a button's callback data; opcode 0 if it can't be read"""
+    # Packed data always starts with "A" (the version byte), legacy data never does
+    for prefix, op in LEGACY_PREFIXES:
+        if data.startswith(prefix):
+            return op, data[len(prefix):]
 
-════════════════════════════════════
+    try:
+        version, op, token = CALLBACK_FORMAT.unpack(base64.urlsafe_b64decode(data + '=='))
+    except (binascii.Error, struct.error, ValueError):
+        return 0, ""
+    if version != CALLBACK_VERSION:
+        return 0, ""
 
-{name} ɢᴇᴛs ᴀɴᴏᴛʜᴇʀ sʜᴏᴛ!
+    if op in GROUP_OPS:
+        return op, base36(token).rjust(6, '0')
+    return op, str(token) if token else ""
 
-༺═══════════════════════════════════༻
-"""
+
+def base36(n: int) -> str:
+    """Inverse of int(s, 36)"""
+    digits = ""
+    while n:
+        n, digit = divmod(n, 36)
+        digits = BASE36_DIGITS[digit] + digits
+    return digits or "0"
 
 
 # ═══════════════════════════════════════
 #               KEYBOARDS
 # ═══════════════════════════════════════
 
-def get_private_game_kb(game_id: str) -> InlineKeyboardMarkup:
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def get_private_game_kb(user_id: str) -> InlineKeyboardMarkup:
     """Keyboard for private game actions"""
     return InlineKeyboardMarkup([
-        [InlineKeyboardButton("🎯 𝐒𝐇𝐎𝐎𝐓 𝐃𝐄𝐀𝐋𝐄𝐑", callback_data=f"pv_dealer_{game_id}")],
-        [InlineKeyboardButton("🔫 𝐒𝐇𝐎𝐎𝐓 𝐘𝐎𝐔𝐑𝐒𝐄𝐋𝐅", callback_data=f"pv_self_{game_id}")],
+        [InlineKeyboardButton("🎯 𝐒𝐇𝐎𝐎𝐓 𝐃𝐄𝐀𝐋𝐄𝐑", callback_data=encode_callback(OP_PV_DEALER, user_id))],
+        [InlineKeyboardButton("🔫 𝐒𝐇𝐎𝐎𝐓 𝐘𝐎𝐔𝐑𝐒𝐄𝐋𝐅", callback_data=encode_callback(OP_PV_SELF, user_id))],
     ])
 
 
-def get_group_game_kb(chat_id: str, p1_id: int, p2_id: int, current_turn_id: int) -> InlineKeyboardMarkup:
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def get_group_game_kb(game_id: str) -> InlineKeyboardMarkup:
     """Keyboard for group game actions"""
     return InlineKeyboardMarkup([
-        [InlineKeyboardButton("🎯 𝐒𝐇𝐎𝐎𝐓 𝐎𝐏𝐏𝐎𝐍𝐄𝐍𝐓", callback_data=f"gp_opp_{chat_id}_{p1_id}_{p2_id}_{current_turn_id}")],
-        [InlineKeyboardButton("🔫 𝐒𝐇𝐎𝐎𝐓 𝐘𝐎𝐔𝐑𝐒𝐄𝐋𝐅", callback_data=f"gp_self_{chat_id}_{p1_id}_{p2_id}_{current_turn_id}")],
+        [InlineKeyboardButton("🎯 𝐒𝐇𝐎𝐎𝐓 𝐎𝐏𝐏𝐎𝐍𝐄𝐍𝐓", callback_data=encode_callback(OP_GP_OPP, game_id))],
+        [InlineKeyboardButton("🔫 𝐒𝐇𝐎𝐎𝐓 𝐘𝐎𝐔𝐑𝐒𝐄𝐋𝐅", callback_data=encode_callback(OP_GP_SELF, game_id))],
     ])
 
 
-def get_lobby_kb(chat_id: str) -> InlineKeyboardMarkup:
+def get_lobby_kb(game_id: str) -> InlineKeyboardMarkup:
     """Keyboard for lobby join button"""
     return InlineKeyboardMarkup([
-        [InlineKeyboardButton("⚔️ 𝐉𝐎𝐈𝐍 𝐆𝐀𝐌𝐄", callback_data=f"join_{chat_id}")]
+        [InlineKeyboardButton("⚔️ 𝐉𝐎𝐈𝐍 𝐆𝐀𝐌𝐄", callback_data=encode_callback(OP_JOIN, game_id))]
     ])
 
 
+@lru_cache(maxsize=2)
 def get_play_again_kb(is_private: bool) -> InlineKeyboardMarkup:
     """Keyboard for play again option"""
     if is_private:
         return InlineKeyboardMarkup([
-            [InlineKeyboardButton("🔄 𝐏𝐋𝐀𝐘 𝐀𝐆𝐀𝐈𝐍", callback_data="play_again_pv")]
+            [InlineKeyboardButton("🔄 𝐏𝐋𝐀𝐘 𝐀𝐆𝐀𝐈𝐍", callback_data=encode_callback(OP_PLAY_AGAIN_PV))]
         ])
     else:
         return InlineKeyboardMarkup([
-            [InlineKeyboardButton("🔄 𝐍𝐄𝐖 𝐆𝐀𝐌𝐄", callback_data="play_again_gp")]
+            [InlineKeyboardButton("🔄 𝐍𝐄𝐖 𝐆𝐀𝐌𝐄", callback_data=encode_callback(OP_PLAY_AGAIN_GP))]
         ])
 
 
@@ -476,6 +2850,10 @@ def get_play_again_kb(is_private: bool) -> InlineKeyboardMarkup:
 #              COMMANDS
 # ═══════════════════════════════════════
 
+# Answer to anything that would start a game while the bot is shutting down
+RESTARTING_TEXT = "🔄 ʙᴏᴛ ɪs ʀᴇsᴛᴀʀᴛɪɴɢ, ᴛʀʏ ᴀɢᴀɪɴ ɪɴ ᴀ ᴍᴏᴍᴇɴᴛ!"
+
+@traced
 async def start_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """Welcome message - Private only"""
     if update.effective_chat.type != "private":
@@ -484,6 +2862,7 @@ async def start_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(get_welcome_msg())
 
 
+@traced
 async def buckshotpv_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """Private game vs AI"""
     if update.effective_chat.type != "private":
@@ -497,38 +2876,20 @@ async def buckshotpv_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     user_id = str(user.id)
 
     # Check if already playing
-    if user_id in private_games and private_games[user_id].get('status') == 'playing':
+    if user_id in private_games and private_games[user_id].status == 'playing':
         await update.message.reply_text("⚠️ ʏᴏᴜ ᴀʟʀᴇᴀᴅʏ ʜᴀᴠᴇ ᴀɴ ᴀᴄᴛɪᴠᴇ ɢᴀᴍᴇ!")
         return
 
-    # Generate shells
-    shells, live, blank = generate_shells()
-
-    # Create game
-    private_games[user_id] = {
-        'status': 'playing',
-        'p1_hp': 3,
-        'p2_hp': 3,
-        'shells': shells,
-        'shell_idx': 0,
-        'live': live,
-        'blank': blank,
-        'turn': 1,
-        'message_id': None
-    }
-
-    # Show reload animation
-    reload_msg = get_reload_msg(live, blank)
-    msg = await update.message.reply_text(reload_msg)
-    private_games[user_id]['message_id'] = msg.message_id
-
-    await asyncio.sleep(2)
+    if draining:
+        await update.message.reply_text(RESTARTING_TEXT)
+        return
 
-    # Show game
-    game_display = get_game_display(private_games[user_id], is_group=False)
-    await msg.edit_text(game_display, reply_markup=get_private_game_kb(user_id))
+    player_stats.seen(user)
+    new_private_game(user_id, message_id=None)
+    get_actor(f"pv:{user_id}").post(deal_private_game, user_id, update.message)
 
 
+@traced
 async def buckshot_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """Group game - 2 players"""
     if update.effective_chat.type == "private":
@@ -540,573 +2901,1030 @@ async def buckshot_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     chat_id = str(update.effective_chat.id)
 
-    # Check if game already running
-    if chat_id in group_games:
-        status = group_games[chat_id].get('status')
-        if status == 'waiting' or status == 'playing':
-            await update.message.reply_text(
-                "⚠️ ᴀ ɢᴀᴍᴇ ɪs ᴀʟʀᴇᴀᴅʏ ɪɴ ᴘʀᴏɢʀᴇss!\n"
-                "⏳ ᴘʟᴇᴀsᴇ ᴡᴀɪᴛ ғᴏʀ ɪᴛ ᴛᴏ ғɪɴɪsʜ."
-            )
-            return
+    if draining:
+        await update.message.reply_text(RESTARTING_TEXT)
+        return
+
+    # Several lobbies/matches may run side by side, up to a per-chat cap
+    if len(chat_games.get(chat_id, ())) >= MAX_GAMES_PER_CHAT:
+        await update.message.reply_text(
+            "⚠️ ᴛᴏᴏ ᴍᴀɴʏ ɢᴀᴍᴇs ɪɴ ᴘʀᴏɢʀᴇss!\n"
+            "⏳ ᴘʟᴇᴀsᴇ ᴡᴀɪᴛ ғᴏʀ ᴏɴᴇ ᴛᴏ ғɪɴɪsʜ."
+        )
+        return
 
     user = update.effective_user
 
     # Create lobby
-    group_games[chat_id] = {
-        'status': 'waiting',
-        'players': [{
-            'id': user.id,
-            'username': user.username,
-            'name': user.first_name or "Player1"
-        }],
-        'message_id': None
-    }
+    game = new_group_game(chat_id, Player(user.id, user.username, user.first_name or "Player1"))
+
+    lobby_msg = get_lobby_msg(game.players)
+    lobby_kb = get_lobby_kb(game.game_id)
+    msg = await update.message.reply_text(lobby_msg, reply_markup=lobby_kb)
+    game.message_id = msg.message_id
+    edit_scheduler.showing(chat_id, game.message_id, lobby_msg, lobby_kb)
+    persist(game)
+
+
+@traced
+async def top_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """Leaderboard: the group's own in a group, everyone's in private or with /top global"""
+    chat = update.effective_chat
+    if chat.type == "private" or (ctx.args and ctx.args[0].lower() == GLOBAL_SCOPE):
+        scope = GLOBAL_SCOPE
+    else:
+        scope = str(chat.id)
+
+    board = player_stats.board(scope)
+    stats = player_stats.get(scope, update.effective_user.id)
+    await update.message.reply_text(get_leaderboard_msg(scope, board.version) + get_player_line(stats))
+
+
+@traced
+async def fast_cmd(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """Toggle fast play (one frame per move) for this chat; /fast on|off sets it"""
+    chat_id = str(update.effective_chat.id)
+    if ctx.args and ctx.args[0].lower() in ("on", "off"):
+        fast = ctx.args[0].lower() == "on"
+    else:
+        fast = chat_id not in fast_chats
 
-    lobby_msg = get_lobby_msg(group_games[chat_id]['players'])
-    msg = await update.message.reply_text(lobby_msg, reply_markup=get_lobby_kb(chat_id))
-    group_games[chat_id]['message_id'] = msg.message_id
+    if fast:
+        fast_chats.add(chat_id)
+        await update.message.reply_text("⚡ ғᴀsᴛ ᴘʟᴀʏ ᴏɴ: ᴏɴᴇ ғʀᴀᴍᴇ ᴘᴇʀ sʜᴏᴛ, ɴᴏ ᴘᴀᴜsᴇs")
+    else:
+        fast_chats.discard(chat_id)
+        await update.message.reply_text("🎬 ғᴀsᴛ ᴘʟᴀʏ ᴏғғ: ғᴜʟʟ ᴀɴɪᴍᴀᴛɪᴏɴs")
 
 
 # ═══════════════════════════════════════
 #           CALLBACK HANDLERS
 # ═══════════════════════════════════════
 
+@traced
 async def callback_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    """Handle all callback queries"""
+    """Handle all callback queries: decode the button and dispatch on its opcode"""
+    start = time.perf_counter()
     query = update.callback_query
-    data = query.data
-    user = query.from_user
-
-    # ─────────────────────────────────
-    # JOIN GROUP GAME
-    # ─────────────────────────────────
-    if data.startswith("join_"):
-        chat_id = data.split("_")[1]
+    op, key = decode_callback(query.data or "")
+    current_span().set('button', OP_NAMES.get(op, 'other'))
+    try:
+        handler = CALLBACK_HANDLERS.get(op)
+        if handler is None:
+            await query.answer()
+        else:
+            await handler(query, key)
+    finally:
+        HANDLER_SECONDS.observe(OP_NAMES.get(op, 'other'), time.perf_counter() - start)
 
-        if chat_id not in group_games:
-            await query.answer("❌ ɢᴀᴍᴇ ɴᴏᴛ ғᴏᴜɴᴅ!", show_alert=True)
-            return
 
-        game = group_games[chat_id]
+async def on_join(query, game_id: str):
+    """Join a group lobby"""
+    user = query.from_user
 
-        if game['status'] != 'waiting':
-            await query.answer("❌ ɢᴀᴍᴇ ᴀʟʀᴇᴀᴅʏ sᴛᴀʀᴛᴇᴅ!", show_alert=True)
-            return
+    if game_id not in group_games:
+        await query.answer("❌ ɢᴀᴍᴇ ɴᴏᴛ ғᴏᴜɴᴅ!", show_alert=True)
+        return
 
-        # Check if already joined
-        for p in game['players']:
-            if p['id'] == user.id:
-                await query.answer("⚠️ ʏᴏᴜ ʜᴀᴠᴇ ᴀʟʀᴇᴀᴅʏ ᴊᴏɪɴᴇᴅ!", show_alert=True)
-                return
+    game = group_games[game_id]
 
-        # Check if full
-        if len(game['players']) >= 2:
-            await query.answer("❌ ʟᴏʙʙʏ ɪs ғᴜʟʟ!", show_alert=True)
-            return
+    if game.status != 'waiting':
+        await query.answer("❌ ɢᴀᴍᴇ ᴀʟʀᴇᴀᴅʏ sᴛᴀʀᴛᴇᴅ!", show_alert=True)
+        return
 
-        # Add player
-        game['players'].append({
-            'id': user.id,
-            'username': user.username,
-            'name': user.first_name or "Player2"
-        })
-
-        await query.answer("✅ ʏᴏᴜ ᴊᴏɪɴᴇᴅ ᴛʜᴇ ɢᴀᴍᴇ!")
-
-        # Check if ready to start
-        if len(game['players']) == 2:
-            # Show match found
-            match_msg = get_match_start_msg(game['players'][0], game['players'][1])
-            await query.edit_message_text(match_msg)
-            await asyncio.sleep(2)
-
-            # Initialize game
-            shells, live, blank = generate_shells()
-            game['status'] = 'playing'
-            game['p1'] = game['players'][0]
-            game['p2'] = game['players'][1]
-            game['p1_hp'] = 3
-            game['p2_hp'] = 3
-            game['shells'] = shells
-            game['shell_idx'] = 0
-            game['live'] = live
-            game['blank'] = blank
-            game['turn'] = 1
-
-            # Show reload
-            reload_msg = get_reload_msg(live, blank)
-            await query.edit_message_text(reload_msg)
-            await asyncio.sleep(2)
-
-            # Show game
-            game_display = get_game_display(game, is_group=True)
-            current_turn_id = game['p1']['id'] if game['turn'] == 1 else game['p2']['id']
-            await query.edit_message_text(
-                game_display, 
-                reply_markup=get_group_game_kb(chat_id, game['p1']['id'], game['p2']['id'], current_turn_id)
-            )
-        else:
-            # Update lobby
-            lobby_msg = get_lobby_msg(game['players'])
-            await query.edit_message_text(lobby_msg, reply_markup=get_lobby_kb(chat_id))
+    # Check if already joined
+    if game.p1.id == user.id:
+        await query.answer("⚠️ ʏᴏᴜ ʜᴀᴠᴇ ᴀʟʀᴇᴀᴅʏ ᴊᴏɪɴᴇᴅ!", show_alert=True)
+        return
 
+    # Check if full
+    if game.p2 is not None:
+        await query.answer("❌ ʟᴏʙʙʏ ɪs ғᴜʟʟ!", show_alert=True)
         return
 
-    # ─────────────────────────────────
-    # PRIVATE GAME - SHOOT DEALER
-    # ─────────────────────────────────
-    if data.startswith("pv_dealer_"):
-        user_id = data.split("_")[2]
+    # The lobby is kept; a join after the restart starts the match
+    if draining:
+        await query.answer(RESTARTING_TEXT, show_alert=True)
+        return
 
-        if user_id != str(user.id):
-            await query.answer("❌ ᴛʜɪs ɪs ɴᴏᴛ ʏᴏᴜʀ ɢᴀᴍᴇ!", show_alert=True)
-            return
+    # Add player
+    game.p2 = Player(user.id, user.username, user.first_name or "Player2")
+    persist(game)
 
-        if user_id not in private_games:
-            await query.answer("❌ ɢᴀᴍᴇ ɴᴏᴛ ғᴏᴜɴᴅ!", show_alert=True)
-            return
+    # Two seats, so the lobby is now full
+    deadlines.cancel(f"gp:{game_id}")
+    get_actor(f"gp:{game_id}").post(start_group_match, game_id)
 
-        game = private_games[user_id]
+    await query.answer("✅ ʏᴏᴜ ᴊᴏɪɴᴇᴅ ᴛʜᴇ ɢᴀᴍᴇ!")
 
-        if game['turn'] != 1:
-            await query.answer("⏳ ᴘʟᴇᴀsᴇ ᴡᴀɪᴛ ғᴏʀ ʏᴏᴜʀ ᴛᴜʀɴ!", show_alert=True)
-            return
 
-        await process_private_shot(query, user_id, target="dealer")
+async def on_private_shot(query, user_id: str, target: str):
+    """Shoot button in a private game; target is "dealer" or "self" """
+    if user_id != str(query.from_user.id):
+        await query.answer("❌ ᴛʜɪs ɪs ɴᴏᴛ ʏᴏᴜʀ ɢᴀᴍᴇ!", show_alert=True)
         return
 
-    # ─────────────────────────────────
-    # PRIVATE GAME - SHOOT SELF
-    # ─────────────────────────────────
-    if data.startswith("pv_self_"):
-        user_id = data.split("_")[2]
+    if user_id not in private_games:
+        await query.answer("❌ ɢᴀᴍᴇ ɴᴏᴛ ғᴏᴜɴᴅ!", show_alert=True)
+        return
 
-        if user_id != str(user.id):
-            await query.answer("❌ ᴛʜɪs ɪs ɴᴏᴛ ʏᴏᴜʀ ɢᴀᴍᴇ!", show_alert=True)
-            return
+    game = private_games[user_id]
 
-        if user_id not in private_games:
-            await query.answer("❌ ɢᴀᴍᴇ ɴᴏᴛ ғᴏᴜɴᴅ!", show_alert=True)
-            return
+    if game.status != 'playing':
+        await query.answer("❌ ɢᴀᴍᴇ ᴀʟʀᴇᴀᴅʏ ᴇɴᴅᴇᴅ!", show_alert=True)
+        return
 
-        game = private_games[user_id]
+    if game.turn != 1 or actor_busy(f"pv:{user_id}"):
+        await query.answer("⏳ ᴘʟᴇᴀsᴇ ᴡᴀɪᴛ ғᴏʀ ʏᴏᴜʀ ᴛᴜʀɴ!", show_alert=True)
+        return
 
-        if game['turn'] != 1:
-            await query.answer("⏳ ᴘʟᴇᴀsᴇ ᴡᴀɪᴛ ғᴏʀ ʏᴏᴜʀ ᴛᴜʀɴ!", show_alert=True)
-            return
+    private_games.touch(user_id)
+    get_actor(f"pv:{user_id}").post(process_private_shot, user_id, target)
+    await query.answer()
 
-        await process_private_shot(query, user_id, target="self")
-        return
 
-    # ─────────────────────────────────
-    # GROUP GAME - SHOOT OPPONENT
-    # ─────────────────────────────────
-    if data.startswith("gp_opp_"):
-        parts = data.split("_")
-        chat_id = parts[2]
-        p1_id = int(parts[3])
-        p2_id = int(parts[4])
-        current_turn_id = int(parts[5])
-
-        # Check if user is part of the game
-        if user.id != p1_id and user.id != p2_id:
-            await query.answer("❌ ʏᴏᴜ ᴀʀᴇ ɴᴏᴛ ᴘᴀʀᴛ ᴏғ ᴛʜɪs ɢᴀᴍᴇ!", show_alert=True)
-            return
+async def on_group_shot(query, game_id: str, target: str):
+    """Shoot button in a group game; target is "opponent" or "self" """
+    user = query.from_user
 
-        # Check if it's their turn
-        if user.id != current_turn_id:
-            await query.answer("⏳ ᴋɪɴᴅʟʏ ᴡᴀɪᴛ ғᴏʀ ʏᴏᴜʀ ᴛᴜʀɴ!", show_alert=True)
-            return
+    if game_id not in group_games or group_games[game_id].status != 'playing':
+        await query.answer("❌ ɢᴀᴍᴇ ɴᴏᴛ ғᴏᴜɴᴅ!", show_alert=True)
+        return
 
-        if chat_id not in group_games:
-            await query.answer("❌ ɢᴀᴍᴇ ɴᴏᴛ ғᴏᴜɴᴅ!", show_alert=True)
-            return
+    game = group_games[game_id]
 
-        await process_group_shot(query, chat_id, user.id, target="opponent")
+    # Check if user is part of the game
+    if user.id != game.p1.id and user.id != game.p2.id:
+        await query.answer("❌ ʏᴏᴜ ᴀʀᴇ ɴᴏᴛ ᴘᴀʀᴛ ᴏғ ᴛʜɪs ɢᴀᴍᴇ!", show_alert=True)
         return
 
-    # ─────────────────────────────────
-    # GROUP GAME - SHOOT SELF
-    # ─────────────────────────────────
-    if data.startswith("gp_self_"):
-        parts = data.split("_")
-        chat_id = parts[2]
-        p1_id = int(parts[3])
-        p2_id = int(parts[4])
-        current_turn_id = int(parts[5])
-
-        # Check if user is part of the game
-        if user.id != p1_id and user.id != p2_id:
-            await query.answer("❌ ʏᴏᴜ ᴀʀᴇ ɴᴏᴛ ᴘᴀʀᴛ ᴏғ ᴛʜɪs ɢᴀᴍᴇ!", show_alert=True)
-            return
+    # Check if it's their turn
+    current_turn_id = game.p1.id if game.turn == 1 else game.p2.id
+    if user.id != current_turn_id or actor_busy(f"gp:{game_id}"):
+        await query.answer("⏳ ᴋɪɴᴅʟʏ ᴡᴀɪᴛ ғᴏʀ ʏᴏᴜʀ ᴛᴜʀɴ!", show_alert=True)
+        return
 
-        # Check if it's their turn
-        if user.id != current_turn_id:
-            await query.answer("⏳ ᴋɪɴᴅʟʏ ᴡᴀɪᴛ ғᴏʀ ʏᴏᴜʀ ᴛᴜʀɴ!", show_alert=True)
-            return
+    deadlines.cancel(f"gp:{game_id}")
+    get_actor(f"gp:{game_id}").post(process_group_shot, game_id, user.id, target)
+    await query.answer()
 
-        if chat_id not in group_games:
-            await query.answer("❌ ɢᴀᴍᴇ ɴᴏᴛ ғᴏᴜɴᴅ!", show_alert=True)
-            return
 
-        await process_group_shot(query, chat_id, user.id, target="self")
-        return
+async def on_play_again_private(query, key: str):
+    user_id = str(query.from_user.id)
 
-    # ─────────────────────────────────
-    # PLAY AGAIN
-    # ─────────────────────────────────
-    if data == "play_again_pv":
-        await query.answer()
-
-        user_id = str(user.id)
-        shells, live, blank = generate_shells()
-
-        private_games[user_id] = {
-            'status': 'playing',
-            'p1_hp': 3,
-            'p2_hp': 3,
-            'shells': shells,
-            'shell_idx': 0,
-            'live': live,
-            'blank': blank,
-            'turn': 1,
-            'message_id': query.message.message_id
-        }
-
-        reload_msg = get_reload_msg(live, blank)
-        await query.edit_message_text(reload_msg)
-        await asyncio.sleep(2)
-
-        game_display = get_game_display(private_games[user_id], is_group=False)
-        await query.edit_message_text(game_display, reply_markup=get_private_game_kb(user_id))
+    if actor_busy(f"pv:{user_id}"):
+        await query.answer("⏳ ᴘʟᴇᴀsᴇ ᴡᴀɪᴛ...", show_alert=True)
         return
 
-    if data == "play_again_gp":
-        await query.answer("👆 sᴇɴᴅ /buckshot ᴛᴏ sᴛᴀʀᴛ ᴀ ɴᴇᴡ ɢᴀᴍᴇ!", show_alert=True)
+    if draining:
+        await query.answer(RESTARTING_TEXT, show_alert=True)
         return
 
+    player_stats.seen(query.from_user)
+    new_private_game(user_id, message_id=query.message.message_id)
+    get_actor(f"pv:{user_id}").post(deal_private_game, user_id, None)
     await query.answer()
 
 
+async def on_play_again_group(query, key: str):
+    await query.answer("👆 sᴇɴᴅ /buckshot ᴛᴏ sᴛᴀʀᴛ ᴀ ɴᴇᴡ ɢᴀᴍᴇ!", show_alert=True)
+
+
+# Opcode -> handler(query, key)
+CALLBACK_HANDLERS = {
+    OP_JOIN: on_join,
+    OP_PV_DEALER: partial(on_private_shot, target="dealer"),
+    OP_PV_SELF: partial(on_private_shot, target="self"),
+    OP_GP_OPP: partial(on_group_shot, target="opponent"),
+    OP_GP_SELF: partial(on_group_shot, target="self"),
+    OP_PLAY_AGAIN_PV: on_play_again_private,
+    OP_PLAY_AGAIN_GP: on_play_again_group,
+}
+
+
+# ═══════════════════════════════════════
+#              DEALER AI
+# ═══════════════════════════════════════
+
+# Solved on first use (or loaded from DEALER_TABLE); main() warms it at startup
+policy_table = None
+
+
+def get_policy_table() -> engine.PolicyTable:
+    global policy_table
+
+    if policy_table is None:
+        policy_table, seconds, loaded = engine.load_policy(DEALER_TABLE or None)
+        source = f"loaded from {DEALER_TABLE}" if loaded else "solved"
+        logger.info(f"🎯 Dealer table {source} in {seconds * 1000:.1f}ms "
+                    f"({policy_table.size} states, {policy_table.nbytes} bytes)")
+    return policy_table
+
+
+def dealer_heuristic(game: Game) -> str:
+    """Simple strategy: if low chance of live, shoot self for potential extra turn"""
+    remaining = game.remaining
+    live_ratio = game.live / remaining if remaining > 0 else 0
+
+    if live_ratio < 0.4 and random.random() > 0.3:
+        return "self"
+    return "player"
+
+
+def dealer_target(game: Game) -> str:
+    """Dealer's pick for its shot: "player" or "self" """
+    if DEALER_POLICY == "heuristic":
+        return dealer_heuristic(game)
+
+    if random.random() < DEALER_SKILL:
+        move = get_policy_table().best_move(game.live, game.blank, game.p2_hp, game.p1_hp)
+    else:
+        move = random.choice((engine.SHOOT_OPPONENT, engine.SHOOT_SELF))
+    return "self" if move == engine.SHOOT_SELF else "player"
+
+
 # ═══════════════════════════════════════
 #          GAME LOGIC - PRIVATE
 # ═══════════════════════════════════════
 
-async def process_private_shot(query, user_id: str, target: str):
-    """Process a shot in private game"""
-    await query.answer()
+def new_private_game(user_id: str, message_id) -> Game:
+    """Create (or replace) a user's private game with a fresh magazine"""
+    game = private_games[user_id] = Game(user_id, message_id)
+    persist(game)
+    GAMES_STARTED.inc("private")
+    return game
 
-    game = private_games[user_id]
 
-    # Get shell
-    shell = game['shells'][game['shell_idx']]
-    is_live = shell == 'L'
-    game['shell_idx'] += 1
+async def deal_private_game(user_id: str, message):
+    """Opening animation of a private game: reload, then the board.
+
+    A new game replies to the command `message`; Play Again (no message)
+    reuses the game over message it was tapped on.
+    """
+    game = private_games.get(user_id)
+    if game is None or game.status != 'playing':
+        return
+
+    animation = Animation(game)
+    reload_msg = get_reload_msg(game.live, game.blank)
+    reload_line = get_reload_line(game.live, game.blank)
+    game_display = get_game_display(game, is_group=False)
+    game_kb = get_private_game_kb(user_id)
 
-    if is_live:
-        game['live'] -= 1
+    if message is None:
+        await animation.frame(reload_msg, reload_line, 2)
+        await animation.close(game_display, game_kb)
+        return
+
+    # The first frame is a new message; in fast play it is the board itself
+    if animation.fast:
+        text, reply_markup = get_fast_frame((reload_line,), game_display), game_kb
     else:
-        game['blank'] -= 1
+        text, reply_markup = reload_msg, None
+    msg = await message.reply_text(text, reply_markup=reply_markup)
+    game.message_id = msg.message_id
+    edit_scheduler.showing(game.chat_id, game.message_id, text, reply_markup)
+    persist(game)
+
+    if not animation.fast:
+        await pause(2)
+        await show(game, game_display, game_kb, PRIO_BOARD)
+
+
+async def process_private_shot(user_id: str, target: str):
+    """Process a shot in private game"""
+    game = private_games.get(user_id)
+
+    # The tap was validated when queued; drop it if the game moved on since
+    if game is None or game.status != 'playing' or game.turn != 1:
+        return
 
-    # Process shot
-    extra_turn = False
+    animation = Animation(game)
 
-    if target == "dealer":
-        shooter = "𝕐𝕆𝕌"
-        target_name = "𝔻𝔼𝔸𝕃𝔼ℝ"
+    # Fire
+    at_self = target != "dealer"
+    is_live = game.shoot(at_self)
+    extra_turn = at_self and not is_live
+
+    if not at_self:
         if is_live:
-            game['p2_hp'] -= 1
-            result_msg = get_shot_result_live_opponent(shooter, target_name)
+            result_msg = get_shot_result_live_opponent(YOU, DEALER)
         else:
-            result_msg = get_shot_result_blank_opponent(shooter, target_name)
-        game['turn'] = 2
+            result_msg = get_shot_result_blank_opponent(YOU, DEALER)
     else:
-        shooter = "𝕐𝕆𝕌"
         if is_live:
-            game['p1_hp'] -= 1
-            game['turn'] = 2
-            result_msg = get_shot_result_live_self(shooter)
+            result_msg = get_shot_result_live_self(YOU)
         else:
-            extra_turn = True
-            result_msg = get_shot_result_blank_self(shooter)
+            result_msg = get_shot_result_blank_self(YOU)
+
+    persist(game)
 
     # Show result
-    await query.edit_message_text(result_msg)
-    await asyncio.sleep(2)
+    await animation.frame(result_msg, get_shot_line(YOU, YOU if at_self else DEALER, is_live), 2)
 
     # Check game over
-    if game['p1_hp'] <= 0:
-        game['status'] = 'finished'
+    if game.p1_hp <= 0:
+        finish_game(game)
         game_over = get_game_over_msg("𝔻𝔼𝔸𝕃𝔼ℝ 🤖", "𝕐𝕆𝕌 😵")
-        await query.edit_message_text(game_over, reply_markup=get_play_again_kb(True))
+        await animation.close(game_over, get_play_again_kb(True))
         return
 
-    if game['p2_hp'] <= 0:
-        game['status'] = 'finished'
+    if game.p2_hp <= 0:
+        finish_game(game)
         game_over = get_game_over_msg("𝕐𝕆𝕌 👑", "𝔻𝔼𝔸𝕃𝔼ℝ 🤖")
-        await query.edit_message_text(game_over, reply_markup=get_play_again_kb(True))
+        await animation.close(game_over, get_play_again_kb(True))
         return
 
     # Check reload
-    if game['shell_idx'] >= len(game['shells']):
-        shells, live, blank = generate_shells()
-        game['shells'] = shells
-        game['shell_idx'] = 0
-        game['live'] = live
-        game['blank'] = blank
+    if game.remaining <= 0:
+        game.reload()
+        persist(game)
 
-        reload_msg = get_reload_msg(live, blank)
-        await query.edit_message_text(reload_msg)
-        await asyncio.sleep(2)
+        reload_msg = get_reload_msg(game.live, game.blank)
+        await animation.frame(reload_msg, get_reload_line(game.live, game.blank), 2)
 
     # Extra turn or AI turn
     if extra_turn:
-        extra_msg = get_extra_turn_msg("𝕐𝕆𝕌")
-        await query.edit_message_text(extra_msg)
-        await asyncio.sleep(1.5)
+        extra_msg = get_extra_turn_msg(YOU)
+        await animation.frame(extra_msg, get_extra_turn_line(YOU), 1.5, PRIO_COSMETIC)
 
         game_display = get_game_display(game, is_group=False)
-        await query.edit_message_text(game_display, reply_markup=get_private_game_kb(user_id))
+        await animation.close(game_display, get_private_game_kb(user_id))
     else:
         # AI Turn
-        await process_ai_turn(query, user_id)
+        await process_ai_turn(user_id, animation)
 
 
-async def process_ai_turn(query, user_id: str):
-    """Process AI (dealer) turn"""
+async def process_ai_turn(user_id: str, animation: Animation = None):
+    """Process AI (dealer) turn; `animation` carries on the player's move"""
     game = private_games[user_id]
+    if animation is None:
+        animation = Animation(game)
 
-    while game['turn'] == 2 and game['status'] == 'playing':
+    while game.turn == 2 and game.status == 'playing':
         # AI thinking
-        await query.edit_message_text(get_ai_thinking_msg())
-        await asyncio.sleep(1.5)
-
-        # AI decision - simple strategy
-        remaining = len(game['shells']) - game['shell_idx']
-        live_ratio = game['live'] / remaining if remaining > 0 else 0
-
-        # If low chance of live, shoot self for potential extra turn
-        if live_ratio < 0.4 and random.random() > 0.3:
-            ai_target = "self"
-        else:
-            ai_target = "player"
-
-        # Get shell
-        shell = game['shells'][game['shell_idx']]
-        is_live = shell == 'L'
-        game['shell_idx'] += 1
-
-        if is_live:
-            game['live'] -= 1
-        else:
-            game['blank'] -= 1
+        await animation.frame(get_ai_thinking_msg(), None, 1.5, PRIO_COSMETIC)
 
-        # Process
-        extra_turn = False
+        # Fire
+        at_self = dealer_target(game) == "self"
+        is_live = game.shoot(at_self)
+        extra_turn = at_self and not is_live
 
-        if ai_target == "player":
+        if not at_self:
             if is_live:
-                game['p1_hp'] -= 1
-                result_msg = get_shot_result_live_opponent("𝔻𝔼𝔸𝕃𝔼ℝ", "𝕐𝕆𝕌")
+                result_msg = get_shot_result_live_opponent(DEALER, YOU)
             else:
-                result_msg = get_shot_result_blank_opponent("𝔻𝔼𝔸𝕃𝔼ℝ", "𝕐𝕆𝕌")
-            game['turn'] = 1
+                result_msg = get_shot_result_blank_opponent(DEALER, YOU)
         else:
             if is_live:
-                game['p2_hp'] -= 1
-                game['turn'] = 1
-                result_msg = get_shot_result_live_self("𝔻𝔼𝔸𝕃𝔼ℝ")
+                result_msg = get_shot_result_live_self(DEALER)
             else:
-                extra_turn = True
-                result_msg = get_shot_result_blank_self("𝔻𝔼𝔸𝕃𝔼ℝ")
+                result_msg = get_shot_result_blank_self(DEALER)
+
+        persist(game)
 
         # Show result
-        await query.edit_message_text(result_msg)
-        await asyncio.sleep(2)
+        await animation.frame(result_msg, get_shot_line(DEALER, DEALER if at_self else YOU, is_live), 2)
 
         # Check game over
-        if game['p1_hp'] <= 0:
-            game['status'] = 'finished'
+        if game.p1_hp <= 0:
+            finish_game(game)
             game_over = get_game_over_msg("𝔻𝔼𝔸𝕃𝔼ℝ 🤖", "𝕐𝕆𝕌 😵")
-            await query.edit_message_text(game_over, reply_markup=get_play_again_kb(True))
+            await animation.close(game_over, get_play_again_kb(True))
             return
 
-        if game['p2_hp'] <= 0:
-            game['status'] = 'finished'
+        if game.p2_hp <= 0:
+            finish_game(game)
             game_over = get_game_over_msg("𝕐𝕆𝕌 👑", "𝔻𝔼𝔸𝕃𝔼ℝ 🤖")
-            await query.edit_message_text(game_over, reply_markup=get_play_again_kb(True))
+            await animation.close(game_over, get_play_again_kb(True))
             return
 
         # Check reload
-        if game['shell_idx'] >= len(game['shells']):
-            shells, live, blank = generate_shells()
-            game['shells'] = shells
-            game['shell_idx'] = 0
-            game['live'] = live
-            game['blank'] = blank
+        if game.remaining <= 0:
+            game.reload()
+            persist(game)
 
-            reload_msg = get_reload_msg(live, blank)
-            await query.edit_message_text(reload_msg)
-            await asyncio.sleep(2)
+            reload_msg = get_reload_msg(game.live, game.blank)
+            await animation.frame(reload_msg, get_reload_line(game.live, game.blank), 2)
 
         if extra_turn:
-            extra_msg = get_extra_turn_msg("𝔻𝔼𝔸𝕃𝔼ℝ")
-            await query.edit_message_text(extra_msg)
-            await asyncio.sleep(1.5)
+            extra_msg = get_extra_turn_msg(DEALER)
+            await animation.frame(extra_msg, get_extra_turn_line(DEALER), 1.5, PRIO_COSMETIC)
         else:
             break
 
     # Player's turn
-    if game['status'] == 'playing':
+    if game.status == 'playing':
         game_display = get_game_display(game, is_group=False)
-        await query.edit_message_text(game_display, reply_markup=get_private_game_kb(user_id))
+        await animation.close(game_display, get_private_game_kb(user_id))
 
 
 # ═══════════════════════════════════════
 #          GAME LOGIC - GROUP
 # ═══════════════════════════════════════
 
-async def process_group_shot(query, chat_id: str, shooter_id: int, target: str):
+def new_game_id() -> str:
+    """Short random id for a group game, unique among live games.
+
+    In sharded mode the id must route back to this worker.
+    """
+    while True:
+        game_id = ''.join(random.choices(GAME_ID_ALPHABET, k=6))
+        if game_id in group_games:
+            continue
+        if WORKER_COUNT > 1 and shard_of(game_id) != WORKER_INDEX:
+            continue
+        return game_id
+
+
+def new_group_game(chat_id: str, host: Player) -> Game:
+    """Open a lobby in a chat and index it under that chat"""
+    game_id = new_game_id()
+    game = group_games[game_id] = Game(chat_id, game_id=game_id, p1=host, status='waiting')
+    chat_games.setdefault(chat_id, set()).add(game_id)
+    arm_deadline(game_id, LOBBY_TIMEOUT, expire_lobby)
+    persist(game)
+    return game
+
+
+def drop_group_game(game_id: str):
+    """Forget a group game and remove it from its chat's index"""
+    deadlines.cancel(f"gp:{game_id}")
+    game = group_games.pop(game_id, None)
+    forget(f"gp:{game_id}", game)
+    if game is None:
+        return
+
+    ids = chat_games.get(game.chat_id)
+    if ids is not None:
+        ids.discard(game_id)
+        if not ids:
+            del chat_games[game.chat_id]
+
+
+async def start_group_match(game_id: str):
+    """Match intro, first reload and the opening board of a group game"""
+    game = group_games.get(game_id)
+    if game is None or game.status != 'waiting':
+        return
+
+    animation = Animation(game)
+
+    # Show match found
+    match_msg = get_match_start_msg(game.p1, game.p2)
+    await animation.frame(match_msg, get_match_line(game.p1, game.p2), 2, PRIO_COSMETIC)
+
+    # Initialize game
+    game.status = 'playing'
+    GAMES_STARTED.inc("group")
+    game.p1_hp = engine.MAX_HP
+    game.p2_hp = engine.MAX_HP
+    game.turn = 1
+    game.reload()
+    persist(game)
+
+    # Show reload
+    reload_msg = get_reload_msg(game.live, game.blank)
+    await animation.frame(reload_msg, get_reload_line(game.live, game.blank), 2)
+
+    # Show game
+    game_display = get_game_display(game, is_group=True)
+    await animation.close(game_display, get_group_game_kb(game_id))
+    arm_deadline(game_id, TURN_TIMEOUT, turn_timeout)
+
+
+async def expire_lobby(game_id: str):
+    """Close a lobby nobody joined"""
+    game = group_games.get(game_id)
+    if game is None or game.status != 'waiting':
+        return
+
+    drop_group_game(game_id)
+    await show(game, get_lobby_expired_msg(), priority=PRIO_BOARD)
+
+
+async def turn_timeout(game_id: str):
+    """The player to move sat on their turn: forfeit, or fire at the opponent for them"""
+    game = group_games.get(game_id)
+    if game is None or game.status != 'playing':
+        return
+
+    afk, other = (game.p1, game.p2) if game.turn == 1 else (game.p2, game.p1)
+
+    if TURN_TIMEOUT_ACTION == "shoot":
+        await process_group_shot(game_id, afk.id, "opponent")
+        return
+
+    animation = Animation(game)
+    await animation.frame(get_afk_msg(afk.label), get_afk_line(afk.label), 2)
+
+    finish_game(game, eventlog.END_FORFEIT)
+    game_over = get_game_over_msg(other.display + " 👑", afk.display + " ⌛", other.mention)
+    await animation.close(game_over, get_play_again_kb(False))
+    drop_group_game(game_id)
+
+
+async def process_group_shot(game_id: str, shooter_id: int, target: str):
     """Process a shot in group game"""
-    await query.answer()
+    game = group_games.get(game_id)
 
-    game = group_games[chat_id]
+    # The tap was validated when queued; drop it if the game moved on since
+    if game is None or game.status != 'playing':
+        return
 
     # Determine shooter and opponent
-    if game['turn'] == 1:
-        shooter = game['p1']
-        opponent = game['p2']
-        shooter_hp_key = 'p1_hp'
-        opponent_hp_key = 'p2_hp'
+    if game.turn == 1:
+        shooter, opponent = game.p1, game.p2
     else:
-        shooter = game['p2']
-        opponent = game['p1']
-        shooter_hp_key = 'p2_hp'
-        opponent_hp_key = 'p1_hp'
+        shooter, opponent = game.p2, game.p1
 
-    shooter_name = f"@{shooter['username']}" if shooter['username'] else shooter['name']
-    opponent_name = f"@{opponent['username']}" if opponent['username'] else opponent['name']
-
-    # Get shell
-    shell = game['shells'][game['shell_idx']]
-    is_live = shell == 'L'
-    game['shell_idx'] += 1
+    if shooter_id != shooter.id:
+        return
 
-    if is_live:
-        game['live'] -= 1
-    else:
-        game['blank'] -= 1
+    animation = Animation(game)
 
-    # Process shot
-    extra_turn = False
+    # Fire
+    at_self = target != "opponent"
+    is_live = game.shoot(at_self)
+    extra_turn = at_self and not is_live
 
-    if target == "opponent":
+    if not at_self:
         if is_live:
-            game[opponent_hp_key] -= 1
-            result_msg = get_shot_result_live_opponent(shooter_name[:12], opponent_name[:12])
+            result_msg = get_shot_result_live_opponent(shooter.label, opponent.label)
         else:
-            result_msg = get_shot_result_blank_opponent(shooter_name[:12], opponent_name[:12])
-        game['turn'] = 2 if game['turn'] == 1 else 1
+            result_msg = get_shot_result_blank_opponent(shooter.label, opponent.label)
     else:
         if is_live:
-            game[shooter_hp_key] -= 1
-            game['turn'] = 2 if game['turn'] == 1 else 1
-            result_msg = get_shot_result_live_self(shooter_name[:12])
+            result_msg = get_shot_result_live_self(shooter.label)
         else:
-            extra_turn = True
-            result_msg = get_shot_result_blank_self(shooter_name[:12])
+            result_msg = get_shot_result_blank_self(shooter.label)
+
+    persist(game)
 
     # Show result
-    await query.edit_message_text(result_msg)
-    await asyncio.sleep(2)
+    shot_line = get_shot_line(shooter.label, shooter.label if at_self else opponent.label, is_live)
+    await animation.frame(result_msg, shot_line, 2)
 
     # Check game over - with winner mention
-    p1_name = f"@{game['p1']['username']}" if game['p1']['username'] else game['p1']['name']
-    p2_name = f"@{game['p2']['username']}" if game['p2']['username'] else game['p2']['name']
-
-    if game['p1_hp'] <= 0:
-        game['status'] = 'finished'
+    if game.p1_hp <= 0:
+        finish_game(game)
         # Winner is p2, mention them
-        winner_mention = f"@{game['p2']['username']}" if game['p2']['username'] else None
-        game_over = get_game_over_msg(p2_name + " 👑", p1_name + " 💀", winner_mention)
-        await query.edit_message_text(game_over, reply_markup=get_play_again_kb(False))
-        del group_games[chat_id]
+        game_over = get_game_over_msg(game.p2.display + " 👑", game.p1.display + " 💀", game.p2.mention)
+        await animation.close(game_over, get_play_again_kb(False))
+        drop_group_game(game_id)
         return
 
-    if game['p2_hp'] <= 0:
-        game['status'] = 'finished'
+    if game.p2_hp <= 0:
+        finish_game(game)
         # Winner is p1, mention them
-        winner_mention = f"@{game['p1']['username']}" if game['p1']['username'] else None
-        game_over = get_game_over_msg(p1_name + " 👑", p2_name + " 💀", winner_mention)
-        await query.edit_message_text(game_over, reply_markup=get_play_again_kb(False))
-        del group_games[chat_id]
+        game_over = get_game_over_msg(game.p1.display + " 👑", game.p2.display + " 💀", game.p1.mention)
+        await animation.close(game_over, get_play_again_kb(False))
+        drop_group_game(game_id)
         return
 
     # Check reload
-    if game['shell_idx'] >= len(game['shells']):
-        shells, live, blank = generate_shells()
-        game['shells'] = shells
-        game['shell_idx'] = 0
-        game['live'] = live
-        game['blank'] = blank
+    if game.remaining <= 0:
+        game.reload()
+        persist(game)
 
-        reload_msg = get_reload_msg(live, blank)
-        await query.edit_message_text(reload_msg)
-        await asyncio.sleep(2)
+        reload_msg = get_reload_msg(game.live, game.blank)
+        await animation.frame(reload_msg, get_reload_line(game.live, game.blank), 2)
 
     # Extra turn message
     if extra_turn:
-        extra_msg = get_extra_turn_msg(shooter_name[:12])
-        await query.edit_message_text(extra_msg)
-        await asyncio.sleep(1.5)
+        extra_msg = get_extra_turn_msg(shooter.label)
+        await animation.frame(extra_msg, get_extra_turn_line(shooter.label), 1.5, PRIO_COSMETIC)
 
     # Show game
     game_display = get_game_display(game, is_group=True)
-    current_turn_id = game['p1']['id'] if game['turn'] == 1 else game['p2']['id']
-    await query.edit_message_text(
-        game_display, 
-        reply_markup=get_group_game_kb(chat_id, game['p1']['id'], game['p2']['id'], current_turn_id)
-    )
+    await animation.close(game_display, get_group_game_kb(game_id))
+    arm_deadline(game_id, TURN_TIMEOUT, turn_timeout)
 
 
 # ═══════════════════════════════════════
-#               MAIN
+#              STARTUP
 # ═══════════════════════════════════════
 
-async def main():
-    """Main function to run the bot"""
-    logger.info("🔫 Starting Buckshot Roulette Bot...")
+class StartupProfile:
+    """Wall time between startup milestones, logged once when STARTUP_PROFILE is set"""
 
-    bot = Application.builder().token(TOKEN).build()
+    def __init__(self, began: float):
+        self.began = began
+        self.last = began
+        self.phases = {}
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def once(self, phase: str) -> bool:
+        """Mark `phase` the first time only; True if it was marked now"""
+        if phase in self.phases:
+            return False
+        self.mark(phase)
+        return True
+
+    def report(self):
+        if not STARTUP_PROFILE:
+            return
+        steps = ", ".join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in self.phases.items())
+        logger.info(f"⏱️ Startup took {(self.last - self.began) * 1000:.0f}ms: {steps}")
+
+
+# Everything above, imports included, counts as "imports"
+startup = StartupProfile(IMPORT_STARTED)
+startup.mark("imports")
+
+
+async def note_update(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    liveness['update'] = time.monotonic()
+
+
+async def note_handled(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    if startup.once("first update"):
+        startup.report()
+
+
+def build_bot(with_updater: bool = True) -> Application:
+    """Application with every handler registered"""
+    builder = (
+        Application.builder().token(TOKEN)
+        .base_url(f"{BOT_API_URL}/bot").base_file_url(f"{BOT_API_URL}/file/bot")
+        .request(api_request("api"))
+        .get_updates_request(api_request("updates"))
+        .concurrent_updates(UPDATE_CONCURRENCY)
+    )
+    if tracer.enabled:
+        builder = builder.update_queue(StampedQueue())
+    if not with_updater:
+        builder = builder.updater(None)
+    bot = builder.build()
 
     # Commands
     bot.add_handler(CommandHandler("start", start_cmd))
     bot.add_handler(CommandHandler("buckshotpv", buckshotpv_cmd))
     bot.add_handler(CommandHandler("buckshot", buckshot_cmd))
+    bot.add_handler(CommandHandler("top", top_cmd))
+    bot.add_handler(CommandHandler("fast", fast_cmd))
 
     # Callbacks
     bot.add_handler(CallbackQueryHandler(callback_handler))
 
-    # Flask for health check
-    Thread(target=run_flask, daemon=True).start()
+    # Runs before the handlers above for every update
+    bot.add_handler(TypeHandler(Update, note_update), group=-1)
+    if STARTUP_PROFILE:
+        # ...and this one after them
+        bot.add_handler(TypeHandler(Update, note_handled), group=1)
+
+    return bot
+
+
+async def start_ingestion(bot: Application, drop_pending: bool = True):
+    """Start receiving updates: webhook if configured, polling otherwise.
+
+    Updates that queued up while the bot was down are dropped, unless the
+    games they belong to were handed over in a shutdown snapshot.
+    """
+    global bot_app, bot_loop
+    bot_app = bot
+    bot_loop = asyncio.get_running_loop()
+
+    if UPDATE_MODE == "webhook":
+        if WEBHOOK_URL:
+            await bot.bot.set_webhook(
+                url=WEBHOOK_URL + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=drop_pending
+            )
+        logger.info(f"🔗 Webhook mode on {WEBHOOK_PATH}")
+    else:
+        await bot.updater.start_polling(drop_pending_updates=drop_pending)
+        logger.info("🔁 Polling mode")
+
+
+async def load_db(path: str) -> tuple:
+    """Open the game database and read every saved game and player's stats, on a worker thread"""
+    global game_db
+
+    game_db = await asyncio.to_thread(GameDB, path)
+    return await asyncio.to_thread(game_db.load), await asyncio.to_thread(game_db.load_stats)
+
+
+async def open_event_log(path: str) -> dict:
+    """Last logged state of every game (read on a worker thread), then open the log for appending"""
+    global event_log, checkpointer
+
+    logged = {}
+    if os.path.exists(path):
+        start = time.perf_counter()
+        logged = await asyncio.to_thread(lambda: eventlog.last_states(eventlog.read_tail(path, EVENT_LOG_TAIL)))
+        logger.info(f"📜 Read {len(logged)} games from {path} in {(time.perf_counter() - start) * 1000:.0f}ms")
+    event_log = eventlog.EventLog(path, EVENT_LOG_FLUSH)
+    checkpointer = asyncio.create_task(checkpoint_events())
+    return logged
+
+
+async def warm_start(bot: Application, db_path: str, log_path: str, snapshot_path: str = None) -> bool:
+    """Initialize and start the bot, restoring saved games; True if they came from a snapshot.
+
+    The dealer table, the saved games and the event log load on worker
+    threads while initialize() waits on Telegram; games are only restored
+    once the bot can send, since a restored dealer turn edits its message
+    right away. A shutdown snapshot, when there is one, is newer than the
+    database and replaces its games; it is deleted once restored.
+    """
+    loop = asyncio.get_running_loop()
+    policy = loop.run_in_executor(None, get_policy_table) if DEALER_POLICY != "heuristic" else None
+    saved = asyncio.ensure_future(load_db(db_path)) if db_path else None
+    log = asyncio.ensure_future(open_event_log(log_path)) if log_path else None
+    snapshot = None
+    if snapshot_path and os.path.exists(snapshot_path):
+        snapshot = asyncio.ensure_future(asyncio.to_thread(read_snapshot, snapshot_path))
 
-    # Start bot
     await bot.initialize()
     await bot.start()
-    await bot.updater.start_polling(drop_pending_updates=True)
+    startup.mark("initialize")
+
+    if policy is not None:
+        await policy
+    logged = await log if log is not None else None
+    rows, stats_rows, stale, source = [], [], (), db_path
+    if saved is not None:
+        rows, stats_rows = await saved
+    if snapshot is not None:
+        try:
+            rows, stale = await snapshot
+            source = snapshot_path
+            os.remove(snapshot_path)
+        except (OSError, ValueError, struct.error):
+            logger.exception(f"Unreadable snapshot {snapshot_path}, set aside as {snapshot_path}.bad")
+            os.replace(snapshot_path, f"{snapshot_path}.bad")
+    if source:
+        restored = restore_games(rows, logged)
+        player_stats.load(stats_rows)
+        repainted = repaint_games(stale)
+        logger.info(f"💾 Restored {restored} games ({repainted} repainted) and {len(stats_rows)} player stats "
+                    f"from {source}")
+    startup.mark("restore")
+    return source is not None and source == snapshot_path
+
+
+async def drain(bot: Application) -> set:
+    """Stop taking updates and give moves already running DRAIN_TIMEOUT seconds to finish.
+
+    Updates already fetched are still handled, but new games among them
+    are refused. Pauses are skipped from here on, so a move only waits on
+    its edits. Returns the keys of games whose move was still running at
+    the deadline; their actors are stopped where they are.
+    """
+    global draining
+
+    draining = True
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    if deadlines.task is not None:
+        # Timeouts would start new moves; restore_game() re-arms them on the next boot
+        deadlines.task.cancel()
+    if bot.updater is not None and bot.updater.running:
+        await bot.updater.stop()
+    await bot.stop()
+
+    busy = [actor for actor in game_actors.values() if actor.busy]
+    while time.monotonic() < deadline:
+        busy = [actor for actor in busy if actor.busy]
+        if not busy and not edit_scheduler.pending and not edit_scheduler.inflight:
+            break
+        await asyncio.sleep(0.05)
+
+    cut = {actor.key for actor in busy if actor.busy}
+    for actor in busy:
+        actor.task.cancel()
+    if cut:
+        logger.warning(f"⏹️ {len(cut)} moves still running after {DRAIN_TIMEOUT:.0f}s, stopped mid-move")
+    return cut
+
+
+async def stop_bot(bot: Application, sweeper, snapshot_path: str = None):
+    """Drain, snapshot the live games and flush what's left to disk"""
+    global bot_app
+
+    bot_app = None
+    sweeper.cancel()
+    logger.info("🛑 Shutting down: finishing moves in progress")
+    cut = await drain(bot)
+    if snapshot_path:
+        start = time.perf_counter()
+        try:
+            saved = await save_snapshot(snapshot_path, cut)
+            logger.info(f"📸 Saved {saved} games to {snapshot_path} in {(time.perf_counter() - start) * 1000:.0f}ms")
+        except OSError:
+            logger.exception(f"Snapshot {snapshot_path} failed")
+    try:
+        await edit_scheduler.close()
+        await bot.shutdown()
+        if game_db is not None:
+            await game_db.stop()
+    finally:
+        if checkpointer is not None:
+            checkpointer.cancel()
+        if event_log is not None:
+            await event_log.close()
+        tracer.stop()
+
+
+def on_shutdown_signal(callback, *args):
+    """Call `callback(*args)` on SIGTERM or SIGINT instead of dying mid-move"""
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, callback, *args)
+
+
+# ═══════════════════════════════════════
+#              SHARDING
+# ═══════════════════════════════════════
+
+def route_key(data: dict) -> str:
+    """Key of the game a raw update belongs to.
+
+    Game buttons carry their key (game id / user id); other taps and
+    messages go by user in private chats and by chat in groups, so a
+    group's lobbies are opened on the worker its chat maps to.
+    """
+    query = data.get('callback_query')
+    if query is not None:
+        op, key = decode_callback(query.get('data') or '')
+        return key or str(query['from']['id'])
+
+    message = data.get('message') or data.get('edited_message') or {}
+    return str(message.get('chat', {}).get('id', 0))
+
+
+def shard_of(key: str, count: int = None) -> int:
+    """Stable shard index for a game key"""
+    return zlib.crc32(key.encode()) % (count or WORKER_COUNT)
 
-    logger.info("🔫 BUCKSHOT ROULETTE BOT READY!")
 
+async def collect_stats(results):
+    """Apply the results the workers' StatsFeeds send, until a None"""
+    loop = asyncio.get_running_loop()
+    while True:
+        result = await loop.run_in_executor(None, results.get)
+        if result is None:
+            return
+        player_stats.apply(result)
+
+
+async def run_front():
+    """Sharded front: fetch updates and forward each one to the worker that owns its game.
+
+    Every update for a given game lands on the same worker, which handles
+    it serially on its own event loop. Player stats span every worker's
+    games, so they are kept here: workers send their results over and
+    /top is answered without leaving the front.
+    """
+    global game_db
+
+    # Checked before the workers start, since they delete their snapshots once restored
+    handoff = bool(SNAPSHOT_PATH) and any(os.path.exists(f"{SNAPSHOT_PATH}.{i}") for i in range(WORKERS))
+    context = multiprocessing.get_context("spawn")
+    inboxes = [context.Queue() for _ in range(WORKERS)]
+    results = context.Queue()
+    workers = [
+        context.Process(target=run_worker, args=(i, WORKERS, inboxes[i], results), name=f"shard-{i}", daemon=True)
+        for i in range(WORKERS)
+    ]
+    for worker in workers:
+        worker.start()
+    logger.info(f"🧩 Sharded mode: {WORKERS} workers")
+
+    # Only the bot, the updater and /top are used here; other handlers run in the workers
+    bot = (
+        Application.builder().token(TOKEN).base_url(f"{BOT_API_URL}/bot")
+        .request(api_request("api")).get_updates_request(api_request("updates")).build()
+    )
+    top = CommandHandler("top", top_cmd)
+    bot.add_handler(top)
+    http_server = await start_http()
+
+    if DB_PATH:
+        game_db = await asyncio.to_thread(GameDB, DB_PATH)
+        player_stats.load(await asyncio.to_thread(game_db.load_stats))
+    collector = asyncio.create_task(collect_stats(results))
+
+    await bot.initialize()
+    await start_ingestion(bot, drop_pending=not handoff)
+    prober = asyncio.create_task(probe_api(bot.bot))
+    on_shutdown_signal(bot.update_queue.put_nowait, None)
+
+    replies = set()
     try:
         while True:
-            await asyncio.sleep(3600)
-    except:
-        pass
+            update = await bot.update_queue.get()
+            if update is None:
+                break
+            liveness['update'] = time.monotonic()
+            if top.check_update(update):
+                reply = asyncio.create_task(bot.process_update(update))
+                replies.add(reply)
+                reply.add_done_callback(replies.discard)
+                continue
+            data = update.to_dict()
+            inboxes[shard_of(route_key(data), WORKERS)].put_nowait(data)
     finally:
-        await bot.updater.stop()
-        await bot.stop()
+        prober.cancel()
+        if bot.updater.running:
+            await bot.updater.stop()
+        await asyncio.gather(*replies, return_exceptions=True)
         await bot.shutdown()
+        if http_server is not None:
+            http_server.close()
+        for inbox in inboxes:
+            inbox.put(None)
+        for worker in workers:
+            worker.join(timeout=DRAIN_TIMEOUT + 10)
+        # The workers are gone, so everything they sent is queued ahead of this
+        results.put(None)
+        await collector
+        if game_db is not None:
+            await game_db.stop()
+
+
+def run_worker(index: int, count: int, inbox, results):
+    """Process entry point of a shard worker"""
+    asyncio.run(worker_main(index, count, inbox, results))
+
+
+async def worker_main(index: int, count: int, inbox, results):
+    """Own one shard of the games: handle the updates the front routes here"""
+    global WORKER_INDEX, WORKER_COUNT, edit_scheduler, player_stats
+
+    WORKER_INDEX, WORKER_COUNT = index, count
+    player_stats = StatsFeed(results)
+    if TRACE_FILE:
+        tracer.start(f"{TRACE_FILE}.{index}")
+    bot = build_bot(with_updater=False)
+    edit_scheduler = EditScheduler(bot.bot, global_rate=GLOBAL_EDIT_RATE / count)
+    sweeper = asyncio.create_task(sweep_games())
+    snapshot_path = f"{SNAPSHOT_PATH}.{index}" if SNAPSHOT_PATH else None
+    await warm_start(bot, f"{DB_PATH}.{index}" if DB_PATH else None, f"{EVENT_LOG}.{index}" if EVENT_LOG else None,
+                     snapshot_path)
+    # A signal to the whole process group reaches the workers too; the front's
+    # None follows and is never read
+    on_shutdown_signal(inbox.put_nowait, None)
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            data = await loop.run_in_executor(None, inbox.get)
+            if data is None:
+                break
+            await bot.update_queue.put(Update.de_json(data, bot.bot))
+    finally:
+        await stop_bot(bot, sweeper, snapshot_path)
+
+
+# ═══════════════════════════════════════
+#               MAIN
+# ═══════════════════════════════════════
+
+async def main():
+    """Main function to run the bot"""
+    global edit_scheduler
+
+    logger.info("🔫 Starting Buckshot Roulette Bot...")
+
+    if WORKERS > 1:
+        await run_front()
+        return
+
+    if TRACE_FILE:
+        tracer.start(TRACE_FILE)
+    bot = build_bot()
+    edit_scheduler = EditScheduler(bot.bot)
+    startup.mark("build")
+
+    # Health, readiness and metrics
+    http_server = await start_http()
+
+    sweeper = asyncio.create_task(sweep_games())
+    handoff = await warm_start(bot, DB_PATH, EVENT_LOG, SNAPSHOT_PATH)
+
+    await start_ingestion(bot, drop_pending=not handoff)
+    prober = asyncio.create_task(probe_api(bot.bot))
+    startup.mark("ingestion")
+
+    logger.info("🔫 BUCKSHOT ROULETTE BOT READY!")
+
+    stopping = asyncio.Event()
+    on_shutdown_signal(stopping.set)
+    try:
+        await stopping.wait()
+    finally:
+        prober.cancel()
+        await stop_bot(bot, sweeper, SNAPSHOT_PATH)
+        if http_server is not None:
+            http_server.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,180 @@
+"""
+Read and replay the game event log the bot writes when EVENT_LOG is set.
+
+    python replay.py LOG [--tail S] [--db FILE]
+                                        rebuild the games from the last S seconds of the
+                                        log (all of it by default), timed; --db also
+                                        times loading the SQLite snapshot
+    python replay.py LOG --game KEY     history of the latest game under KEY
+                                        ("pv:<user id>" or "gp:<game id>"), replayed
+    python replay.py LOG --verify       replay every game whose start is in the log
+
+Replaying deals each magazine again from the game's seed and re-applies
+every shot with engine.resolve_shot; any record that disagrees is reported.
+"""
+import argparse
+import sqlite3
+import sys
+import time
+
+import engine
+import eventlog
+from eventlog import EV_START, EV_RELOAD, EV_SHOT, EV_END, EV_CHECKPOINT
+
+
+class Replay:
+    """One game re-played from its START record, checking every later record against the rules"""
+
+    def __init__(self, start: eventlog.Event):
+        self.seed = start.seed
+        self.p1_hp, self.p2_hp, self.turn = start.p1_hp, start.p2_hp, start.turn
+        self.magazine = self.mag_len = self.shell_idx = 0
+        self.errors = []
+
+    def check(self, event: eventlog.Event, what: str, expected, logged):
+        if expected != logged:
+            self.errors.append(f"seq {event.seq} {eventlog.KIND_NAMES.get(event.kind, event.kind)}: "
+                               f"{what} should be {expected}, log has {logged}")
+
+    def apply(self, event: eventlog.Event):
+        if event.kind == EV_RELOAD:
+            magazine, live, blank = engine.generate_shells(engine.magazine_rng(self.seed, event.shell))
+            self.check(event, "magazine", (magazine, live + blank), (event.magazine, event.mag_len))
+            self.magazine, self.mag_len, self.shell_idx = magazine, live + blank, 0
+            # A group match resets HP and turn when it is dealt, so take them as logged
+            self.p1_hp, self.p2_hp, self.turn = event.p1_hp, event.p2_hp, event.turn
+
+        elif event.kind == EV_SHOT:
+            self.check(event, "shooter", self.turn, event.actor)
+            is_live = (self.magazine >> self.shell_idx) & 1 == 1
+            self.shell_idx += 1
+            self.check(event, "shell", int(is_live), event.shell)
+            self.p1_hp, self.p2_hp, self.turn = engine.resolve_shot(
+                self.p1_hp, self.p2_hp, self.turn, event.target == engine.SHOOT_SELF, is_live
+            )
+            self.check(event, "state", (self.p1_hp, self.p2_hp, self.turn, self.shell_idx),
+                       (event.p1_hp, event.p2_hp, event.turn, event.shell_idx))
+
+        elif event.kind == EV_CHECKPOINT:
+            self.check(event, "state", (self.p1_hp, self.p2_hp, self.turn, self.magazine, self.mag_len, self.shell_idx),
+                       (event.p1_hp, event.p2_hp, event.turn, event.magazine, event.mag_len, event.shell_idx))
+
+        elif event.kind == EV_END and event.target == eventlog.END_FINISHED:
+            self.check(event, "a winner", True, engine.winner(self.p1_hp, self.p2_hp) != 0)
+
+
+def describe(event: eventlog.Event) -> str:
+    when = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(event.time))
+    kind = eventlog.KIND_NAMES.get(event.kind, str(event.kind))
+    state = f"HP {event.p1_hp}/{event.p2_hp}  turn P{event.turn}"
+    if event.kind == EV_START:
+        detail = f"seed {event.seed}"
+    elif event.kind in (EV_RELOAD, EV_CHECKPOINT):
+        shells = "".join("L" if event.magazine >> i & 1 else "b" for i in range(event.mag_len))
+        detail = f"#{event.shell} {shells}"
+    elif event.kind == EV_SHOT:
+        target = "self" if event.target == engine.SHOOT_SELF else "opponent"
+        detail = f"P{event.actor} -> {target}, {'LIVE' if event.shell else 'blank'}"
+    else:
+        detail = eventlog.END_NAMES.get(event.target, str(event.target))
+    return f"{when}  {event.seq:4}  {kind:6}  {detail:28}  {state}"
+
+
+def show_game(path: str, key: str) -> int:
+    ref, _ = eventlog.game_ref(key)
+    events = []
+    for record in eventlog.read_records(path):
+        if record[0] != ref:
+            continue
+        event = eventlog.Event._make(record)
+        if event.kind == EV_START or (events and events[-1].seed != event.seed):
+            events = []
+        events.append(event)
+
+    if not events:
+        print(f"{key}: not in {path}")
+        return 1
+    for event in events:
+        print(describe(event))
+
+    if events[0].kind != EV_START:
+        print("replay: the game started before this log did")
+        return 0
+    replay = Replay(events[0])
+    for event in events[1:]:
+        replay.apply(event)
+    for error in replay.errors:
+        print(f"MISMATCH {error}")
+    print(f"replay: {'ok' if not replay.errors else f'{len(replay.errors)} mismatches'}")
+    return 1 if replay.errors else 0
+
+
+def verify(path: str) -> int:
+    start = time.perf_counter()
+    games = {}
+    results = []    # (ref, errors) of every game replayed
+
+    for record in eventlog.read_records(path):
+        ref = record[0]
+        event = eventlog.Event._make(record)
+        replay = games.get(ref)
+        if event.kind == EV_START:
+            if replay is not None:
+                results.append((ref, replay.errors))
+            games[ref] = Replay(event)
+            continue
+        if replay is None or replay.seed != event.seed:
+            continue
+        replay.apply(event)
+        if event.kind == EV_END:
+            results.append((ref, games.pop(ref).errors))
+    results.extend((ref, replay.errors) for ref, replay in games.items())
+
+    failed = [(ref, errors) for ref, errors in results if errors]
+    for ref, errors in failed[:20]:
+        print(f"{eventlog.game_key(ref)}: {errors[0]}")
+    print(f"replayed {len(results):,} games in {time.perf_counter() - start:.2f}s, {len(failed):,} with mismatches")
+    return 1 if failed else 0
+
+
+def summary(path: str, tail: float = None, db: str = None) -> int:
+    start = time.perf_counter()
+    data = eventlog.read_tail(path, tail)
+    read = time.perf_counter()
+    states = eventlog.last_states(data)
+    rebuilt = time.perf_counter()
+    live = sum(1 for event, _ in states.values() if event.kind != EV_END)
+
+    print(f"{path}: {len(data) // eventlog.RECORD.size:,} events read, {len(states):,} games, {live:,} live")
+    print(f"log      read {(read - start) * 1000:7.1f}ms  rebuild {(rebuilt - read) * 1000:7.1f}ms  "
+          f"total {(rebuilt - start) * 1000:7.1f}ms")
+
+    if db:
+        start = time.perf_counter()
+        conn = sqlite3.connect(db)
+        rows = conn.execute(
+            "SELECT key, chat_id, message_id, status, state, players FROM games WHERE status != 'finished'"
+        ).fetchall()
+        conn.close()
+        print(f"snapshot load {(time.perf_counter() - start) * 1000:7.1f}ms  ({len(rows):,} games in {db})")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Buckshot Roulette event log replay")
+    parser.add_argument("log")
+    parser.add_argument("--game", help='game key, "pv:<user id>" or "gp:<game id>"')
+    parser.add_argument("--verify", action="store_true", help="replay every game in the log")
+    parser.add_argument("--tail", type=float, help="only read this many seconds back from the last event")
+    parser.add_argument("--db", help="SQLite snapshot to time against the log")
+    args = parser.parse_args()
+
+    if args.game:
+        return show_game(args.log, args.game)
+    if args.verify:
+        return verify(args.log)
+    return summary(args.log, args.tail, args.db)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Batch game simulator for balancing the rules in engine.py.
+
+Plays whole populations of games at once as NumPy arrays, one shell per
+step for every game still running, and reports win rates, game length,
+reloads and first-mover advantage.
+
+    python simulate.py [--games N] [--player STRATEGY] [--dealer STRATEGY]
+                       [--hp N] [--max-live N] [--max-blank N] [--seed N]
+
+Strategies: optimal, heuristic, random, opponent (always shoot the
+opponent), odds (shoot yourself when blanks outnumber lives).
+
+Needs NumPy (pip install numpy); the bot itself does not.
+"""
+import argparse
+import time
+
+import numpy as np
+
+import engine
+
+STRATEGIES = ("optimal", "heuristic", "random", "opponent", "odds")
+
+# Upper bound on shells fired in one game; only reached by pathological rules
+MAX_STEPS = 1000
+
+
+class Strategy:
+    """Vectorized move choice: True where the shooter fires at itself"""
+
+    def __init__(self, name: str, rules: dict):
+        self.name = name
+        if name == "optimal":
+            table = engine.PolicyTable.solve(rules['hp'], rules['max_live'], rules['max_blank'])
+            self.table = table
+            self.moves = np.frombuffer(bytes(table.move), dtype=np.uint8).astype(bool)
+
+    def __call__(self, rng, live, blank, hp, opp_hp) -> np.ndarray:
+        if self.name == "optimal":
+            table = self.table
+            index = ((live.astype(np.int32) * (table.max_blank + 1) + blank) * (table.max_hp + 1) + hp) \
+                * (table.max_hp + 1) + opp_hp
+            return self.moves[index]
+        if self.name == "heuristic":
+            # main.dealer_heuristic: live_ratio < 0.4 and random() > 0.3
+            remaining = live + blank
+            return (live < 0.4 * remaining) & (rng.random(live.size, dtype=np.float32) > 0.3)
+        if self.name == "random":
+            return rng.random(live.size, dtype=np.float32) < 0.5
+        if self.name == "odds":
+            return live < blank
+        return np.zeros(live.size, dtype=bool)
+
+
+def simulate(games: int, player: Strategy, dealer: Strategy, rules: dict, rng) -> dict:
+    """Play `games` games, half with the player shooting first and half with the dealer.
+
+    Side 0 is the player, side 1 the dealer. Finished games are dropped
+    from the working arrays as the population shrinks.
+    """
+    hp_max, max_live, max_blank = rules['hp'], rules['max_live'], rules['max_blank']
+
+    first = (np.arange(games) & 1).astype(np.int8)   # side that shoots first
+    turn = first.copy()
+    hp0 = np.full(games, hp_max, dtype=np.int8)
+    hp1 = hp0.copy()
+    live = rng.integers(1, max_live + 1, games, dtype=np.int8)
+    blank = rng.integers(1, max_blank + 1, games, dtype=np.int8)
+    reloads = np.zeros(games, dtype=np.int16)
+    running = np.ones(games, dtype=bool)
+
+    player_wins = np.zeros(2, dtype=np.int64)       # by who shot first
+    lengths = np.zeros(MAX_STEPS + 1, dtype=np.int64)
+    total_reloads = 0
+    finished = 0
+
+    for shots in range(1, MAX_STEPS + 1):
+        n = turn.size
+        players_turn = turn == 0
+        own_hp = np.where(players_turn, hp0, hp1)
+        opp_hp = np.where(players_turn, hp1, hp0)
+
+        at_self = np.where(
+            players_turn,
+            player(rng, live, blank, own_hp, opp_hp),
+            dealer(rng, live, blank, own_hp, opp_hp),
+        )
+        # The next shell of a shuffled magazine is live with chance live / remaining
+        is_live = rng.random(n, dtype=np.float32) * (live + blank) < live
+
+        hits_player = is_live & (at_self == players_turn)
+        hp0 -= hits_player
+        hp1 -= is_live & ~hits_player
+        live -= is_live
+        blank -= ~is_live
+        turn ^= (is_live | ~at_self).astype(np.int8)
+
+        # Games that ended this shot; finished ones keep playing until compacted
+        over = (hp0 <= 0) | (hp1 <= 0)
+        done = over & running
+        empty = np.flatnonzero((live + blank) == 0)
+        if empty.size:
+            live[empty] = rng.integers(1, max_live + 1, empty.size, dtype=np.int8)
+            blank[empty] = rng.integers(1, max_blank + 1, empty.size, dtype=np.int8)
+            reloads[empty] += 1
+
+        ended = int(np.count_nonzero(done))
+        if ended:
+            # The magazine that was just reloaded for a finished game doesn't count
+            ended_reloads = int(reloads[done].sum()) - int(np.count_nonzero(done[empty]))
+            player_wins += np.bincount(first[done & (hp1 <= 0)], minlength=2)
+            lengths[shots] += ended
+            total_reloads += ended_reloads
+            finished += ended
+            running &= ~over
+
+            if finished == games:
+                break
+            if running.sum() < n * 0.75:
+                keep = running
+                turn, first, live, blank = turn[keep], first[keep], live[keep], blank[keep]
+                hp0, hp1, reloads = hp0[keep], hp1[keep], reloads[keep]
+                running = running[keep]
+
+    by_first = np.bincount(np.arange(games) & 1, minlength=2)
+    cumulative = np.cumsum(lengths)
+    return {
+        'games': finished,
+        'unfinished': games - finished,
+        'player_win_rate': player_wins.sum() / finished,
+        'player_win_rate_first': player_wins[0] / by_first[0],
+        'player_win_rate_second': player_wins[1] / by_first[1],
+        'first_mover_win_rate': (player_wins[0] + by_first[1] - player_wins[1]) / games,
+        'mean_shots': float((lengths * np.arange(lengths.size)).sum() / finished),
+        'p50_shots': int(np.searchsorted(cumulative, finished * 0.5)),
+        'p99_shots': int(np.searchsorted(cumulative, finished * 0.99)),
+        'mean_reloads': total_reloads / finished,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch Buckshot Roulette simulator")
+    parser.add_argument("--games", type=int, default=1_000_000)
+    parser.add_argument("--player", choices=STRATEGIES, default="optimal")
+    parser.add_argument("--dealer", choices=STRATEGIES, default="heuristic")
+    parser.add_argument("--hp", type=int, default=engine.MAX_HP)
+    parser.add_argument("--max-live", type=int, default=engine.MAX_LIVE)
+    parser.add_argument("--max-blank", type=int, default=engine.MAX_BLANK)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    rules = {'hp': args.hp, 'max_live': args.max_live, 'max_blank': args.max_blank}
+    rng = np.random.default_rng(args.seed)
+    player = Strategy(args.player, rules)
+    dealer = Strategy(args.dealer, rules)
+
+    start = time.perf_counter()
+    result = simulate(args.games, player, dealer, rules, rng)
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.player} player vs {args.dealer} dealer, {args.hp} HP, "
+          f"1-{args.max_live} live / 1-{args.max_blank} blank")
+    print(f"games           {result['games']:,} in {elapsed:.2f}s  ({args.games / elapsed:,.0f} games/s)")
+    if result['unfinished']:
+        print(f"unfinished      {result['unfinished']:,} (hit {MAX_STEPS} shots)")
+    print(f"player wins     {result['player_win_rate']:.2%}  "
+          f"(shooting first {result['player_win_rate_first']:.2%}, "
+          f"second {result['player_win_rate_second']:.2%})")
+    print(f"first mover     {result['first_mover_win_rate']:.2%} of games won by whoever shot first")
+    print(f"game length     mean {result['mean_shots']:.1f} shots, p50 {result['p50_shots']}, "
+          f"p99 {result['p99_shots']}")
+    print(f"reloads         {result['mean_reloads']:.2f} per game")
+
+
+if __name__ == "__main__":
+    main()